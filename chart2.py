@@ -5,27 +5,55 @@
 Comprehensive Analytics Dashboard - Islamic Azad University Markazi Province
 
 نحوه اجرا:
-pip install streamlit pandas matplotlib seaborn plotly numpy openpyxl
+pip install streamlit pandas plotly numpy openpyxl
 streamlit run app.py
+
+بنچمارک راه‌اندازی (زمان import هر ماژول و راه‌اندازی سرد اسکریپت):
+python chart2.py --startup-benchmark
 """
 
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import warnings
-from datetime import datetime, timedelta
+from datetime import datetime
 import base64
-from io import BytesIO
+import codecs
+import csv
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+import hashlib
+import importlib
+import json
+import logging
+import threading
+from io import BytesIO, StringIO
 import os
+import struct
+import subprocess
+import sys
+import time
+
+class _LazyModule:
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self._name), attr)
+
+# plotly فقط وقتی صفحه‌ای اولین نمودار را می‌سازد بارگذاری می‌شود، نه پیش از نخستین رندر
+px = _LazyModule('plotly.express')
+go = _LazyModule('plotly.graph_objects')
+
+def make_subplots(*args, **kwargs):
+    return importlib.import_module('plotly.subplots').make_subplots(*args, **kwargs)
 
 # تنظیمات اولیه
 warnings.filterwarnings('ignore')
-plt.style.use('default')
+logger = logging.getLogger(__name__)
 
 # تنظیمات صفحه Streamlit
 st.set_page_config(
@@ -42,8 +70,7 @@ st.set_page_config(
 )
 
 # CSS سفارشی برای بهبود ظاهر
-st.markdown("""
-<style>
+APP_CSS = """
 .main-header {
     background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
     padding: 2rem;
@@ -97,8 +124,132 @@ st.markdown("""
 body, .main-header, .metric-card, .insight-box, .warning-box, .recommendation-box, .stMarkdown {
     font-family: 'B Nazanin', Vazir, Tahoma, Arial, sans-serif;
 }
-</style>
-""", unsafe_allow_html=True)
+"""
+
+# لوگو یک بار در هر پردازه کدگذاری و در بلوک CSS جاسازی می‌شود؛ هدر فقط به کلاس آن اشاره می‌کند
+STATIC_DIR = os.path.abspath(os.path.dirname(__file__))
+LOGO_PATH = os.path.join(STATIC_DIR, 'Azad_University_logo.png')
+LOGO_CSS = """
+/* پس‌زمینه سفید کوچک با گوشه‌های گرد تا آرم روی گرادیان واضح دیده شود */
+.header-logo-frame {
+    display: inline-block;
+    background: #FFFFFF;
+    padding: 8px 10px;
+    border-radius: 10px;
+    box-shadow: 0 1px 3px rgba(0,0,0,0.15);
+    margin-bottom: 12px;
+}
+
+.header-logo {
+    display: block;
+    height: 96px;
+    width: {width}px;
+    background: url({uri}) center / contain no-repeat;
+}
+"""
+
+def _png_size(path):
+    """``(width, height)`` from a PNG header, or None."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(24)
+    except OSError:
+        return None
+    if head[:8] != b'\x89PNG\r\n\x1a\n' or len(head) < 24:
+        return None
+    return struct.unpack('>II', head[16:24])
+
+@st.cache_resource(show_spinner=False)
+def _static_data_uri(path, mime='image/png'):
+    """``data:`` URI of a static file, read and base64-encoded once per process ('' if missing)."""
+    try:
+        with open(path, 'rb') as f:
+            return f'data:{mime};base64,{base64.b64encode(f.read()).decode()}'
+    except OSError:
+        return ''
+
+@st.cache_resource(show_spinner=False)
+def _app_styles():
+    """The ``<style>`` block with the header logo embedded, built once per process.
+
+    Every rerun emits the same bytes, so Streamlit's message cache sends returning
+    clients a hash reference instead of the ~75 KB block.
+    """
+    css = APP_CSS
+    logo = _static_data_uri(LOGO_PATH)
+    if logo:
+        width, height = _png_size(LOGO_PATH) or (1, 1)
+        css += LOGO_CSS.replace('{width}', f'{96 * width / height:.1f}').replace('{uri}', logo)
+    return f'<style>{css}</style>'
+
+st.markdown(_app_styles(), unsafe_allow_html=True)
+
+def _lazy_section(label, key, render, *args, expanded=False):
+    """Run ``render(*args)`` inside an expander, but only while the expander is open.
+
+    The open/closed state is a keyed widget (``section_<key>``) mirrored into
+    ``st.session_state['open_sections']``, so it survives switching pages for the whole
+    session; a collapsed section does no data prep or figure construction at all.
+    """
+    widget_key = f'section_{key}'
+    opened = st.session_state.setdefault('open_sections', {})
+
+    def _remember():
+        opened[key] = bool(st.session_state[widget_key])
+
+    section = st.expander(label, expanded=opened.get(key, expanded), key=widget_key, on_change=_remember)
+    with section:
+        if section.open:
+            render(*args)
+
+def _page_setting(key, default=None):
+    """Sidebar setting ``key`` as read by the page view, recorded as a dependency of that view.
+
+    The settings panel compares these against the widgets' current values and reruns
+    the whole app only when the visible page actually read a setting that changed.
+    """
+    value = st.session_state.get(key, default)
+    st.session_state.setdefault('page_settings', {})[key] = value
+    return value
+
+# کش نمودارها: شکل‌های Plotly ساخته‌شده به ازای (نسخه داده، شناسه نمودار، پارامترها)
+FIGURE_CACHE_MAX_ENTRIES = 256
+FIGURE_CACHE_MAX_BYTES = 64 * 2**20  # بر حسب اندازه JSON شکل‌ها
+
+@st.cache_resource
+def _figure_cache():
+    """Process-wide LRU of built figures shared by all sessions."""
+    return {'entries': OrderedDict(), 'bytes': 0, 'lock': threading.Lock()}
+
+def _cached_figure(dataset, chart_id, build, *params):
+    """Figure ``chart_id`` for this dataset version, running ``build()`` (prep + Plotly) only on a miss.
+
+    Entries are keyed by ``(dataset.version, chart_id, params)`` and evicted least recently
+    used beyond ``FIGURE_CACHE_MAX_ENTRIES`` or ``FIGURE_CACHE_MAX_BYTES`` of figure JSON.
+    ``params`` must cover every setting the figure depends on (band thresholds, scatter
+    mode, unit, ...). The figure is shared — do not modify it after it is returned.
+    """
+    cache = _figure_cache()
+    key = (dataset.version, chart_id, params)
+    with cache['lock']:
+        entry = cache['entries'].get(key)
+        if entry is not None:
+            cache['entries'].move_to_end(key)
+            return entry[0]
+    fig = build()
+    size = len(fig.to_json())
+    if size > FIGURE_CACHE_MAX_BYTES:
+        return fig
+    with cache['lock']:
+        previous = cache['entries'].pop(key, None)
+        if previous is not None:
+            cache['bytes'] -= previous[1]
+        cache['entries'][key] = (fig, size)
+        cache['bytes'] += size
+        while len(cache['entries']) > FIGURE_CACHE_MAX_ENTRIES or cache['bytes'] > FIGURE_CACHE_MAX_BYTES:
+            _, (_, evicted) = cache['entries'].popitem(last=False)
+            cache['bytes'] -= evicted
+    return fig
 
 def _render_paragraph(title: str, text: str):
     """نمایش تحلیل به صورت متن پیوسته (نه بولت)، در یک جعبه توضیح."""
@@ -145,46 +296,38 @@ def load_sample_data():
     }
     
     # داده‌های خوشه‌ها (نمونه کوچک‌تر)
-    cluster_names = []
+    n_clusters = 1000
     degrees = ['کارشناسی پیوسته', 'کارشناسی ارشد', 'کارشناسی ناپیوسته', 'کاردانی پیوسته', 'دکتری تخصصی']
     fields = ['مهندسی عمران', 'مهندسی مکانیک', 'حسابداری', 'مدیریت', 'علوم تربیتی', 'زبان انگلیسی', 'روانشناسی']
     units = ['اراک', 'ساوه', 'خمین', 'نراق', 'آشتیان', 'جاسب']
     
-    for i in range(1000):
-        degree = np.random.choice(degrees, p=[0.45, 0.25, 0.15, 0.10, 0.05])
-        field = np.random.choice(fields)
-        unit = np.random.choice(units)
-        cluster_names.append(f"{degree}_{field}_{unit}_{4000+i}")
+    # ساخت برداری نام خوشه‌ها: مقطع_رشته_واحد_کد
+    cluster_names = (
+        pd.Series(np.random.choice(degrees, size=n_clusters, p=[0.45, 0.25, 0.15, 0.10, 0.05])) + '_'
+        + np.random.choice(fields, size=n_clusters) + '_'
+        + np.random.choice(units, size=n_clusters) + '_'
+        + pd.Series(np.arange(4000, 4000 + n_clusters)).astype(str)
+    )
     
-    clusters_data = {
+    clusters_df = pd.DataFrame({
         'نام_خوشه': cluster_names,
-        'تعداد_دانشجویان': np.random.randint(1, 50, 1000),
-        'کل_درخواست_ها': np.random.randint(0, 100, 1000),
-        'مقطع': [name.split('_')[0] for name in cluster_names],
-        'رشته': [name.split('_')[1] for name in cluster_names],
-        'واحد': [name.split('_')[2] for name in cluster_names]
-    }
+        'تعداد_دانشجویان': np.random.randint(1, 50, n_clusters),
+        'کل_درخواست_ها': np.random.randint(0, 100, n_clusters),
+    })
+    clusters_df = _derive_cluster_parts(clusters_df)
     
-    return pd.DataFrame(supporters_data), pd.DataFrame(units_data), pd.DataFrame(clusters_data)
+    return (
+        _compact_dtypes(pd.DataFrame(supporters_data))[0],
+        _compact_dtypes(pd.DataFrame(units_data))[0],
+        _compact_dtypes(clusters_df)[0],
+    )
 
 def create_main_header():
     """ایجاد هدر اصلی"""
-    # تلاش برای بارگذاری لوگوی سفارشی و نمایش آن بالای عنوان
-    logo_path = "Azad_University_logo.png"
+    # لوگو از بلوک CSS ثابت می‌آید (یک بار در هر پردازه کدگذاری شده)؛ اینجا فقط جای آن است
     logo_html = ""
-    try:
-        if os.path.exists(logo_path):
-            with open(logo_path, 'rb') as _f:
-                _b64 = base64.b64encode(_f.read()).decode()
-                # افزودن پس‌زمینه سفید کوچک با گوشه‌های گرد تا آرم روی گرادیان واضح دیده شود
-                logo_html = (
-                    '<span style="display:inline-block; background:#FFFFFF; padding:8px 10px; '
-                    'border-radius:10px; box-shadow:0 1px 3px rgba(0,0,0,0.15); margin-bottom:12px;">'
-                    f'<img src="data:image/png;base64,{_b64}" alt="logo" style="max-height:96px; display:block;" />'
-                    '</span>'
-                )
-    except Exception:
-        logo_html = ""
+    if _static_data_uri(LOGO_PATH):
+        logo_html = '<span class="header-logo-frame"><span class="header-logo" role="img" aria-label="logo"></span></span>'
 
     st.markdown(
         """
@@ -199,8 +342,9 @@ def create_main_header():
         unsafe_allow_html=True,
     )
 
-def display_key_metrics(supporters_df, units_df, clusters_df):
+def display_key_metrics(dataset):
     """نمایش شاخص‌های کلیدی"""
+    supporters_df, units_df = dataset.supporters, dataset.units
     st.markdown("## 📊 شاخص‌های کلیدی")
     
     col1, col2, col3, col4, col5, col6 = st.columns(6)
@@ -211,7 +355,7 @@ def display_key_metrics(supporters_df, units_df, clusters_df):
     total_students = units_df['تعداد_دانشجویان'].sum()
     total_requests = units_df['کل_درخواست_ها'].sum()
     completion_rate = (units_df['درخواست_بسته_شده'].sum() / total_requests * 100)
-    total_clusters = len(clusters_df)
+    total_clusters = dataset.clusters_agg['rows']
     
     with col1:
         st.metric(
@@ -255,8 +399,9 @@ def display_key_metrics(supporters_df, units_df, clusters_df):
             delta="مقاطع مختلف"
         )
 
-def create_supporters_analysis(supporters_df):
+def create_supporters_analysis(dataset):
     """تحلیل جامع حامیان"""
+    supporters_df = dataset.supporters
     st.markdown("## 👥 تحلیل جامع عملکرد حامیان")
     
     # تقسیم به دو ستون
@@ -265,26 +410,24 @@ def create_supporters_analysis(supporters_df):
     with col1:
         st.markdown("### 📊 توزیع حامیان بر اساس حجم کار")
         
-        # دسته‌بندی حامیان
-        def categorize_requests(count):
-            if count == 0: return 'غیرفعال (0)'
-            elif count <= 50: return 'کم‌کار (1-50)'
-            elif count <= 200: return 'متوسط (51-200)'
-            elif count <= 500: return 'پرکار (201-500)'
-            else: return 'بسیار پرکار (500+)'
-        
-        supporters_df['دسته_بندی'] = supporters_df['کل_درخواست_ها'].apply(categorize_requests)
-        category_counts = supporters_df['دسته_بندی'].value_counts()
+        # دسته‌بندی حامیان با موتور باندها (مرزها از سایدبار قابل تنظیم است)
+        workload_spec = _band_spec('supporter_workload')
+        inactive_label = _band_labels(workload_spec)[0]
+        category_counts = _band(supporters_df['کل_درخواست_ها'], workload_spec).value_counts()
+        category_counts = category_counts[category_counts > 0]
         
         # نمودار دایره‌ای
-        fig_pie = px.pie(
-            values=category_counts.values,
-            names=category_counts.index,
-            title="توزیع حامیان",
-            color_discrete_sequence=px.colors.qualitative.Set3
-        )
-        fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-        fig_pie.update_layout(font_family="Arial", showlegend=True)
+        def build_pie():
+            fig_pie = px.pie(
+                values=category_counts.values,
+                names=category_counts.index,
+                title="توزیع حامیان",
+                color_discrete_sequence=px.colors.qualitative.Set3
+            )
+            fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+            fig_pie.update_layout(font_family="Arial", showlegend=True)
+            return fig_pie
+        fig_pie = _cached_figure(dataset, 'supporters_workload_pie', build_pie, tuple(workload_spec['thresholds']))
         st.plotly_chart(fig_pie, use_container_width=True)
         _render_paragraph(
             "تحلیل توزیع حامیان بر اساس حجم کار",
@@ -304,33 +447,31 @@ def create_supporters_analysis(supporters_df):
         </ul>
         </div>
         """.format(
-            category_counts.get('غیرفعال (0)', 0),
-            (category_counts.get('غیرفعال (0)', 0) / len(supporters_df) * 100),
-            len(supporters_df) - category_counts.get('غیرفعال (0)', 0),
-            ((len(supporters_df) - category_counts.get('غیرفعال (0)', 0)) / len(supporters_df) * 100)
+            category_counts.get(inactive_label, 0),
+            (category_counts.get(inactive_label, 0) / len(supporters_df) * 100),
+            len(supporters_df) - category_counts.get(inactive_label, 0),
+            ((len(supporters_df) - category_counts.get(inactive_label, 0)) / len(supporters_df) * 100)
         ), unsafe_allow_html=True)
     
     with col2:
         st.markdown("### 🏆 حامیان برتر (تاپ 10)")
         
-        # ensure required numeric columns exist to avoid KeyError
-        for _col in ['کل_درخواست_ها', 'درخواست_بسته_شده', 'درخواست_رد_شده']:
-            if _col not in supporters_df.columns:
-                supporters_df[_col] = 0
-
-        top_supporters = supporters_df[supporters_df['کل_درخواست_ها'] > 0].nlargest(10, 'کل_درخواست_ها')
+        top_supporters = _dataset_top(dataset, 'supporters', 'کل_درخواست_ها', 10, positive=True)
         
         # نمودار ستونی افقی
-        fig_bar = px.bar(
-            top_supporters,
-            y='نام_نمایشی',
-            x='کل_درخواست_ها',
-            orientation='h',
-            title="10 حامی با بیشترین درخواست",
-            color='کل_درخواست_ها',
-            color_continuous_scale='viridis'
-        )
-        fig_bar.update_layout(yaxis={'categoryorder':'total ascending'})
+        def build_top():
+            fig_bar = px.bar(
+                top_supporters,
+                y='نام_نمایشی',
+                x='کل_درخواست_ها',
+                orientation='h',
+                title="10 حامی با بیشترین درخواست",
+                color='کل_درخواست_ها',
+                color_continuous_scale='viridis'
+            )
+            fig_bar.update_layout(yaxis={'categoryorder':'total ascending'})
+            return fig_bar
+        fig_bar = _cached_figure(dataset, 'supporters_top10', build_top)
         st.plotly_chart(fig_bar, use_container_width=True)
         _render_paragraph(
             "تحلیل ده حامی با بیشترین درخواست",
@@ -342,14 +483,8 @@ def create_supporters_analysis(supporters_df):
         # جدول عملکرد
         st.markdown("### 📋 جدول عملکرد حامیان برتر")
 
-        # محاسبه نرخ تکمیل (با محافظت در برابر تقسیم بر صفر)
-        top_supporters = top_supporters.copy()
-        safe_total = top_supporters['کل_درخواست_ها'].replace({0: np.nan})
-        top_supporters['نرخ_تکمیل'] = ((top_supporters.get('درخواست_بسته_شده', 0) / safe_total) * 100).round(1).fillna(0)
-        top_supporters['نرخ_رد'] = ((top_supporters.get('درخواست_رد_شده', 0) / safe_total) * 100).round(1).fillna(0)
-
         # نمایش جدول
-        display_df = top_supporters[['نام_نمایشی', 'کل_درخواست_ها', 'درخواست_بسته_شده', 'درخواست_رد_شده', 'نرخ_تکمیل', 'نرخ_رد']].copy()
+        display_df = top_supporters[['نام_نمایشی', 'کل_درخواست_ها', 'درخواست_بسته_شده', 'درخواست_رد_شده', 'نرخ_تکمیل', 'نرخ_رد']]
         display_df.columns = ['نام حامی', 'کل درخواست‌ها', 'بسته شده', 'رد شده', 'نرخ تکمیل (%)', 'نرخ رد (%)']
 
         st.dataframe(
@@ -370,26 +505,26 @@ def create_supporters_analysis(supporters_df):
     col3, col4 = st.columns(2)
     
     with col3:
-        # نمودار نرخ تکمیل
-        top_supporters['رنگ'] = top_supporters['نرخ_تکمیل'].apply(
-            lambda x: 'عالی (≥95%)' if x >= 95 else 'خوب (90-95%)' if x >= 90 else 'نیازمند بهبود (<90%)'
-        )
-        
-        fig_completion = px.bar(
-            top_supporters,
-            x=range(len(top_supporters)),
-            y='نرخ_تکمیل',
-            color='رنگ',
-            title="نرخ تکمیل حامیان برتر",
-            labels={'x': 'رتبه حامی', 'y': 'نرخ تکمیل (%)'},
-            color_discrete_map={
-                'عالی (≥95%)': '#27AE60',
-                'خوب (90-95%)': '#F39C12', 
-                'نیازمند بهبود (<90%)': '#E74C3C'
-            }
-        )
-        fig_completion.add_hline(y=95, line_dash="dash", line_color="green", annotation_text="هدف: 95%")
-        fig_completion.add_hline(y=90, line_dash="dash", line_color="orange", annotation_text="حداقل: 90%")
+        # نمودار نرخ تکمیل (top_supporters برش محلی است؛ افزودن ستون به داده مشترک نمی‌رسد)
+        completion_spec = _band_spec('completion')
+
+        def build_completion():
+            banded = top_supporters.assign(رنگ=_band(top_supporters['نرخ_تکمیل'], completion_spec))
+            minimum_rate, target_rate = completion_spec['thresholds'][0], completion_spec['thresholds'][-1]
+            fig_completion = px.bar(
+                banded,
+                x=range(len(banded)),
+                y='نرخ_تکمیل',
+                color='رنگ',
+                title="نرخ تکمیل حامیان برتر",
+                labels={'x': 'رتبه حامی', 'y': 'نرخ تکمیل (%)'},
+                color_discrete_map=dict(zip(_band_labels(completion_spec), completion_spec['colors']))
+            )
+            fig_completion.add_hline(y=target_rate, line_dash="dash", line_color="green", annotation_text=f"هدف: {target_rate:g}%")
+            fig_completion.add_hline(y=minimum_rate, line_dash="dash", line_color="orange", annotation_text=f"حداقل: {minimum_rate:g}%")
+            return fig_completion
+        fig_completion = _cached_figure(dataset, 'supporters_completion', build_completion,
+                                        tuple(completion_spec['thresholds']))
         st.plotly_chart(fig_completion, use_container_width=True)
         _render_paragraph(
             "تحلیل نرخ تکمیل حامیان برتر",
@@ -400,21 +535,22 @@ def create_supporters_analysis(supporters_df):
     
     with col4:
         # نمودار پراکندگی
-        active_supporters = supporters_df[supporters_df['کل_درخواست_ها'] > 0].copy()
-        active_supporters['نرخ_تکمیل'] = (active_supporters['درخواست_بسته_شده'] / active_supporters['کل_درخواست_ها'] * 100)
-        
-        fig_scatter = px.scatter(
-            active_supporters,
-            x='کل_درخواست_ها',
-            y='نرخ_تکمیل',
-            size='خوشه_ها',
-            color='نرخ_تکمیل',
-            title="پراکندگی عملکرد حامیان",
-            labels={'x': 'تعداد درخواست‌ها', 'y': 'نرخ تکمیل (%)'},
-            color_continuous_scale='RdYlGn'
-        )
-        fig_scatter.add_hline(y=90, line_dash="dash", line_color="orange")
-        fig_scatter.add_hline(y=95, line_dash="dash", line_color="green")
+        def build_scatter():
+            active_supporters = supporters_df[supporters_df['کل_درخواست_ها'] > 0]
+            fig_scatter = _reduced_scatter(
+                active_supporters,
+                'کل_درخواست_ها',
+                'نرخ_تکمیل',
+                size='خوشه_ها',
+                color='نرخ_تکمیل',
+                title="پراکندگی عملکرد حامیان",
+                labels={'x': 'تعداد درخواست‌ها', 'y': 'نرخ تکمیل (%)'},
+                color_continuous_scale='RdYlGn'
+            )
+            fig_scatter.add_hline(y=90, line_dash="dash", line_color="orange")
+            fig_scatter.add_hline(y=95, line_dash="dash", line_color="green")
+            return fig_scatter
+        fig_scatter = _cached_figure(dataset, 'supporters_scatter', build_scatter, _page_setting('scatter_mode', SCATTER_DEFAULT_MODE))
         st.plotly_chart(fig_scatter, use_container_width=True)
         _render_paragraph(
             "تحلیل پراکندگی عملکرد حامیان",
@@ -423,39 +559,92 @@ def create_supporters_analysis(supporters_df):
             """
         )
 
-def create_units_analysis(units_df):
+def create_units_analysis(dataset):
     """تحلیل جامع واحدها"""
     st.markdown("## 🏛️ تحلیل جامع واحدهای دانشگاهی")
     
-    # محاسبه و ایمن‌سازی شاخص‌ها
-    if 'نام_واحد' not in units_df.columns:
-        # در صورت نبود نام واحد، از اولین ستون متنی یا ایندکس استفاده می‌کنیم
-        text_cols = [c for c in units_df.columns if units_df[c].dtype == 'object']
-        units_df['نام_واحد'] = units_df[text_cols[0]] if text_cols else units_df.index.astype(str)
-    units_df['نام_کوتاه'] = units_df['نام_واحد'].astype(str).str.split('-').str[0]
-    units_df['نسبت_درخواست_دانشجو'] = (units_df['کل_درخواست_ها'] / units_df['تعداد_دانشجویان']).replace([np.inf, -np.inf], np.nan).fillna(0).round(2)
-    units_df['نرخ_تکمیل'] = (units_df['درخواست_بسته_شده'] / units_df['کل_درخواست_ها'].replace({0: np.nan}) * 100).round(1).fillna(0)
-    units_df['نرخ_رد'] = (units_df['درخواست_رد_شده'] / units_df['کل_درخواست_ها'].replace({0: np.nan}) * 100).round(1).fillna(0)
-    
-    # مقایسه کلی واحدها
-    st.markdown("### 📊 مقایسه کلی واحدهای استان مرکزی")
+    # شاخص‌های مشتق (نام کوتاه، نسبت درخواست/دانشجو، نرخ تکمیل و رد) یک بار در مجموعه داده ساخته شده‌اند
+    units_df = dataset.units
+    
+    # هر بخش فقط وقتی باز است داده و نمودارهایش را می‌سازد؛ وضعیت باز/بسته در نشست کاربر می‌ماند
+    _lazy_section("📊 مقایسه کلی واحدهای استان مرکزی", 'units_comparison', _units_comparison_section, dataset, expanded=True)
+    _lazy_section("🎯 تحلیل عملکرد و کیفیت خدمات", 'units_performance', _units_performance_section, dataset)
+    _lazy_section("📋 جدول جامع عملکرد واحدهای استان مرکزی", 'units_table', _units_table_section, dataset)
+    
+    # بینش‌ها و تحلیل‌های آماری (محافظت‌شده)
+    if 'نرخ_تکمیل' in units_df.columns and not units_df['نرخ_تکمیل'].dropna().empty:
+        try:
+            best_idx = units_df['نرخ_تکمیل'].idxmax()
+            worst_idx = units_df['نرخ_تکمیل'].idxmin()
+            best_unit = units_df.loc[best_idx]
+            worst_unit = units_df.loc[worst_idx]
+        except Exception:
+            best_unit = units_df.iloc[0] if len(units_df) > 0 else pd.Series()
+            worst_unit = best_unit
+    else:
+        best_unit = units_df.iloc[0] if len(units_df) > 0 else pd.Series()
+        worst_unit = best_unit
+
+    # امن‌سازی سایر مقادیر نمایشی
+    best_name = best_unit.get('نام_کوتاه', '') if hasattr(best_unit, 'get') else ''
+    best_rate = best_unit.get('نرخ_تکمیل', 0) if hasattr(best_unit, 'get') else 0
+
+    largest_count = 0
+    if len(units_df) > 0 and 'تعداد_دانشجویان' in units_df.columns:
+        try:
+            largest_count = int(units_df.iloc[0]['تعداد_دانشجویان'])
+        except Exception:
+            largest_count = 0
+
+    if 'کل_درخواست_ها' in units_df.columns and not units_df['کل_درخواست_ها'].dropna().empty:
+        try:
+            top_idx = units_df['کل_درخواست_ها'].idxmax()
+            top_name = units_df.loc[top_idx, 'نام_کوتاه'] if 'نام_کوتاه' in units_df.columns else ''
+            top_max = int(units_df['کل_درخواست_ها'].max())
+        except Exception:
+            top_name = ''
+            top_max = 0
+    else:
+        top_name = ''
+        top_max = 0
+
+    province_mean = units_df['نرخ_تکمیل'].mean() if 'نرخ_تکمیل' in units_df.columns else 0
+
+    st.markdown(f"""
+    <div class="insight-box">
+    <h4>🎯 بینش‌های کلیدی عملکرد واحدها:</h4>
+    <ul>
+    <li><strong>بهترین عملکرد:</strong> {best_name} با {best_rate:.1f}% نرخ تکمیل</li>
+    <li><strong>بزرگترین واحد:</strong> اراک با {largest_count:,} دانشجو</li>
+    <li><strong>پرترافیک‌ترین:</strong> {top_name} با {top_max:,} درخواست</li>
+    <li><strong>میانگین عملکرد:</strong> {province_mean:.1f}% در سطح استان</li>
+    </ul>
+    </div>
+    """, unsafe_allow_html=True)
+
+def _units_comparison_section(dataset):
+    """مقایسه کلی واحدها (سه نمودار میله‌ای مرتب‌شده)"""
+    units_df = dataset.units
     # نمایش فقط نمودارهای ستونی پایدار
     chart_type = 'میله‌ای'
 
     if chart_type == 'میله‌ای':
         # قرار‌دادن سه نمودار میله‌ای بزرگ و جداگانه به صورت عمودی و پهنای کامل
         # 1) نسبت درخواست به دانشجو
-        ratio_df = units_df.sort_values('نسبت_درخواست_دانشجو', ascending=False).copy()
-        fig_ratio_long = px.bar(
-            ratio_df,
-            x='نام_کوتاه',
-            y='نسبت_درخواست_دانشجو',
-            title='نسبت درخواست به دانشجو (واحدها)',
-            labels={'نام_کوتاه':'واحد','نسبت_درخواست_دانشجو':'نسبت درخواست/دانشجو'},
-            color='نسبت_درخواست_دانشجو',
-            color_continuous_scale='plasma'
-        )
-        fig_ratio_long.update_layout(height=420, xaxis_tickangle=45)
+        def build_ratio():
+            ratio_df = _dataset_order(dataset, 'units', 'نسبت_درخواست_دانشجو')
+            fig_ratio_long = px.bar(
+                ratio_df,
+                x='نام_کوتاه',
+                y='نسبت_درخواست_دانشجو',
+                title='نسبت درخواست به دانشجو (واحدها)',
+                labels={'نام_کوتاه':'واحد','نسبت_درخواست_دانشجو':'نسبت درخواست/دانشجو'},
+                color='نسبت_درخواست_دانشجو',
+                color_continuous_scale='plasma'
+            )
+            fig_ratio_long.update_layout(height=420, xaxis_tickangle=45)
+            return fig_ratio_long
+        fig_ratio_long = _cached_figure(dataset, 'units_ratio', build_ratio)
         st.plotly_chart(fig_ratio_long, use_container_width=True)
         _render_paragraph(
             "تحلیل نسبت درخواست به دانشجو (واحدها)",
@@ -465,17 +654,20 @@ def create_units_analysis(units_df):
         )
 
         # 2) کل درخواست‌ها
-        req_df = units_df.sort_values('کل_درخواست_ها', ascending=False).copy()
-        fig_reqs = px.bar(
-            req_df,
-            x='نام_کوتاه',
-            y='کل_درخواست_ها',
-            title='کل درخواست‌ها به تفکیک واحد',
-            labels={'نام_کوتاه':'واحد','کل_درخواست_ها':'تعداد درخواست‌ها'},
-            color='کل_درخواست_ها',
-            color_continuous_scale='reds'
-        )
-        fig_reqs.update_layout(height=420, xaxis_tickangle=45)
+        def build_requests():
+            req_df = _dataset_order(dataset, 'units', 'کل_درخواست_ها')
+            fig_reqs = px.bar(
+                req_df,
+                x='نام_کوتاه',
+                y='کل_درخواست_ها',
+                title='کل درخواست‌ها به تفکیک واحد',
+                labels={'نام_کوتاه':'واحد','کل_درخواست_ها':'تعداد درخواست‌ها'},
+                color='کل_درخواست_ها',
+                color_continuous_scale='reds'
+            )
+            fig_reqs.update_layout(height=420, xaxis_tickangle=45)
+            return fig_reqs
+        fig_reqs = _cached_figure(dataset, 'units_requests', build_requests)
         st.plotly_chart(fig_reqs, use_container_width=True)
         _render_paragraph(
             "تحلیل کل درخواست‌ها به تفکیک واحد",
@@ -485,17 +677,20 @@ def create_units_analysis(units_df):
         )
 
         # 3) تعداد دانشجویان
-        stu_df = units_df.sort_values('تعداد_دانشجویان', ascending=False).copy()
-        fig_students = px.bar(
-            stu_df,
-            x='نام_کوتاه',
-            y='تعداد_دانشجویان',
-            title='تعداد دانشجویان در واحدها',
-            labels={'نام_کوتاه':'واحد','تعداد_دانشجویان':'تعداد دانشجویان'},
-            color='تعداد_دانشجویان',
-            color_continuous_scale='blues'
-        )
-        fig_students.update_layout(height=420, xaxis_tickangle=45)
+        def build_students():
+            stu_df = _dataset_order(dataset, 'units', 'تعداد_دانشجویان')
+            fig_students = px.bar(
+                stu_df,
+                x='نام_کوتاه',
+                y='تعداد_دانشجویان',
+                title='تعداد دانشجویان در واحدها',
+                labels={'نام_کوتاه':'واحد','تعداد_دانشجویان':'تعداد دانشجویان'},
+                color='تعداد_دانشجویان',
+                color_continuous_scale='blues'
+            )
+            fig_students.update_layout(height=420, xaxis_tickangle=45)
+            return fig_students
+        fig_students = _cached_figure(dataset, 'units_students', build_students)
         st.plotly_chart(fig_students, use_container_width=True)
         _render_paragraph(
             "تحلیل تعداد دانشجویان در واحدها",
@@ -510,8 +705,7 @@ def create_units_analysis(units_df):
         # نسبت: دسته‌بندی واحدها به سه گروه و نمایش سهم هر گروه
         bins = [0, 0.2, 0.5, units_df['نسبت_درخواست_دانشجو'].max() + 1]
         labels = ['کم (≤0.2)','متوسط (0.21-0.5)','بیشتر (>0.5)']
-        tmp = units_df.copy()
-        tmp['ratio_bin'] = pd.cut(tmp['نسبت_درخواست_دانشجو'].fillna(0), bins=bins, labels=labels, include_lowest=True)
+        tmp = units_df.assign(ratio_bin=pd.cut(units_df['نسبت_درخواست_دانشجو'].fillna(0), bins=bins, labels=labels, include_lowest=True))
         pie1 = tmp['ratio_bin'].value_counts()
         fig_p1 = px.pie(values=pie1.values, names=pie1.index, title='توزیع نسبت درخواست/دانشجو')
         fig_p1.update_traces(textposition='inside', textinfo='percent+label')
@@ -525,7 +719,7 @@ def create_units_analysis(units_df):
         )
 
         # کل درخواست‌ها: نمایش top-N واحدها و 'سایر'
-        s = units_df[['نام_کوتاه','کل_درخواست_ها']].copy().groupby('نام_کوتاه').sum()
+        s = units_df[['نام_کوتاه','کل_درخواست_ها']].groupby('نام_کوتاه').sum()
         s = s.sort_values('کل_درخواست_ها', ascending=False)
         top = s.head(TOP_N).reset_index()
         other = s['کل_درخواست_ها'][TOP_N:].sum()
@@ -542,7 +736,7 @@ def create_units_analysis(units_df):
         )
 
         # تعداد دانشجویان: top-N
-        s2 = units_df[['نام_کوتاه','تعداد_دانشجویان']].copy().groupby('نام_کوتاه').sum()
+        s2 = units_df[['نام_کوتاه','تعداد_دانشجویان']].groupby('نام_کوتاه').sum()
         s2 = s2.sort_values('تعداد_دانشجویان', ascending=False)
         top2 = s2.head(TOP_N).reset_index()
         other2 = s2['تعداد_دانشجویان'][TOP_N:].sum()
@@ -557,25 +751,22 @@ def create_units_analysis(units_df):
 این نمودار توزیع دانشجویان را میان واحدهای عمده نمایش می‌دهد و برای برنامه‌ریزی ظرفیت، زمان‌بندی خدمات و طراحی تجربه کاربری اهمیت دارد. تمرکز بالا در چند واحد بزرگ طبیعی است اما باید با کیفیت خدمات هم‌تراز شود. واحدهای کوچک‌تر می‌توانند با برنامه‌های ارتباطی و خدمات دیجیتال هدفمند، تجربه بهتری ارائه دهند و بخشی از بار مراجعات را از کانال‌های حضوری به کانال‌های آنلاین منتقل کنند.
             """
         )
-    # تحلیل عملکرد واحدها
-    st.markdown("### 🎯 تحلیل عملکرد و کیفیت خدمات")
-    
+
+def _units_performance_section(dataset):
+    """نرخ تکمیل واحدها و توزیع متغیرهای کلیدی"""
     col3, col4 = st.columns(2)
     
-    with col3:
-        # نمودار نرخ تکمیل
-        units_df['رنگ_عملکرد'] = units_df['نرخ_تکمیل'].apply(
-            lambda x: 'عالی' if x >= 95 else 'خوب' if x >= 90 else 'ضعیف'
-        )
-        
     # نمودار میله‌ای نرخ تکمیل (مرتب‌شده)
-    comp_df = units_df.copy().sort_values('نرخ_تکمیل', ascending=False)
-    fig_completion = px.bar(comp_df, x='نام_کوتاه', y='نرخ_تکمیل',
-                color='نرخ_تکمیل', color_continuous_scale='RdYlGn',
-                title='نرخ تکمیل در واحدها (مرتب‌شده)')
-    fig_completion.update_layout(xaxis_tickangle=45, yaxis_title='نرخ تکمیل (%)')
-    fig_completion.add_hline(y=95, line_dash='dash', line_color='green')
-    fig_completion.add_hline(y=90, line_dash='dash', line_color='orange')
+    def build_completion():
+        comp_df = _dataset_order(dataset, 'units', 'نرخ_تکمیل')
+        fig_completion = px.bar(comp_df, x='نام_کوتاه', y='نرخ_تکمیل',
+                    color='نرخ_تکمیل', color_continuous_scale='RdYlGn',
+                    title='نرخ تکمیل در واحدها (مرتب‌شده)')
+        fig_completion.update_layout(xaxis_tickangle=45, yaxis_title='نرخ تکمیل (%)')
+        fig_completion.add_hline(y=95, line_dash='dash', line_color='green')
+        fig_completion.add_hline(y=90, line_dash='dash', line_color='orange')
+        return fig_completion
+    fig_completion = _cached_figure(dataset, 'units_completion', build_completion)
     st.plotly_chart(fig_completion, use_container_width=True)
     _render_paragraph(
         "تحلیل نرخ تکمیل واحدها",
@@ -586,19 +777,14 @@ def create_units_analysis(units_df):
     
     with col4:
         # توزیع متغیرها — هیستوگرام‌ها: تعداد دانشجویان، کل درخواست‌ها، نسبت درخواست/دانشجو
-        dist_df = units_df[['تعداد_دانشجویان','کل_درخواست_ها','نسبت_درخواست_دانشجو']].copy()
-        # make 3 small histograms side-by-side
-        from plotly.subplots import make_subplots
-        fig_dist = make_subplots(rows=1, cols=3, subplot_titles=['تعداد دانشجویان','کل درخواست‌ها','نسبت درخواست/دانشجو'])
-        for i, coln in enumerate(dist_df.columns):
-            vals = dist_df[coln].replace([np.inf, -np.inf], np.nan).dropna()
-            if vals.empty:
-                # اگر داده معتبری وجود ندارد، یک سطر صفر نمایش دهیم تا خطا رخ ندهد
-                fig_dist.add_trace(go.Bar(x=[0], y=[0], name=coln), row=1, col=i+1)
-            else:
-                hist = np.histogram(vals, bins=20)
-                fig_dist.add_trace(go.Bar(x=hist[1][:-1], y=hist[0], name=coln), row=1, col=i+1)
-        fig_dist.update_layout(height=320, showlegend=False, title_text='توزیع متغیرهای کلیدی واحدها')
+        # make 3 small histograms side-by-side (بازه‌بندی یک بار برای هر نسخه داده کش می‌شود)
+        def build_distributions():
+            fig_dist = make_subplots(rows=1, cols=3, subplot_titles=['تعداد دانشجویان','کل درخواست‌ها','نسبت درخواست/دانشجو'])
+            for i, coln in enumerate(['تعداد_دانشجویان','کل_درخواست_ها','نسبت_درخواست_دانشجو']):
+                fig_dist.add_trace(_histogram_bar(_dataset_histogram(dataset, 'units', coln), coln), row=1, col=i+1)
+            fig_dist.update_layout(height=320, showlegend=False, title_text='توزیع متغیرهای کلیدی واحدها')
+            return fig_dist
+        fig_dist = _cached_figure(dataset, 'units_distributions', build_distributions)
         st.plotly_chart(fig_dist, use_container_width=True)
         _render_paragraph(
             "تحلیل توزیع متغیرهای کلیدی واحدها",
@@ -606,9 +792,10 @@ def create_units_analysis(units_df):
 هیستوگرام‌های سه‌گانه شکل توزیع تعداد دانشجویان، کل درخواست‌ها و نسبت درخواست/دانشجو را نمایش می‌دهند و وجود چولگی یا دم بلند را آشکار می‌کنند. این اطلاعات برای تعریف آستانه‌های هشدار، تشخیص نقاط پرت و طراحی مداخلات هدفمند ضروری است. پایش تغییر شکل توزیع‌ها پس از اقدامات اصلاحی، اثربخشی سیاست‌ها را نشان می‌دهد. ترکیب این تحلیل با شاخص‌های کیفیت و زمان پاسخ، بهینه‌سازی ظرفیت را تسهیل می‌کند.
             """
         )
-    
-    # جدول جامع عملکرد واحدها
-    st.markdown("### 📋 جدول جامع عملکرد واحدهای استان مرکزی")
+
+def _units_table_section(dataset):
+    """جدول جامع عملکرد واحدها با ردیف مجموع"""
+    units_df = dataset.units
     
     # آماده‌سازی داده‌ها برای نمایش
     display_units = units_df[[
@@ -660,97 +847,13 @@ def create_units_analysis(units_df):
 این جدول تصویری یکپارچه از وضعیت واحدها ارائه می‌دهد و با افزودن ردیف «مجموع کل»، معیار مقایسه‌ای روشن فراهم می‌کند. نرخ تکمیل و نرخ رد، شاخص‌های اصلی کیفیت‌اند و در کنار نسبت درخواست/دانشجو، شدت و کارایی پاسخ‌گویی را می‌سنجند. بر اساس این جدول می‌توان واحدهای نیازمند مداخله را شناسایی، برنامه‌های آموزشی را هدفمند و تخصیص منابع را بهینه کرد. گزارش‌گیری دوره‌ای از این جدول، پیگیری اثربخشی اقدامات را امکان‌پذیر می‌سازد.
         """
     )
-    
-    # بینش‌ها و تحلیل‌های آماری (محافظت‌شده)
-    if 'نرخ_تکمیل' in units_df.columns and not units_df['نرخ_تکمیل'].dropna().empty:
-        try:
-            best_idx = units_df['نرخ_تکمیل'].idxmax()
-            worst_idx = units_df['نرخ_تکمیل'].idxmin()
-            best_unit = units_df.loc[best_idx]
-            worst_unit = units_df.loc[worst_idx]
-        except Exception:
-            best_unit = units_df.iloc[0] if len(units_df) > 0 else pd.Series()
-            worst_unit = best_unit
-    else:
-        best_unit = units_df.iloc[0] if len(units_df) > 0 else pd.Series()
-        worst_unit = best_unit
-
-    # امن‌سازی سایر مقادیر نمایشی
-    best_name = best_unit.get('نام_کوتاه', '') if hasattr(best_unit, 'get') else ''
-    best_rate = best_unit.get('نرخ_تکمیل', 0) if hasattr(best_unit, 'get') else 0
-
-    largest_count = 0
-    if len(units_df) > 0 and 'تعداد_دانشجویان' in units_df.columns:
-        try:
-            largest_count = int(units_df.iloc[0]['تعداد_دانشجویان'])
-        except Exception:
-            largest_count = 0
-
-    if 'کل_درخواست_ها' in units_df.columns and not units_df['کل_درخواست_ها'].dropna().empty:
-        try:
-            top_idx = units_df['کل_درخواست_ها'].idxmax()
-            top_name = units_df.loc[top_idx, 'نام_کوتاه'] if 'نام_کوتاه' in units_df.columns else ''
-            top_max = int(units_df['کل_درخواست_ها'].max())
-        except Exception:
-            top_name = ''
-            top_max = 0
-    else:
-        top_name = ''
-        top_max = 0
 
-    province_mean = units_df['نرخ_تکمیل'].mean() if 'نرخ_تکمیل' in units_df.columns else 0
-
-    st.markdown(f"""
-    <div class="insight-box">
-    <h4>🎯 بینش‌های کلیدی عملکرد واحدها:</h4>
-    <ul>
-    <li><strong>بهترین عملکرد:</strong> {best_name} با {best_rate:.1f}% نرخ تکمیل</li>
-    <li><strong>بزرگترین واحد:</strong> اراک با {largest_count:,} دانشجو</li>
-    <li><strong>پرترافیک‌ترین:</strong> {top_name} با {top_max:,} درخواست</li>
-    <li><strong>میانگین عملکرد:</strong> {province_mean:.1f}% در سطح استان</li>
-    </ul>
-    </div>
-    """, unsafe_allow_html=True)
-
-def create_clusters_analysis(clusters_df):
-    """تحلیل جامع خوشه‌های تحصیلی"""
+def create_clusters_analysis(dataset):
+    """تحلیل جامع خوشه‌های تحصیلی (از روی تجمیع‌های خوشه‌ها، نه سطرهای خام)"""
     st.markdown("## 🎯 تحلیل خوشه‌های تحصیلی")
-    # محافظت و نرمال‌سازی ستون‌ها: پیدا کردن نام‌های متغیر و تبدیل به اعداد
-    def _find_and_coerce(df, canonical, tokens_any=None, tokens_all=None):
-        # tokens_any: any of these tokens in column name matches
-        # tokens_all: all of these tokens must be in column name to match
-        if df is None:
-            return df
-        if canonical in df.columns:
-            # coerce numeric
-            try:
-                df[canonical] = pd.to_numeric(df[canonical], errors='coerce').fillna(0)
-            except Exception:
-                df[canonical] = df[canonical].apply(lambda x: pd.to_numeric(str(x).replace(',',''), errors='coerce')).fillna(0)
-            return df
-        cols = list(df.columns)
-        for c in cols:
-            low = str(c).replace('_','').replace(' ','').lower()
-            matched = False
-            if tokens_all:
-                if all(t in low for t in tokens_all):
-                    matched = True
-            if not matched and tokens_any:
-                if any(t in low for t in tokens_any):
-                    matched = True
-            if matched:
-                try:
-                    df[canonical] = pd.to_numeric(df[c].astype(str).str.replace(',',''), errors='coerce').fillna(0)
-                except Exception:
-                    df[canonical] = pd.to_numeric(df[c], errors='coerce').fillna(0)
-                return df
-        # not found: create default
-        df[canonical] = 0
-        return df
-
-    clusters_df = clusters_df.copy()
-    clusters_df = _find_and_coerce(clusters_df, 'کل_درخواست_ها', tokens_any=['درخواست','request','total','کل'], tokens_all=['کل','درخواست'])
-    clusters_df = _find_and_coerce(clusters_df, 'تعداد_دانشجویان', tokens_any=['دانشجو','student','تعداد'], tokens_all=['تعداد','دانشجو'])
+    clusters_agg = dataset.clusters_agg
+    if dataset.streaming:
+        st.info(f"🌊 حالت جریانی: نمودارها از تجمیع {clusters_agg['rows']:,} خوشه ساخته شده‌اند و سطرهای خام در حافظه نگه داشته نمی‌شوند.")
 
     col1, col2 = st.columns(2)
     
@@ -758,15 +861,19 @@ def create_clusters_analysis(clusters_df):
         st.markdown("### 📊 توزیع بر اساس مقطع تحصیلی")
         
         # توزیع مقاطع
-        degree_counts = clusters_df['مقطع'].value_counts()
+        by_degree = _cube_rollup(clusters_agg['cube'], ['مقطع'])
+        degree_counts = by_degree['count'].sort_values(ascending=False)
         
-        fig_degrees = px.pie(
-            values=degree_counts.values,
-            names=degree_counts.index,
-            title="توزیع خوشه‌ها بر اساس مقطع",
-            color_discrete_sequence=px.colors.qualitative.Pastel
-        )
-        fig_degrees.update_traces(textposition='inside', textinfo='percent+label')
+        def build_degrees():
+            fig_degrees = px.pie(
+                values=degree_counts.values,
+                names=degree_counts.index,
+                title="توزیع خوشه‌ها بر اساس مقطع",
+                color_discrete_sequence=px.colors.qualitative.Pastel
+            )
+            fig_degrees.update_traces(textposition='inside', textinfo='percent+label')
+            return fig_degrees
+        fig_degrees = _cached_figure(dataset, 'clusters_degrees', build_degrees)
         st.plotly_chart(fig_degrees, use_container_width=True)
         _render_paragraph(
             "تحلیل توزیع خوشه‌ها بر اساس مقطع",
@@ -777,12 +884,17 @@ def create_clusters_analysis(clusters_df):
         
         # آمار تفصیلی مقاطع
         st.markdown("#### 📈 آمار تفصیلی مقاطع:")
-        degree_stats = clusters_df.groupby('مقطع').agg({
-            'تعداد_دانشجویان': ['count', 'sum', 'mean'],
-            'کل_درخواست_ها': 'sum'
+        students_q = _sketch_quantiles(clusters_agg['students_sketch'], ['مقطع'])
+        requests_q = _sketch_quantiles(clusters_agg['requests_sketch'], ['مقطع'])
+        degree_stats = pd.DataFrame({
+            'تعداد خوشه': by_degree['count'],
+            'کل دانشجویان': by_degree['students_sum'],
+            'میانگین دانشجو/خوشه': by_degree['students_mean'],
+            'میانه دانشجو/خوشه': students_q[0.5],
+            'کل درخواست‌ها': by_degree['requests_sum'],
+            'میانه درخواست': requests_q[0.5],
+            'صدک ۹۰ درخواست': requests_q[0.9],
         }).round(1)
-        
-        degree_stats.columns = ['تعداد خوشه', 'کل دانشجویان', 'میانگین دانشجو/خوشه', 'کل درخواست‌ها']
         st.dataframe(degree_stats, use_container_width=True)
         _render_paragraph(
             "تحلیل آمار تفصیلی مقاطع",
@@ -795,17 +907,19 @@ def create_clusters_analysis(clusters_df):
         st.markdown("### 📚 رشته‌های پرطرفدار")
         
         # 10 رشته برتر
-        top_fields = clusters_df['رشته'].value_counts().head(10)
-        
-        fig_fields = px.bar(
-            x=top_fields.values,
-            y=top_fields.index,
-            orientation='h',
-            title="10 رشته با بیشترین خوشه",
-            color=top_fields.values,
-            color_continuous_scale='viridis'
-        )
-        fig_fields.update_layout(yaxis={'categoryorder':'total ascending'})
+        def build_fields():
+            top_fields = _cube_rollup(clusters_agg['cube'], ['رشته'])['count'].nlargest(10)
+            fig_fields = px.bar(
+                x=top_fields.values,
+                y=top_fields.index,
+                orientation='h',
+                title="10 رشته با بیشترین خوشه",
+                color=top_fields.values,
+                color_continuous_scale='viridis'
+            )
+            fig_fields.update_layout(yaxis={'categoryorder':'total ascending'})
+            return fig_fields
+        fig_fields = _cached_figure(dataset, 'clusters_fields', build_fields)
         st.plotly_chart(fig_fields, use_container_width=True)
         _render_paragraph(
             "تحلیل ده رشته با بیشترین خوشه",
@@ -817,24 +931,33 @@ def create_clusters_analysis(clusters_df):
         # توزیع اندازه خوشه‌ها
         st.markdown("#### 👥 توزیع اندازه خوشه‌ها:")
         
-        def categorize_cluster_size(students):
-            if students == 0: return 'خالی (0)'
-            elif students <= 10: return 'کوچک (1-10)'
-            elif students <= 30: return 'متوسط (11-30)'  
-            elif students <= 50: return 'بزرگ (31-50)'
-            else: return 'بسیار بزرگ (50+)'
-        
-        clusters_df['اندازه_دسته'] = clusters_df['تعداد_دانشجویان'].apply(categorize_cluster_size)
-        size_counts = clusters_df['اندازه_دسته'].value_counts()
-        
-        fig_sizes = px.bar(
-            x=size_counts.index,
-            y=size_counts.values,
-            title="توزیع اندازه خوشه‌ها",
-            color=size_counts.values,
-            color_continuous_scale='blues'
-        )
+        # باندبندی روی هیستوگرام مقادیر یکتا، تا تغییر مرزها در سایدبار بدون اسکن سطرها اعمال شود
+        size_spec = _band_spec('cluster_size')
+
+        def build_sizes():
+            size_counts = _band_counts(clusters_agg['students_hist'], size_spec)
+            size_counts = size_counts[size_counts > 0].sort_values(ascending=False)
+            return px.bar(
+                x=size_counts.index,
+                y=size_counts.values,
+                title="توزیع اندازه خوشه‌ها",
+                color=size_counts.values,
+                color_continuous_scale='blues'
+            )
+        fig_sizes = _cached_figure(dataset, 'clusters_sizes', build_sizes, tuple(size_spec['thresholds']))
         st.plotly_chart(fig_sizes, use_container_width=True)
+
+        # توزیع درخواست‌ها از هیستوگرام ادغام‌شده تکه‌ها (در حالت جریانی هم همه سطرها را پوشش می‌دهد)
+        requests_dist = clusters_agg['requests_dist']
+
+        def build_requests_dist():
+            fig = go.Figure(_histogram_bar(requests_dist, 'کل_درخواست_ها'))
+            fig.update_layout(title="توزیع درخواست‌ها در خوشه‌ها (مقیاس لگاریتمی)",
+                              xaxis_title='تعداد درخواست‌ها', yaxis_title='تعداد خوشه')
+            return fig
+        st.plotly_chart(_cached_figure(dataset, 'clusters_requests_dist', build_requests_dist), use_container_width=True)
+        if requests_dist['above']:
+            st.caption(f"{requests_dist['above']:,} خوشه بیش از {CLUSTER_REQUESTS_HIST_MAX:,} درخواست دارند و در نمودار نیامده‌اند.")
         _render_paragraph(
             "تحلیل توزیع اندازه خوشه‌ها",
             """
@@ -849,36 +972,38 @@ def create_clusters_analysis(clusters_df):
     
     with col3:
         # خوشه‌های پردرخواست
-        active_clusters = clusters_df[clusters_df['کل_درخواست_ها'] > 0]
-        top_active_clusters = active_clusters.nlargest(15, 'کل_درخواست_ها')
-        
-        fig_active = px.bar(
-            top_active_clusters,
-            x='کل_درخواست_ها',
-            y=range(len(top_active_clusters)),
-            orientation='h',
-            title="15 خوشه پردرخواست",
-            labels={'y': 'رتبه', 'x': 'تعداد درخواست‌ها'},
-            color='کل_درخواست_ها',
-            color_continuous_scale='reds'
-        )
-        
-        # اضافه کردن برچسب رشته
-        def _shorten_label(val):
-            try:
-                s = str(val) if val is not None else ''
-                s = s.strip()
-                return s if len(s) <= 15 else s[:15] + '...'
-            except Exception:
-                return ''
+        def build_active():
+            top_active_clusters = clusters_agg['top_active'].head(15)
+
+            fig_active = px.bar(
+                top_active_clusters,
+                x='کل_درخواست_ها',
+                y=range(len(top_active_clusters)),
+                orientation='h',
+                title="15 خوشه پردرخواست",
+                labels={'y': 'رتبه', 'x': 'تعداد درخواست‌ها'},
+                color='کل_درخواست_ها',
+                color_continuous_scale='reds'
+            )
+
+            # اضافه کردن برچسب رشته
+            def _shorten_label(val):
+                try:
+                    s = str(val) if val is not None else ''
+                    s = s.strip()
+                    return s if len(s) <= 15 else s[:15] + '...'
+                except Exception:
+                    return ''
 
-        fig_active.update_layout(
-            yaxis=dict(
-                tickmode='array',
-                tickvals=list(range(len(top_active_clusters))),
-                ticktext=[_shorten_label(row.get('رشته', '')) for _, row in top_active_clusters.iterrows()]
+            fig_active.update_layout(
+                yaxis=dict(
+                    tickmode='array',
+                    tickvals=list(range(len(top_active_clusters))),
+                    ticktext=[_shorten_label(row.get('رشته', '')) for _, row in top_active_clusters.iterrows()]
+                )
             )
-        )
+            return fig_active
+        fig_active = _cached_figure(dataset, 'clusters_top_active', build_active)
         
         st.plotly_chart(fig_active, use_container_width=True)
         _render_paragraph(
@@ -889,18 +1014,32 @@ def create_clusters_analysis(clusters_df):
         )
     
     with col4:
-        # نمودار پراکندگی تعداد دانشجویان vs درخواست‌ها
-        sample_clusters = clusters_df.sample(n=min(200, len(clusters_df)))  # نمونه برای عملکرد بهتر
-        
-        fig_scatter = px.scatter(
-            sample_clusters,
-            x='تعداد_دانشجویان',
-            y='کل_درخواست_ها',
-            color='مقطع',
-            size='کل_درخواست_ها',
-            title="رابطه دانشجویان و درخواست‌ها",
-            labels={'x': 'تعداد دانشجویان', 'y': 'تعداد درخواست‌ها'}
-        )
+        # نمودار پراکندگی تعداد دانشجویان vs درخواست‌ها: چگالی از هیستوگرام دوبعدی تجمیع‌ها،
+        # یا نمونه لایه‌ای قطعی (در حالت جریانی: نمونه هش‌شده به‌همراه خوشه‌های برتر)
+        def build_scatter():
+            if _scatter_mode(clusters_agg['rows']) == 'density':
+                pairs = clusters_agg['pair_hist']
+                fig_scatter = _density_figure(
+                    pairs.index.get_level_values(0), pairs.index.get_level_values(1), pairs.to_numpy(),
+                    title="رابطه دانشجویان و درخواست‌ها (چگالی)",
+                    labels={'x': 'تعداد دانشجویان', 'y': 'تعداد درخواست‌ها'}
+                )
+            else:
+                if dataset.streaming:
+                    sample_clusters = pd.concat([clusters_agg['sample'], clusters_agg['top_active']]).drop_duplicates('نام_خوشه')
+                else:
+                    sample_clusters = _scatter_sample(dataset.clusters, 'تعداد_دانشجویان', 'کل_درخواست_ها', stratum='مقطع')
+                fig_scatter = _scatter_figure(
+                    sample_clusters,
+                    'تعداد_دانشجویان',
+                    'کل_درخواست_ها',
+                    color='مقطع',
+                    size='کل_درخواست_ها',
+                    title="رابطه دانشجویان و درخواست‌ها",
+                    labels={'x': 'تعداد دانشجویان', 'y': 'تعداد درخواست‌ها'}
+                )
+            return fig_scatter
+        fig_scatter = _cached_figure(dataset, 'clusters_scatter', build_scatter, _page_setting('scatter_mode', SCATTER_DEFAULT_MODE))
         st.plotly_chart(fig_scatter, use_container_width=True)
         _render_paragraph(
             "تحلیل رابطه دانشجویان و درخواست‌ها",
@@ -912,27 +1051,41 @@ def create_clusters_analysis(clusters_df):
     # خلاصه آماری خوشه‌ها
     st.markdown("### 📊 خلاصه آماری خوشه‌های تحصیلی")
     
+    totals = _cube_rollup(clusters_agg['cube']).iloc[0]
+    students_q = _sketch_quantiles(clusters_agg['students_sketch']).fillna(0)
+    requests_q = _sketch_quantiles(clusters_agg['requests_sketch']).fillna(0)
     summary_stats = {
         'شاخص': [
             'کل خوشه‌ها',
+            'نام‌های یکتای خوشه (تخمینی)',
             'خوشه‌های فعال (دارای درخواست)',
             'میانگین دانشجویان در خوشه',
+            'میانه دانشجویان در خوشه',
             'میانگین درخواست در خوشه',
+            'میانه درخواست در خوشه',
+            'صدک ۹۰ / ۹۹ درخواست در خوشه',
             'بیشترین درخواست در یک خوشه',
             'خوشه‌های بدون درخواست'
         ],
         'مقدار': [
-            f"{len(clusters_df):,}",
-            f"{len(clusters_df[clusters_df['کل_درخواست_ها'] > 0]):,}",
-            f"{clusters_df['تعداد_دانشجویان'].mean():.1f}",
-            f"{clusters_df['کل_درخواست_ها'].mean():.1f}", 
-            f"{clusters_df['کل_درخواست_ها'].max():,}",
-            f"{len(clusters_df[clusters_df['کل_درخواست_ها'] == 0]):,}"
+            f"{int(totals['count']):,}",
+            f"{_hll_estimate(clusters_agg['names_hll']):,}",
+            f"{int(totals['active']):,}",
+            f"{totals['students_mean']:.1f}",
+            f"{students_q[0.5]:,.0f}",
+            f"{totals['requests_mean']:.1f}", 
+            f"{requests_q[0.5]:,.0f}",
+            f"{requests_q[0.9]:,.0f} / {requests_q[0.99]:,.0f}",
+            f"{int(totals['requests_max']):,}",
+            f"{int(totals['zero_requests']):,}"
         ]
     }
     
     summary_df = pd.DataFrame(summary_stats)
     st.dataframe(summary_df, use_container_width=True, hide_index=True)
+
+    # چندک‌ها و شمارش یکتا به تفکیک هر بعد، مستقیماً از خلاصه‌های جریانی (بدون پیمایش سطرها)
+    _lazy_section("📐 میانه و صدک‌ها به تفکیک مقطع، رشته و واحد", 'cluster_quantiles', _cluster_quantiles_section, clusters_agg)
     _render_paragraph(
         "تحلیل خلاصه آماری خوشه‌ها",
         """
@@ -940,14 +1093,78 @@ def create_clusters_analysis(clusters_df):
         """
     )
 
-def create_arak_report(supporters_df, units_df, clusters_df):
-    """گزارش ویژه واحد اراک با استفاده از داده‌های محلی (CSV attachments)"""
-    st.markdown("## 📋 گزارش واحد اراک")
+@st.fragment
+def _cluster_quantiles_section(clusters_agg):
+    """میانه، صدک‌ها و تعداد یکتای خوشه‌ها به تفکیک یک بعد (تغییر بعد فقط همین جدول را دوباره اجرا می‌کند)"""
+    dim = st.radio("تفکیک بر اساس:", ['مقطع', 'رشته', 'واحد'], horizontal=True, key='cluster_quantile_dim')
+    students_q = _sketch_quantiles(clusters_agg['students_sketch'], [dim])
+    requests_q = _sketch_quantiles(clusters_agg['requests_sketch'], [dim])
+    quantile_stats = pd.DataFrame({
+        'تعداد خوشه': _cube_rollup(clusters_agg['cube'], [dim])['count'],
+        'نام‌های یکتا (تخمینی)': _hll_estimate(clusters_agg['names_hll'], [dim]),
+        'میانه دانشجو': students_q[0.5],
+        'صدک ۹۰ دانشجو': students_q[0.9],
+        'میانه درخواست': requests_q[0.5],
+        'صدک ۹۰ درخواست': requests_q[0.9],
+        'صدک ۹۹ درخواست': requests_q[0.99],
+    }).sort_values('تعداد خوشه', ascending=False)
+    st.dataframe(quantile_stats, use_container_width=True)
+
+def create_unit_report(dataset, unit):
+    """گزارش ویژه یک واحد با استفاده از برش‌های از پیش محاسبه‌شده و داده‌های محلی (CSV attachments)"""
+    units_df = dataset.units
+    unit_name = unit['name']
+    profile = _unit_report_profile(dataset, unit)
+    st.markdown(f"## 📋 گزارش واحد {unit_name}")
+
+    # ضمیمه‌ها و کارپوشه‌های workspace خروجی‌های خود واحد WORKSPACE_UNIT_CODE هستند
+    workspace_unit = unit['code'] == WORKSPACE_UNIT_CODE
+
+    # سطر واحد (بر اساس کد یا نام) از نمایه واحدها در پیش‌محاسبه پیدا شده است
+    unit_row = profile['unit']
+    if unit_row is None:
+        st.warning(f'واحد {unit_name} در `units_df` پیدا نشد. بررسی کنید که ستون "کد_واحد" یا "نام_واحد" موجود باشد.')
+        return
+
+    # محاسبه شاخص‌ها برای واحد
+    unit_stats = {
+        'شاخص': ['تعداد دانشجویان', 'کل درخواست‌ها', 'درخواست جدید', 'در حال انجام', 'بسته شده', 'رد شده', 'نرخ تکمیل (%)', 'نرخ رد (%)'],
+        'مقدار': [
+            int(unit_row.get('تعداد_دانشجویان', 0)),
+            int(unit_row.get('کل_درخواست_ها', 0)),
+            int(unit_row.get('درخواست_جدید', 0)),
+            int(unit_row.get('درخواست_در_حال_انجام', 0)),
+            int(unit_row.get('درخواست_بسته_شده', 0)),
+            int(unit_row.get('درخواست_رد_شده', 0)),
+            float(unit_row.get('نرخ_تکمیل', 0.0)),
+            float(unit_row.get('نرخ_رد', 0.0))
+        ]
+    }
+
+    stats_df = pd.DataFrame(unit_stats)
+    st.dataframe(stats_df, use_container_width=True, hide_index=True)
+
+    # مقایسه با میانگین استان
+    province_avg_completion = units_df['نرخ_تکمیل'].mean() if 'نرخ_تکمیل' in units_df.columns else 0
+    st.markdown(f"### 🔎 مقایسه با استان: نرخ تکمیل {unit_name} {unit_row.get('نرخ_تکمیل', 0):.1f}%، میانگین استان {province_avg_completion:.1f}%")
+
+    # نمودار خلاصه وضعیت درخواست‌ها در واحد
+    fig = go.Figure()
+    for status, count in profile['status'].items():
+        fig.add_trace(go.Bar(name=status, x=[unit_name], y=[count], marker_color=UNIT_STATUS_COLORS[status]))
+    fig.update_layout(barmode='stack', title=f'وضعیت درخواست‌ها در {unit_name}')
+    st.plotly_chart(fig, use_container_width=True)
 
-    # تلاش برای خواندن فایل‌های ضمیمه در workspace اگر موجود باشند (پشتیبان) و ترجیح به داده‌های آپلود شده در session_state
-    workspace = os.path.abspath(os.path.dirname(__file__))
-    csv13 = os.path.join(workspace, '13.csv')
-    csv14 = os.path.join(workspace, '14.csv')
+    # ضمیمه‌ها و تحلیل‌های کارپوشه فقط وقتی بخششان باز است خوانده و ساخته می‌شوند
+    if workspace_unit:
+        _lazy_section("🔍 داده‌های کمکی کارپوشه", 'unit_report_extras', _unit_workspace_extras_section)
+    _lazy_section("📈 تحلیل‌های تکمیلی خوشه‌ها و حامیان", 'unit_report_details',
+                  _unit_report_details_section, dataset, unit, profile)
+
+def _unit_workspace_extras_section():
+    """پیش‌نمایش ضمیمه‌های CSV کارپوشه (13.csv و 14.csv) در صورت وجود"""
+    csv13 = os.path.join(WORKSPACE_DIR, '13.csv')
+    csv14 = os.path.join(WORKSPACE_DIR, '14.csv')
 
     extra_clusters = None
     extra_units = None
@@ -963,70 +1180,6 @@ def create_arak_report(supporters_df, units_df, clusters_df):
     except Exception:
         extra_units = None
 
-    # انتخاب واحد اراک از units_df (کد یا نام حاوی 'اراک' یا کد '121')
-    arak_unit = None
-    def _find_col_by_tokens(df, tokens):
-        if df is None:
-            return None
-        for col in df.columns:
-            low = str(col).replace('_', '').replace(' ', '').lower()
-            for t in tokens:
-                if t in low:
-                    return col
-        return None
-
-    code_col = _find_col_by_tokens(units_df, ['کدواحد', 'کد_واحد', 'code', 'id'])
-    name_col = _find_col_by_tokens(units_df, ['نامواحد', 'نام_واحد', 'name', 'unit'])
-
-    if code_col is not None:
-        try:
-            match = units_df[units_df[code_col].astype(str).str.contains('121')]
-            if len(match) > 0:
-                arak_unit = match.iloc[0]
-        except Exception:
-            pass
-    if arak_unit is None and name_col is not None:
-        try:
-            match = units_df[units_df[name_col].astype(str).str.contains('اراک', na=False)]
-            if len(match) > 0:
-                arak_unit = match.iloc[0]
-        except Exception:
-            pass
-
-    if arak_unit is None:
-        st.warning('واحد اراک در `units_df` پیدا نشد. بررسی کنید که ستون "کد_واحد" یا "نام_واحد" موجود باشد.')
-        return
-
-    # محاسبه شاخص‌ها برای اراک
-    arak_stats = {
-        'شاخص': ['تعداد دانشجویان', 'کل درخواست‌ها', 'درخواست جدید', 'در حال انجام', 'بسته شده', 'رد شده', 'نرخ تکمیل (%)', 'نرخ رد (%)'],
-        'مقدار': [
-            int(arak_unit.get('تعداد_دانشجویان', 0)),
-            int(arak_unit.get('کل_درخواست_ها', 0)),
-            int(arak_unit.get('درخواست_جدید', 0)),
-            int(arak_unit.get('درخواست_در_حال_انجام', 0)),
-            int(arak_unit.get('درخواست_بسته_شده', 0)),
-            int(arak_unit.get('درخواست_رد_شده', 0)),
-            float(arak_unit.get('نرخ_تکمیل', 0.0)),
-            float(arak_unit.get('نرخ_رد', 0.0))
-        ]
-    }
-
-    arak_df = pd.DataFrame(arak_stats)
-    st.dataframe(arak_df, use_container_width=True, hide_index=True)
-
-    # مقایسه با میانگین استان
-    province_avg_completion = units_df['نرخ_تکمیل'].mean() if 'نرخ_تکمیل' in units_df.columns else 0
-    st.markdown(f"### 🔎 مقایسه با استان: نرخ تکمیل اراک {arak_unit.get('نرخ_تکمیل', 0):.1f}%، میانگین استان {province_avg_completion:.1f}%")
-
-    # نمودار خلاصه وضعیت درخواست‌ها در اراک
-    fig = go.Figure()
-    fig.add_trace(go.Bar(name='بسته شده', x=['اراک'], y=[arak_unit.get('درخواست_بسته_شده', 0)], marker_color='#27AE60'))
-    fig.add_trace(go.Bar(name='رد شده', x=['اراک'], y=[arak_unit.get('درخواست_رد_شده', 0)], marker_color='#E74C3C'))
-    fig.add_trace(go.Bar(name='در حال انجام', x=['اراک'], y=[arak_unit.get('درخواست_در_حال_انجام', 0)], marker_color='#F39C12'))
-    fig.update_layout(barmode='stack', title='وضعیت درخواست‌ها در اراک')
-    st.plotly_chart(fig, use_container_width=True)
-
     # اگر فایل‌های اضافی خوانده شده‌اند، نمایش خلاصه
     if extra_units is not None:
         st.markdown('#### 🔍 داده‌های کمکی از `14.csv` (در صورت وجود)')
@@ -1034,6 +1187,15 @@ def create_arak_report(supporters_df, units_df, clusters_df):
     if extra_clusters is not None:
         st.markdown('#### 🔍 داده‌های خوشه‌ای کمکی از `13.csv` (در صورت وجود)')
         st.write(extra_clusters.head())
+    if extra_units is None and extra_clusters is None:
+        st.info('ضمیمه‌ای در کارپوشه یافت نشد.')
+
+def _unit_report_details_section(dataset, unit, profile):
+    """تحلیل‌های تکمیلی واحد از کارپوشه‌های 12/13/14.xlsx یا برش‌های آپلودی"""
+    units_df = dataset.units
+    unit_name = unit['name']
+    workspace = WORKSPACE_DIR
+    workspace_unit = unit['code'] == WORKSPACE_UNIT_CODE
 
     # --- Additional Arak analyses derived from provided Excel summaries (12.xlsx,13.xlsx,14.xlsx) ---
     # If the detailed summary Excel files exist in workspace, prefer them for richer displays.
@@ -1041,42 +1203,20 @@ def create_arak_report(supporters_df, units_df, clusters_df):
     x13 = os.path.join(workspace, '13.xlsx')
     x14 = os.path.join(workspace, '14.xlsx')
 
-    # helper to safely read excel and normalize column names
-    def _read_xlsx_safe(path):
-        try:
-            if os.path.exists(path):
-                df = pd.read_excel(path)
-                # normalize column names similar to uploads
-                def _norm_cols(cols):
-                    out = []
-                    for c in cols:
-                        s = str(c).strip()
-                        s = s.replace('\u00A0', ' ')
-                        s = s.replace('\u200C', '')
-                        s = s.replace('-', '_')
-                        s = s.replace(' ', '_')
-                        s = s.replace('__', '_')
-                        out.append(s)
-                    return out
-                df.columns = _norm_cols(df.columns)
-                return df
-        except Exception:
-            return None
-        return None
+    # فایل‌های آپلودشده همان جداول dataset هستند و برش واحد آن‌ها در پیش‌محاسبه آماده است؛
+    # کارپوشه‌ها فقط برای واحد خودشان و وقتی جایگزین آپلودی ندارند، هم‌زمان خوانده می‌شوند
+    uploaded = {x12: 'uploaded_sup_df', x13: 'uploaded_clusters_df', x14: 'uploaded_units_df'}
+    workbooks = _workspace_workbooks(
+        [path for path, key in uploaded.items() if st.session_state.get(key) is None]
+    ) if workspace_unit else {}
+
+    def _workbook_or_slice(path, unit_slice):
+        _tmp = _first_sheet(workbooks, path)
+        return _tmp if (_tmp is not None and not getattr(_tmp, 'empty', True)) else unit_slice
 
-    # اگر کاربر قبلاً فایل‌ها را از سایدبار آپلود کرده باشد، در session_state ذخیره و در اینجا استفاده می‌کنیم
-    ws_sup = st.session_state.get('uploaded_sup_df', None)
-    ws_clusters = st.session_state.get('uploaded_clusters_df', None)
-    ws_units = st.session_state.get('uploaded_units_df', None)
-    if ws_sup is None:
-        _tmp = _read_xlsx_safe(x12)
-        ws_sup = _tmp if (_tmp is not None and not getattr(_tmp, 'empty', True)) else supporters_df
-    if ws_clusters is None:
-        _tmp = _read_xlsx_safe(x13)
-        ws_clusters = _tmp if (_tmp is not None and not getattr(_tmp, 'empty', True)) else clusters_df
-    if ws_units is None:
-        _tmp = _read_xlsx_safe(x14)
-        ws_units = _tmp if (_tmp is not None and not getattr(_tmp, 'empty', True)) else units_df
+    ws_sup = _workbook_or_slice(x12, profile['supporters'])
+    ws_clusters = _workbook_or_slice(x13, profile['clusters'])
+    ws_units = _workbook_or_slice(x14, units_df.iloc[profile['unit_rows']])
 
     # normalize expected column names (Persian variants)
     def _safe_col(df, wanted):
@@ -1093,27 +1233,7 @@ def create_arak_report(supporters_df, units_df, clusters_df):
     def _alias_columns_for_units(df):
         if df is None:
             return df
-        cols = list(df.columns)
-        rename = {}
-        def canon(s):
-            return ''.join([c for c in str(s) if c.isalnum()])
-
-        for c in cols:
-            low = canon(c)
-            # detect code+unit
-            if 'کد' in c or ('کد' in low and 'واحد' in low) or ('code' in low and 'unit' in low):
-                rename[c] = 'کد_واحد'
-                continue
-            if 'نام' in c and 'واحد' in c:
-                rename[c] = 'نام_واحد'
-                continue
-            # more robust token scanning
-            if 'نام' in low and 'واحد' in low:
-                rename[c] = 'نام_واحد'
-                continue
-            if 'کد' in low and 'واحد' in low:
-                rename[c] = 'کد_واحد'
-                continue
+        rename = _lookup_unit_aliases(tuple(df.columns))
         if rename:
             try:
                 df = df.rename(columns=rename)
@@ -1134,7 +1254,7 @@ def create_arak_report(supporters_df, units_df, clusters_df):
                 possible = [c for c in ws_clusters.columns if 'کل' in c and 'درخواست' in c]
                 ccol = possible[0] if possible else None
             if ccol is not None:
-                top_clusters = ws_clusters.groupby('نام خوشه')[ccol].sum().sort_values(ascending=False).head(10)
+                top_clusters = ws_clusters.groupby('نام خوشه')[ccol].sum().nlargest(10)
                 total = top_clusters.sum()
                 fig = px.bar(x=top_clusters.values, y=top_clusters.index, orientation='h', labels={'x': 'تعداد درخواست‌ها', 'y': 'نام خوشه'}, title='ده درخواست پرتکرار دانشجویان و درصد فراوانی آنها')
                 # add percent annotations
@@ -1143,9 +1263,9 @@ def create_arak_report(supporters_df, units_df, clusters_df):
                     fig.add_annotation(dict(x=val, y=top_clusters.index[i], text=f"{perc.iloc[i]}%", showarrow=False, xanchor='left', xshift=6))
                 st.plotly_chart(fig, use_container_width=True)
                 _render_paragraph(
-                    "تحلیل ده درخواست پرتکرار دانشجویان اراک",
-                    """
-این نمودار نشان می‌دهد کدام خوشه‌ها یا موضوعات بیشترین حجم درخواست را در اراک ایجاد کرده‌اند و بنابراین کانون‌های تمرکز تقاضا کجا هستند. تمرکز بر این موضوعات با تولید محتوای راهنمای اختصاصی، به‌کارگیری پاسخ‌های آماده و توسعه کانال‌های سلف‌سرویس می‌تواند بار کاری تیم پشتیبانی را کاهش دهد و کیفیت تجربه دانشجو را ارتقا دهد. مقایسه سهم هر موضوع در بازه‌های زمانی مختلف، تاثیر مداخلات را روشن می‌سازد و به سیاست‌گذاری مبتنی بر شواهد کمک می‌کند.
+                    f"تحلیل ده درخواست پرتکرار دانشجویان {unit_name}",
+                    f"""
+این نمودار نشان می‌دهد کدام خوشه‌ها یا موضوعات بیشترین حجم درخواست را در {unit_name} ایجاد کرده‌اند و بنابراین کانون‌های تمرکز تقاضا کجا هستند. تمرکز بر این موضوعات با تولید محتوای راهنمای اختصاصی، به‌کارگیری پاسخ‌های آماده و توسعه کانال‌های سلف‌سرویس می‌تواند بار کاری تیم پشتیبانی را کاهش دهد و کیفیت تجربه دانشجو را ارتقا دهد. مقایسه سهم هر موضوع در بازه‌های زمانی مختلف، تاثیر مداخلات را روشن می‌سازد و به سیاست‌گذاری مبتنی بر شواهد کمک می‌کند.
                     """
                 )
         except Exception:
@@ -1178,7 +1298,7 @@ def create_arak_report(supporters_df, units_df, clusters_df):
         else:
             sup['نرخ_تکمیل_حامی'] = 0
 
-        sup_sorted = sup.sort_values(by=tot_col if tot_col is not None else sup.columns[0], ascending=False).head(20)
+        sup_sorted = _top_rows(sup, tot_col, 20) if tot_col is not None else sup.sort_values(by=sup.columns[0], ascending=False).head(20)
         st.markdown('### 🧑‍💻 عملکرد حامیان (جدول رتبه‌بندی بر اساس تعداد درخواست‌ها)')
         show_cols = []
         for col in ['نام نمایشی', 'رایانامه', tot_col, closed_col, 'نرخ_تکمیل_حامی']:
@@ -1189,24 +1309,24 @@ def create_arak_report(supporters_df, units_df, clusters_df):
         else:
             st.dataframe(sup_sorted[show_cols].rename(columns={tot_col: 'کل درخواست‌ها', closed_col: 'بسته شده'}), use_container_width=True)
         _render_paragraph(
-            "تحلیل عملکرد حامیان اراک",
-            """
-جدول رتبه‌بندی حامیان اراک با تمرکز بر حجم کار و کیفیت پاسخ، نقاط قوت و نیازمند بهبود را مشخص می‌کند. نرخ تکمیل بالا در کنار حجم زیاد مطلوب است و می‌تواند به‌عنوان الگوی بهترین عملکرد معرفی شود. در مقابل، نرخ رد بالا نیازمند بازنگری در فرایندها، فرم‌ها و دستورالعمل‌هاست. سیاست‌های صف هوشمند، سقف درخواست فعال و برنامه منتورشیپ می‌تواند توازن بار را بهبود دهد و کیفیت را تثبیت کند.
+            f"تحلیل عملکرد حامیان {unit_name}",
+            f"""
+جدول رتبه‌بندی حامیان {unit_name} با تمرکز بر حجم کار و کیفیت پاسخ، نقاط قوت و نیازمند بهبود را مشخص می‌کند. نرخ تکمیل بالا در کنار حجم زیاد مطلوب است و می‌تواند به‌عنوان الگوی بهترین عملکرد معرفی شود. در مقابل، نرخ رد بالا نیازمند بازنگری در فرایندها، فرم‌ها و دستورالعمل‌هاست. سیاست‌های صف هوشمند، سقف درخواست فعال و برنامه منتورشیپ می‌تواند توازن بار را بهبود دهد و کیفیت را تثبیت کند.
             """
         )
 
         # 3) Scatter: total requests vs completion rate (proxy for response efficiency)
         try:
             if tot_col is not None:
-                fig2 = px.scatter(sup, x=tot_col, y='نرخ_تکمیل_حامی', hover_name=sup.get('نام نمایشی', None), size=sup.get(closed_col, None), title='سرعت پاسخگویی (پراکسی): تعداد درخواست‌ها vs نرخ تکمیل حامیان')
+                fig2 = _reduced_scatter(sup, tot_col, 'نرخ_تکمیل_حامی', hover_name='نام نمایشی' if 'نام نمایشی' in sup.columns else None, size=closed_col, title='سرعت پاسخگویی (پراکسی): تعداد درخواست‌ها vs نرخ تکمیل حامیان')
                 fig2.update_layout(xaxis_title='کل درخواست‌ها', yaxis_title='نرخ تکمیل (%)')
                 st.plotly_chart(fig2, use_container_width=True)
         except Exception:
             pass
         _render_paragraph(
-            "تحلیل پراکندگی عملکرد حامیان اراک",
-            """
-این نمودار رابطه میان حجم کار و نرخ تکمیل حامیان اراک را نشان می‌دهد و نقاط نیازمند مداخله را به‌خوبی نمایان می‌سازد. نقاط با حجم بالا و نرخ پایین، اولویت اصلاحات هستند؛ در حالی‌که نقاط با حجم پایین و نرخ بالا ظرفیت رشد دارند. رصد جابه‌جایی نقاط در طول زمان، اثر آموزش‌ها، استانداردسازی پاسخ‌ها و سیاست‌های توزیع بار را به‌صورت عینی نمایش می‌دهد.
+            f"تحلیل پراکندگی عملکرد حامیان {unit_name}",
+            f"""
+این نمودار رابطه میان حجم کار و نرخ تکمیل حامیان {unit_name} را نشان می‌دهد و نقاط نیازمند مداخله را به‌خوبی نمایان می‌سازد. نقاط با حجم بالا و نرخ پایین، اولویت اصلاحات هستند؛ در حالی‌که نقاط با حجم پایین و نرخ بالا ظرفیت رشد دارند. رصد جابه‌جایی نقاط در طول زمان، اثر آموزش‌ها، استانداردسازی پاسخ‌ها و سیاست‌های توزیع بار را به‌صورت عینی نمایش می‌دهد.
             """
         )
 
@@ -1220,37 +1340,26 @@ def create_arak_report(supporters_df, units_df, clusters_df):
             if len(num_cols) > 0:
                 fig3 = make_subplots(rows=1, cols=len(num_cols), subplot_titles=[c for c in num_cols])
                 for i, c in enumerate(num_cols):
-                    hist = np.histogram(sup[c].dropna(), bins=20)
-                    fig3.add_trace(go.Bar(x=hist[1][:-1], y=hist[0], name=c), row=1, col=i+1)
+                    fig3.add_trace(_histogram_bar(_cached_values_histogram(sup[c].to_numpy(dtype=float)), c), row=1, col=i+1)
                 fig3.update_layout(height=350)
                 st.plotly_chart(fig3, use_container_width=True)
         except Exception:
             pass
         _render_paragraph(
-            "تحلیل توزیع آماری شاخص‌های حامیان اراک",
+            f"تحلیل توزیع آماری شاخص‌های حامیان {unit_name}",
             """
 هیستوگرام‌های شاخص‌های کلیدی، شکل توزیع و وجود دم بلند یا نقاط پرت را آشکار می‌کنند. این آگاهی برای تعیین آستانه‌های هشدار، طراحی مداخلات هدفمند و ارزیابی اثربخشی اقدامات پس از اجرا ضروری است. هدف راهبردی کاهش پراکندگی نامطلوب و ارتقای میانه و چارک‌های بالایی نرخ تکمیل است.
             """
         )
 
-def create_comprehensive_insights(supporters_df, units_df, clusters_df):
+def create_comprehensive_insights(dataset):
     """تحلیل جامع و بینش‌های استراتژیک"""
     st.markdown("## 🔍 بینش‌های جامع و پیشنهادات استراتژیک")
+    supporters_df, units_df, clusters_agg = dataset.supporters, dataset.units, dataset.clusters_agg
     
     # محاسبه آمار کلیدی
     active_supporters = len(supporters_df[supporters_df['کل_درخواست_ها'] > 0])
     inactive_supporters = len(supporters_df[supporters_df['کل_درخواست_ها'] == 0])
-    # محافظت در برابر ستون‌های مشتق‌شده‌ای که ممکن است قبلاً ایجاد نشده باشند
-    units_df = units_df.copy()
-    # جلوگیری از تقسیم بر صفر
-    if 'نرخ_تکمیل' not in units_df.columns or units_df['نرخ_تکمیل'].isnull().any():
-        safe_total = units_df['کل_درخواست_ها'].replace({0: np.nan})
-        units_df['نرخ_تکمیل'] = (units_df['درخواست_بسته_شده'] / safe_total * 100).round(1).fillna(0)
-    if 'نرخ_رد' not in units_df.columns or units_df['نرخ_رد'].isnull().any():
-        safe_total = units_df['کل_درخواست_ها'].replace({0: np.nan})
-        units_df['نرخ_رد'] = (units_df['درخواست_رد_شده'] / safe_total * 100).round(1).fillna(0)
-    if 'نام_کوتاه' not in units_df.columns:
-        units_df['نام_کوتاه'] = units_df.get('نام_واحد', '').astype(str).str.split('-').str[0]
 
     # نرخ تکمیل کلی استان
     total_completion_rate = (units_df['درخواست_بسته_شده'].sum() / units_df['کل_درخواست_ها'].sum() * 100)
@@ -1280,7 +1389,7 @@ def create_comprehensive_insights(supporters_df, units_df, clusters_df):
         best_unit['نرخ_تکمیل'],
         best_unit['تعداد_دانشجویان'],
         active_supporters,
-        len(clusters_df)
+        clusters_agg['rows']
     ), unsafe_allow_html=True)
     
     # چالش‌ها و نقاط ضعف
@@ -1299,7 +1408,7 @@ def create_comprehensive_insights(supporters_df, units_df, clusters_df):
         inactive_supporters,
         (inactive_supporters / len(supporters_df) * 100),
         (best_unit['نرخ_تکمیل'] - worst_unit['نرخ_تکمیل']),
-        len(clusters_df[clusters_df['کل_درخواست_ها'] == 0])
+        clusters_agg['zero_requests']
     ), unsafe_allow_html=True)
     
     # پیشنهادات استراتژیک
@@ -1424,240 +1533,151 @@ def create_comprehensive_insights(supporters_df, units_df, clusters_df):
     impact_df = pd.DataFrame(impact_data)
     st.dataframe(impact_df, use_container_width=True, hide_index=True)
 
-def create_arak_detailed_report(supporters_df, units_df, clusters_df):
-    """تحلیل ویژه و تفکیکی واحد اراک با گزارش متنی مفصل (≈25 خط برای هر بخش)."""
-    st.markdown("## 📌 تحلیل ویژه واحد اراک (کامل)")
+def create_unit_detailed_report(dataset, unit):
+    """تحلیل ویژه و تفکیکی یک واحد با گزارش متنی مفصل (≈25 خط برای هر بخش)."""
+    unit_name = unit['name']
+    st.markdown(f"## 📌 تحلیل ویژه واحد {unit_name} (کامل)")
 
-    # فیلتر ایمن برای اراک در جداول در دسترس
-    def _contains_arāk(val: str) -> bool:
-        try:
-            s = str(val)
-            return 'اراک' in s or 'Arak' in s or 'arak' in s
-        except Exception:
-            return False
+    # برش‌های واحد (سطر واحد، حامیان، خوشه‌ها و رتبه‌بندی‌ها) در پس‌زمینه از پیش محاسبه شده‌اند
+    profile = _unit_report_profile(dataset, unit)
 
-    # واحد اراک از units_df
-    arak_row = None
-    if units_df is not None and not getattr(units_df, 'empty', True):
-        try:
-            mask = units_df['نام_واحد'].astype(str).apply(_contains_arāk) if 'نام_واحد' in units_df.columns else pd.Series([False]*len(units_df))
-        except Exception:
-            mask = pd.Series([False]*len(units_df))
-        if mask.any():
-            arak_row = units_df[mask].iloc[0]
-        elif 'کد_واحد' in units_df.columns:
-            # کد رایج اراک 121
-            try:
-                mask2 = units_df['کد_واحد'].astype(str).str.contains('121', na=False)
-                if mask2.any():
-                    arak_row = units_df[mask2].iloc[0]
-            except Exception:
-                pass
+    # هر بخش فقط وقتی باز است آماده و رسم می‌شود (خوشه‌ها ممکن است کارپوشه‌ها را بخوانند)
+    _lazy_section("👥 حامیان واحد", 'unit_detail_supporters', _unit_detail_supporters_section, unit, profile, expanded=True)
+    _lazy_section("🎯 خوشه‌های تحصیلی واحد", 'unit_detail_clusters', _unit_detail_clusters_section, dataset, unit, profile)
+    _lazy_section("🎓 دانشجویان و وضعیت درخواست‌ها", 'unit_detail_status', _unit_detail_status_section, unit, profile)
 
-    # خوشه‌های اراک: ترجیح با داده آپلودی و شناسایی انعطاف‌پذیر ستون واحد
-    def _normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
-        try:
-            cols = []
-            for c in df.columns:
-                s = str(c).strip()
-                s = s.replace('\u00A0', ' ')
-                s = s.replace('\u200C', '')
-                s = s.replace('-', '_')
-                s = s.replace(' ', '_')
-                s = s.replace('__', '_')
-                cols.append(s)
-            df = df.copy()
-            df.columns = cols
-            return df
-        except Exception:
-            return df
+def _unit_detail_supporters_section(unit, profile):
+    """بخش 1: حامیان واحد"""
+    unit_name = unit['name']
+    # حامیان واحد (کد واحد در ایمیل، یا کل حامیان اگر نشانه‌ای از تعلق نباشد) و ده حامی پرترافیک از پیش محاسبه شده‌اند
+    supporters_unit = profile['supporters']
+    if not getattr(supporters_unit, 'empty', True):
+        top_sup = profile['top_supporters']
+
+        if 'کل_درخواست_ها' in top_sup.columns and 'نام_نمایشی' in top_sup.columns:
+            fig_sup = px.bar(top_sup, y='نام_نمایشی', x='کل_درخواست_ها', orientation='h', title=f'۱۰ حامی پرترافیک {unit_name}', color='کل_درخواست_ها', color_continuous_scale='viridis')
+            fig_sup.update_layout(yaxis={'categoryorder':'total ascending'})
+            st.plotly_chart(fig_sup, use_container_width=True)
+
+        # جدول عملکرد (نرخ‌ها از پیش در مجموعه داده محاسبه شده‌اند)
+        show_cols = [c for c in ['نام_نمایشی','کل_درخواست_ها','درخواست_بسته_شده','درخواست_رد_شده','نرخ_تکمیل','نرخ_رد'] if c in top_sup.columns]
+        if show_cols:
+            st.dataframe(top_sup[show_cols], use_container_width=True, hide_index=True)
 
+        _render_paragraph(
+            f"گزارش تفصیلی حامیان {unit_name}",
+            f"""
+این بخش به صورت اختصاصی عملکرد حامیان مرتبط با واحد {unit_name} را واکاوی می‌کند. تمرکز بر ده حامی پرترافیک کمک می‌کند نقاط فشار و فرصت‌های بهبود شناسایی شود. اگر فاصله میان نفرات اول تا سایرین زیاد باشد، خطر اتکای سیستم به افراد محدود افزایش می‌یابد و باید با سیاست‌هایی مانند سقف درخواست فعال و ارجاع هوشمند، ریسک را کنترل کرد. مقایسه همزمان حجم کار با نرخ تکمیل و نرخ رد نشان می‌دهد که آیا افزایش بار به افت کیفیت منجر شده است یا خیر. در مواردی که نرخ رد بالا باشد، بازنگری فرم‌ها، استانداردسازی پاسخ‌ها و آموزش هدفمند می‌تواند موثر باشد. تحلیل روندی این شاخص‌ها در بازه‌های ماهانه، تاثیر مداخلات را به‌طور عینی آشکار می‌کند. همچنین مستندسازی تجربیات موفق افراد برتر و انتشار آن به‌عنوان الگو، مسیر ارتقای جمعی تیم را هموار می‌سازد. شناسایی موضوعات پرتکرار و پیوند آن با تخصص حامیان، توزیع کارآمدتر ارجاعات را ممکن می‌کند. در نهایت هدف، ایجاد تعادل پایدار بین کمیت و کیفیت است تا ضمن پاسخ‌گویی به تقاضای رو به رشد، رضایت دانشجویان نیز در سطح مطلوب باقی بماند. این گزارش مبنای تصمیم‌های عملیاتی مانند تخصیص منابع، برنامه‌های آموزشی و تعریف SLA های اختصاصی برای {unit_name} خواهد بود.
+            """
+        )
+    else:
+        st.info(f'داده قابل اتکا برای تفکیک حامیان {unit_name} یافت نشد؛ لطفاً فایل‌های تفصیلی را بارگذاری کنید.')
+
+def _unit_detail_clusters_section(dataset, unit, profile):
+    """خوشه‌های واحد: برش آپلودی، کارپوشه استانی یا جدول خوشه‌های dataset"""
+    clusters_df = dataset.clusters
+    unit_name = unit['name']
+
+    # خوشه‌های واحد: ترجیح با داده آپلودی و شناسایی انعطاف‌پذیر ستون واحد
     def _find_col(df: pd.DataFrame, candidates: list[str]) -> str | None:
         if df is None:
             return None
-        names = list(df.columns)
-        # دقیق
-        for cand in candidates:
-            if cand in names:
-                return cand
-        # تطبیق توکنی ساده
-        for col in names:
-            low = str(col).replace('_','').lower()
-            for cand in candidates:
-                if all(tok in low for tok in cand.replace('_','').lower().split()):
-                    return col
-        return None
+        return _lookup_candidate_column(tuple(df.columns), tuple(candidates))
 
+    # خوشه‌های آپلودی همان جدول خوشه‌های dataset هستند؛ ستون واحد آن (یا ستون اول، مطابق توضیح شما برای 13.xlsx) نمایه شده است
     src_clusters = st.session_state.get('uploaded_clusters_df', None)
-    clusters_arak = None
-    if src_clusters is not None and not getattr(src_clusters, 'empty', True):
-        src_clusters = _normalize_cols(src_clusters)
-        unit_col = _find_col(src_clusters, ['واحد','نام_واحد','unit','unit_name','unitname'])
-        # اگر ستون مشخص نشد، ستون اول را مبنا می‌گیریم (مطابق توضیح شما برای 13.xlsx)
-        if unit_col is None and len(src_clusters.columns) > 0:
-            unit_col = src_clusters.columns[0]
-        if unit_col is not None:
-            try:
-                clusters_arak = src_clusters[src_clusters[unit_col].astype(str).apply(_contains_arāk)].copy()
-            except Exception:
-                clusters_arak = src_clusters.copy()
+    clusters_indexed = bool(dataset.unit_index.get('clusters'))
+    clusters_unit = None
+    if src_clusters is not None and not getattr(src_clusters, 'empty', True) and clusters_indexed:
+        clusters_unit = _normalize_cols(profile['clusters'].copy())
     # تلاش برای خواندن فایل محلی «گزارش خوشه های استان.xlsx» در صورت عدم موفقیت بالا
-    if (clusters_arak is None or getattr(clusters_arak, 'empty', True)):
+    if (clusters_unit is None or getattr(clusters_unit, 'empty', True)):
         try:
-            workspace = os.path.abspath(os.path.dirname(__file__))
+            workspace = WORKSPACE_DIR
             candidates = [
                 os.path.join(workspace, 'گزارش خوشه های استان.xlsx'),
                 os.path.join(workspace, 'گزارش_خوشه_های_استان.xlsx'),
                 os.path.join(workspace, '13.xlsx'),
             ]
+            # همه نامزدها یک‌جا و هم‌زمان خوانده می‌شوند (ارتقای سطر اول به هدر در خود بارگذار انجام می‌شود)
+            workbooks = _workspace_workbooks(candidates)
             for path in candidates:
-                if os.path.exists(path):
-                    try:
-                        df_try = pd.read_excel(path)
-                    except Exception:
-                        # اگر سطر اول هدر نباشد
-                        df_try = pd.read_excel(path, header=None)
-                        # ارتقای ردیف اول به هدر در صورت امکان
-                        if df_try.shape[0] > 1:
-                            df_try.columns = df_try.iloc[0].astype(str)
-                            df_try = df_try.iloc[1:].reset_index(drop=True)
-                    df_try = _normalize_cols(df_try)
-                    unit_col = _find_col(df_try, ['واحد','نام_واحد','unit','unit_name','unitname'])
+                df_try = _first_sheet(workbooks, path)
+                if df_try is not None:
+                    sheet_index = _workspace_unit_index(path, df_try)
+                    unit_col = _find_col(df_try, UNIT_COLUMN_CANDIDATES)
                     if unit_col is None and df_try.shape[1] >= 2:
-                        # تلاش نهایی: جست‌وجوی ستونی که شامل واژه اراک در مقادیر باشد
-                        for c in df_try.columns:
-                            try:
-                                if df_try[c].astype(str).apply(_contains_arāk).any():
-                                    unit_col = c
-                                    break
-                            except Exception:
-                                continue
+                        # تلاش نهایی: ستونی که نام واحد در مقادیر آن نمایه شده باشد
+                        unit_col = next((c for c in df_try.columns if len(_unit_rows(sheet_index, unit['keys'], [c]))), None)
                     # اگر همچنان پیدا نشد، طبق دستور شما ستون اول به عنوان ستونی که واحد/نام را دارد فرض می‌شود
                     if unit_col is None and len(df_try.columns) > 0:
                         unit_col = df_try.columns[0]
                     if unit_col is not None:
-                        try:
-                            candidate = df_try[df_try[unit_col].astype(str).apply(_contains_arāk)].copy()
-                            if not candidate.empty:
-                                clusters_arak = candidate
-                                break
-                        except Exception:
-                            clusters_arak = df_try.copy()
+                        rows = _unit_rows(sheet_index, unit['keys'], [unit_col])
+                        if len(rows) > 0:
+                            clusters_unit = df_try.iloc[rows].copy()
                             break
         except Exception:
             pass
-    if clusters_arak is None:
-        tmp = clusters_df.copy() if clusters_df is not None else pd.DataFrame()
-        tmp = _normalize_cols(tmp) if not getattr(tmp, 'empty', True) else tmp
-        unit_col = _find_col(tmp, ['واحد','نام_واحد','unit','unit_name','unitname'])
-        if unit_col is not None and not getattr(tmp, 'empty', True):
-            try:
-                clusters_arak = tmp[tmp[unit_col].astype(str).apply(_contains_arāk)].copy()
-            except Exception:
-                clusters_arak = tmp.copy()
+    if clusters_unit is None:
+        tmp = clusters_df if clusters_df is not None else pd.DataFrame()
+        # کپی سطحی: سرستون‌ها بدون کپی داده و بدون تغییر جدول مشترک dataset نرمال می‌شوند
+        tmp = _normalize_cols(tmp.copy(deep=False)) if not getattr(tmp, 'empty', True) else tmp
+        unit_col = _find_col(tmp, UNIT_COLUMN_CANDIDATES)
+        if unit_col is not None and not getattr(tmp, 'empty', True) and clusters_indexed:
+            clusters_unit = tmp.iloc[profile['cluster_rows']].copy()
         else:
-            clusters_arak = tmp
-
-    # حامیان اراک: اگر نشانه‌ای از تعلق وجود نداشته باشد، به‌صورت محافظه‌کارانه با الگوی ایمیل شامل 121 فیلتر می‌کنیم؛ در غیر این‌صورت کل را نشان می‌دهیم
-    supporters_arak = supporters_df.copy() if supporters_df is not None else pd.DataFrame()
-    if not getattr(supporters_arak, 'empty', True) and 'رایانامه' in supporters_arak.columns:
-        try:
-            cand = supporters_arak[supporters_arak['رایانامه'].astype(str).str.contains('121', na=False)]
-            if len(cand) >= 3:
-                supporters_arak = cand
-        except Exception:
-            pass
-
-    # بخش 1: حامیان اراک
-    st.markdown("### 👥 حامیان واحد اراک")
-    if not getattr(supporters_arak, 'empty', True):
-        # ایمن‌سازی ستون‌های عددی
-        for _c in ['کل_درخواست_ها', 'درخواست_بسته_شده', 'درخواست_رد_شده']:
-            if _c in supporters_arak.columns:
-                supporters_arak[_c] = pd.to_numeric(supporters_arak[_c], errors='coerce').fillna(0)
-        top_n = min(10, len(supporters_arak))
-        if 'کل_درخواست_ها' in supporters_arak.columns:
-            top_sup = supporters_arak[supporters_arak['کل_درخواست_ها'] > 0].nlargest(top_n, 'کل_درخواست_ها').copy()
-        else:
-            top_sup = supporters_arak.head(top_n).copy()
-
-        if 'کل_درخواست_ها' in top_sup.columns and 'نام_نمایشی' in top_sup.columns:
-            fig_sup = px.bar(top_sup, y='نام_نمایشی', x='کل_درخواست_ها', orientation='h', title='۱۰ حامی پرترافیک اراک', color='کل_درخواست_ها', color_continuous_scale='viridis')
-            fig_sup.update_layout(yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig_sup, use_container_width=True)
-
-        # جدول عملکرد
-        if 'کل_درخواست_ها' in top_sup.columns:
-            safe_total = top_sup['کل_درخواست_ها'].replace({0: np.nan})
-            top_sup['نرخ_تکمیل'] = ((top_sup.get('درخواست_بسته_شده', 0) / safe_total) * 100).round(1).fillna(0)
-            top_sup['نرخ_رد'] = ((top_sup.get('درخواست_رد_شده', 0) / safe_total) * 100).round(1).fillna(0)
-        show_cols = [c for c in ['نام_نمایشی','کل_درخواست_ها','درخواست_بسته_شده','درخواست_رد_شده','نرخ_تکمیل','نرخ_رد'] if c in top_sup.columns]
-        if show_cols:
-            st.dataframe(top_sup[show_cols], use_container_width=True, hide_index=True)
-
-        _render_paragraph(
-            "گزارش تفصیلی حامیان اراک",
-            """
-این بخش به صورت اختصاصی عملکرد حامیان مرتبط با واحد اراک را واکاوی می‌کند. تمرکز بر ده حامی پرترافیک کمک می‌کند نقاط فشار و فرصت‌های بهبود شناسایی شود. اگر فاصله میان نفرات اول تا سایرین زیاد باشد، خطر اتکای سیستم به افراد محدود افزایش می‌یابد و باید با سیاست‌هایی مانند سقف درخواست فعال و ارجاع هوشمند، ریسک را کنترل کرد. مقایسه همزمان حجم کار با نرخ تکمیل و نرخ رد نشان می‌دهد که آیا افزایش بار به افت کیفیت منجر شده است یا خیر. در مواردی که نرخ رد بالا باشد، بازنگری فرم‌ها، استانداردسازی پاسخ‌ها و آموزش هدفمند می‌تواند موثر باشد. تحلیل روندی این شاخص‌ها در بازه‌های ماهانه، تاثیر مداخلات را به‌طور عینی آشکار می‌کند. همچنین مستندسازی تجربیات موفق افراد برتر و انتشار آن به‌عنوان الگو، مسیر ارتقای جمعی تیم را هموار می‌سازد. شناسایی موضوعات پرتکرار و پیوند آن با تخصص حامیان، توزیع کارآمدتر ارجاعات را ممکن می‌کند. در نهایت هدف، ایجاد تعادل پایدار بین کمیت و کیفیت است تا ضمن پاسخ‌گویی به تقاضای رو به رشد، رضایت دانشجویان نیز در سطح مطلوب باقی بماند. این گزارش مبنای تصمیم‌های عملیاتی مانند تخصیص منابع، برنامه‌های آموزشی و تعریف SLA های اختصاصی برای اراک خواهد بود.
-            """
-        )
-    else:
-        st.info('داده قابل اتکا برای تفکیک حامیان اراک یافت نشد؛ لطفاً فایل‌های تفصیلی را بارگذاری کنید.')
+            clusters_unit = tmp
 
-    st.markdown("---")
-    # بخش 2: خوشه‌های اراک
-    st.markdown("### 🎯 خوشه‌های تحصیلی واحد اراک")
-    if clusters_arak is not None and not getattr(clusters_arak, 'empty', True):
+    # بخش 2: خوشه‌های واحد
+    if clusters_unit is not None and not getattr(clusters_unit, 'empty', True):
         # ایمن‌سازی مقادیر عددی
         for _c in ['کل_درخواست_ها', 'تعداد_دانشجویان']:
-            if _c in clusters_arak.columns:
-                clusters_arak[_c] = pd.to_numeric(clusters_arak[_c], errors='coerce').fillna(0)
+            if _c in clusters_unit.columns:
+                clusters_unit[_c] = pd.to_numeric(clusters_unit[_c], errors='coerce').fillna(0)
 
-        active = clusters_arak[clusters_arak.get('کل_درخواست_ها', 0) > 0]
-        top_active = active.nlargest(min(15, len(active)), 'کل_درخواست_ها') if 'کل_درخواست_ها' in active.columns else active.head(15)
+        active = clusters_unit[clusters_unit.get('کل_درخواست_ها', 0) > 0]
+        top_active = _top_rows(active, 'کل_درخواست_ها', 15)
         if not top_active.empty:
-            fig_ca = px.bar(top_active, x='کل_درخواست_ها', y=range(len(top_active)), orientation='h', title='۱۵ خوشه پردرخواست اراک', color='کل_درخواست_ها', color_continuous_scale='reds')
+            fig_ca = px.bar(top_active, x='کل_درخواست_ها', y=range(len(top_active)), orientation='h', title=f'۱۵ خوشه پردرخواست {unit_name}', color='کل_درخواست_ها', color_continuous_scale='reds')
             st.plotly_chart(fig_ca, use_container_width=True)
 
-        sample = clusters_arak.sample(n=min(200, len(clusters_arak))) if len(clusters_arak) > 0 else clusters_arak
-        if 'تعداد_دانشجویان' in sample.columns and 'کل_درخواست_ها' in sample.columns:
-            fig_cs = px.scatter(sample, x='تعداد_دانشجویان', y='کل_درخواست_ها', color=sample.get('مقطع', None), size='کل_درخواست_ها', title='رابطه دانشجویان و درخواست‌ها در خوشه‌های اراک')
+        if 'تعداد_دانشجویان' in clusters_unit.columns and 'کل_درخواست_ها' in clusters_unit.columns:
+            degree_col = 'مقطع' if 'مقطع' in clusters_unit.columns else None
+            fig_cs = _reduced_scatter(clusters_unit, 'تعداد_دانشجویان', 'کل_درخواست_ها', stratum=degree_col, color=degree_col, size='کل_درخواست_ها', title=f'رابطه دانشجویان و درخواست‌ها در خوشه‌های {unit_name}')
             st.plotly_chart(fig_cs, use_container_width=True)
 
         _render_paragraph(
-            "گزارش تفصیلی خوشه‌های اراک",
-            """
-این تحلیل بیان می‌کند که کدام خوشه‌ها در اراک بیشترین بار درخواست را تولید می‌کنند و رابطه اندازه خوشه‌ها با شدت تقاضا چگونه است. تمرکز تقاضا بر چند موضوع پرتکرار، لزوم طراحی محتواهای راهنما و پاسخ‌های آماده اختصاصی را برجسته می‌سازد. در چنین شرایطی به‌کارگیری صف هوشمند و منتورشیپ تخصصی می‌تواند از ایجاد گلوگاه جلوگیری کند. نمودار پراکندگی نشان می‌دهد آیا افزایش اندازه خوشه الزاماً به افزایش تقاضا منجر می‌شود یا عوامل دیگری (مانند پیچیدگی موضوعات یا کیفیت راهنماها) دخیل‌اند. با رصد تغییرات این الگوها در زمان، می‌توان تاثیر سیاست‌های آموزشی، اطلاع‌رسانی و خودیاری دانشجویان را ارزیابی کرد. هدف راهبردی آن است که در عین پاسخ به تقاضای واقعی، کیفیت پاسخ و زمان‌بندی در سطح استاندارد حفظ شود و رضایت دانشجویان ارتقا یابد. این گزارش می‌تواند ورودی ارزشمندی برای تخصیص منابع، برنامه‌ریزی کلاس‌های توجیهی و توسعه سامانه‌های سلف‌سرویس در سطح واحد اراک باشد.
+            f"گزارش تفصیلی خوشه‌های {unit_name}",
+            f"""
+این تحلیل بیان می‌کند که کدام خوشه‌ها در {unit_name} بیشترین بار درخواست را تولید می‌کنند و رابطه اندازه خوشه‌ها با شدت تقاضا چگونه است. تمرکز تقاضا بر چند موضوع پرتکرار، لزوم طراحی محتواهای راهنما و پاسخ‌های آماده اختصاصی را برجسته می‌سازد. در چنین شرایطی به‌کارگیری صف هوشمند و منتورشیپ تخصصی می‌تواند از ایجاد گلوگاه جلوگیری کند. نمودار پراکندگی نشان می‌دهد آیا افزایش اندازه خوشه الزاماً به افزایش تقاضا منجر می‌شود یا عوامل دیگری (مانند پیچیدگی موضوعات یا کیفیت راهنماها) دخیل‌اند. با رصد تغییرات این الگوها در زمان، می‌توان تاثیر سیاست‌های آموزشی، اطلاع‌رسانی و خودیاری دانشجویان را ارزیابی کرد. هدف راهبردی آن است که در عین پاسخ به تقاضای واقعی، کیفیت پاسخ و زمان‌بندی در سطح استاندارد حفظ شود و رضایت دانشجویان ارتقا یابد. این گزارش می‌تواند ورودی ارزشمندی برای تخصیص منابع، برنامه‌ریزی کلاس‌های توجیهی و توسعه سامانه‌های سلف‌سرویس در سطح واحد {unit_name} باشد.
             """
         )
     else:
-        st.info('داده خوشه‌های اراک یافت نشد؛ لطفاً صحت ستون «واحد/نام_واحد» در 13.xlsx را بررسی کنید.')
+        st.info(f'داده خوشه‌های {unit_name} یافت نشد؛ لطفاً صحت ستون «واحد/نام_واحد» در 13.xlsx را بررسی کنید.')
 
-    st.markdown("---")
-    # بخش 3: دانشجویان و وضعیت درخواست‌های اراک
-    st.markdown("### 🎓 دانشجویان و وضعیت درخواست‌ها در اراک")
-    if arak_row is not None:
-        done = int(arak_row.get('درخواست_بسته_شده', 0))
-        rej = int(arak_row.get('درخواست_رد_شده', 0))
-        ip = int(arak_row.get('درخواست_در_حال_انجام', 0))
+def _unit_detail_status_section(unit, profile):
+    """بخش 3: دانشجویان و وضعیت درخواست‌های واحد"""
+    unit_name = unit['name']
+    if profile['unit'] is not None:
         fig_st = go.Figure()
-        fig_st.add_trace(go.Bar(name='بسته شده', x=['اراک'], y=[done], marker_color='#27AE60'))
-        fig_st.add_trace(go.Bar(name='رد شده', x=['اراک'], y=[rej], marker_color='#E74C3C'))
-        fig_st.add_trace(go.Bar(name='در حال انجام', x=['اراک'], y=[ip], marker_color='#F39C12'))
-        fig_st.update_layout(barmode='stack', title='وضعیت کلی درخواست‌ها در اراک')
+        for status, count in profile['status'].items():
+            fig_st.add_trace(go.Bar(name=status, x=[unit_name], y=[count], marker_color=UNIT_STATUS_COLORS[status]))
+        fig_st.update_layout(barmode='stack', title=f'وضعیت کلی درخواست‌ها در {unit_name}')
         st.plotly_chart(fig_st, use_container_width=True)
 
         _render_paragraph(
-            "گزارش تفصیلی وضعیت درخواست‌های اراک",
-            """
-نمودار انباشته وضعیت کلی درخواست‌ها در اراک را نمایش می‌دهد و به‌سرعت روشن می‌کند سهم هر وضعیت چگونه است. غلبه بخش «بسته شده» نشانه کیفیت فرآیند و کفایت منابع است، در حالی‌که افزایش «در حال انجام» می‌تواند علامت وجود صف‌ها یا کمبود ظرفیت باشد. در صورت رشد «رد شده»، باید کیفیت ورودی‌ها، دستورالعمل‌ها و معیارهای پذیرش بازنگری شود. پایش دوره‌ای این شاخص‌ها اثر اقدامات اصلاحی را قابل اندازه‌گیری می‌سازد و به چابکی تصمیم‌گیری کمک می‌کند. تعریف آستانه‌های هشدار، اولویت‌بندی رسیدگی به پرونده‌های معطل و تقویت تیم پاسخ در دوره‌های پیک، از الزامات مدیریت کارآمد جریان کار در اراک است. در نهایت، هدف حفظ تعادل پایدار میان سرعت و کیفیت پاسخ و ارتقای تجربه دانشجویان است.
+            f"گزارش تفصیلی وضعیت درخواست‌های {unit_name}",
+            f"""
+نمودار انباشته وضعیت کلی درخواست‌ها در {unit_name} را نمایش می‌دهد و به‌سرعت روشن می‌کند سهم هر وضعیت چگونه است. غلبه بخش «بسته شده» نشانه کیفیت فرآیند و کفایت منابع است، در حالی‌که افزایش «در حال انجام» می‌تواند علامت وجود صف‌ها یا کمبود ظرفیت باشد. در صورت رشد «رد شده»، باید کیفیت ورودی‌ها، دستورالعمل‌ها و معیارهای پذیرش بازنگری شود. پایش دوره‌ای این شاخص‌ها اثر اقدامات اصلاحی را قابل اندازه‌گیری می‌سازد و به چابکی تصمیم‌گیری کمک می‌کند. تعریف آستانه‌های هشدار، اولویت‌بندی رسیدگی به پرونده‌های معطل و تقویت تیم پاسخ در دوره‌های پیک، از الزامات مدیریت کارآمد جریان کار در {unit_name} است. در نهایت، هدف حفظ تعادل پایدار میان سرعت و کیفیت پاسخ و ارتقای تجربه دانشجویان است.
             """
         )
     else:
-        st.info('اطلاعات واحد اراک در جدول واحدها یافت نشد؛ لطفاً 14.xlsx را بررسی و بارگذاری کنید.')
+        st.info(f'اطلاعات واحد {unit_name} در جدول واحدها یافت نشد؛ لطفاً 14.xlsx را بررسی و بارگذاری کنید.')
 
-def create_download_section(supporters_df, units_df, clusters_df):
+def create_download_section(dataset):
     """بخش دانلود گزارش‌ها"""
+    supporters_df, units_df, clusters_df = dataset.supporters, dataset.units, dataset.clusters
     st.markdown("## 📥 دانلود گزارش‌ها")
     
     col1, col2, col3 = st.columns(3)
@@ -1731,6 +1751,12 @@ def create_download_section(supporters_df, units_df, clusters_df):
     
     with col3:
         # دانلود گزارش خوشه‌ها (XLSX یا CSV)
+        clusters_label, clusters_name = "🎯 دانلود گزارش خوشه‌ها", "گزارش_خوشه_ها"
+        if dataset.streaming:
+            # در حالت جریانی فقط نمونه‌ای از سطرها در حافظه است؛ خروجی از مکعب تجمیعی کل فایل ساخته می‌شود
+            st.info(f"فایل خوشه‌ها به‌صورت جریانی خوانده شده ({dataset.clusters_agg['rows']:,} سطر)؛ خروجی سطری در دسترس نیست و تجمیع واحد × مقطع × رشته × باند اندازه دانلود می‌شود.")
+            clusters_df = _cluster_cube_export(dataset.clusters_agg)
+            clusters_label, clusters_name = "🎯 دانلود تجمیع خوشه‌ها", "تجمیع_خوشه_ها"
         xlsx_supported = excel_engine is not None
         if xlsx_supported:
             try:
@@ -1738,9 +1764,9 @@ def create_download_section(supporters_df, units_df, clusters_df):
                 clusters_df.to_excel(clusters_excel, index=False, engine=excel_engine)
                 clusters_excel.seek(0)
                 st.download_button(
-                    label="🎯 دانلود گزارش خوشه‌ها (XLSX)", 
+                    label=f"{clusters_label} (XLSX)",
                     data=clusters_excel,
-                    file_name=f"گزارش_خوشه_ها_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                    file_name=f"{clusters_name}_{datetime.now().strftime('%Y%m%d')}.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                 )
             except Exception:
@@ -1752,225 +1778,2091 @@ def create_download_section(supporters_df, units_df, clusters_df):
             clusters_csv.seek(0)
             st.info("توجه: برای تولید فایل Excel (XLSX) کتابخانه‌هایی مانند openpyxl یا xlsxwriter نیاز است؛ در حال حاضر CSV عرضه می‌شود.")
             st.download_button(
-                label="🎯 دانلود گزارش خوشه‌ها (CSV)", 
+                label=f"{clusters_label} (CSV)",
                 data=clusters_csv,
-                file_name=f"گزارش_خوشه_ها_{datetime.now().strftime('%Y%m%d')}.csv",
+                file_name=f"{clusters_name}_{datetime.now().strftime('%Y%m%d')}.csv",
                 mime="text/csv"
             )
 
-def main():
-    """تابع اصلی اپلیکیشن"""
-    # بارگیری داده‌ها — اجازه می‌دهیم کاربر فایل‌ها را بارگذاری کند (اگر آپلود نشد، داده‌های نمونه می‌آیند)
-    st.sidebar.markdown("## 📁 بارگذاری داده‌ها (اختیاری)")
-    sup_file = st.sidebar.file_uploader("فایل حامیان (CSV/XLSX)", type=['csv', 'xls', 'xlsx'], key='sup')
-    units_file = st.sidebar.file_uploader("فایل واحدها (CSV/XLSX)", type=['csv', 'xls', 'xlsx'], key='units')
-    clusters_file = st.sidebar.file_uploader("فایل خوشه‌ها (CSV/XLSX)", type=['csv', 'xls', 'xlsx'], key='clusters')
+# اندازه پیشوندی از فایل که برای حدس رمزگذاری، جداکننده و سطر سرستون خوانده می‌شود
+CSV_SNIFF_BYTES = 64 * 1024
+CSV_ENCODINGS = ('utf-8', 'cp1256', 'cp1252', 'latin1')
+CSV_SNIFF_ROWS = 50
 
-    def _read_table_with_fallback(uploaded_file):
-        """Read CSV or Excel-like uploads with multiple encoding/engine fallbacks.
-        Returns a DataFrame or None.
-        """
-        if uploaded_file is None:
-            return None
+def _sniff_csv(fileobj):
+    """Guess encoding, delimiter and header row of a CSV from a bounded prefix.
+    Returns a dict with ``encoding``, ``sep`` and ``header_row`` or None when the
+    prefix is not text (e.g. an Excel workbook uploaded with a .csv name).
+    ``header_row`` counts CSV records including blank lines, as ``read_csv(skiprows=...)`` does.
+    """
+    fileobj.seek(0)
+    head = fileobj.read(CSV_SNIFF_BYTES + 1)
+    fileobj.seek(0)
+    complete = len(head) <= CSV_SNIFF_BYTES
+    head = head[:CSV_SNIFF_BYTES]
+    # xlsx (zip) and xls (OLE2) signatures
+    if head.startswith((b'PK\x03\x04', b'\xd0\xcf\x11\xe0')):
+        return None
 
-        name = getattr(uploaded_file, 'name', '') or ''
-        lower = name.lower()
+    text = None
+    encoding = None
+    if head.startswith(codecs.BOM_UTF8):
+        encoding = 'utf-8-sig'
+        text = codecs.getincrementaldecoder('utf-8-sig')().decode(head, final=complete)
+    else:
+        for enc in CSV_ENCODINGS:
+            try:
+                # incremental decoder so a multibyte char cut at the prefix end is not an error
+                text = codecs.getincrementaldecoder(enc)().decode(head, final=complete)
+                encoding = enc
+                break
+            except UnicodeDecodeError:
+                continue
+    if text is None:
+        return None
 
-        # helper: try csv with several encodings
-        def try_csv(fileobj):
-            for enc in ('utf-8', 'cp1256', 'cp1252', 'latin1'):
-                try:
-                    fileobj.seek(0)
-                    return pd.read_csv(fileobj, encoding=enc)
-                except Exception:
-                    continue
+    if not text.strip():
+        return None
+
+    # جداکننده: کاندیدی که بیشترین سطرها با تعداد فیلد یکسان (و بیش از یک فیلد) تولید کند
+    sep, header_row, best_share = ',', 0, 0
+    for cand in (',', ';', '\t', '|'):
+        # رکوردها را خود csv.reader جدا می‌کند تا فیلدهای چندخطی داخل کوتیشن یک رکورد بمانند
+        try:
+            records = list(csv.reader(StringIO(text, newline=''), delimiter=cand))
+        except csv.Error:
+            continue
+        if not complete and len(records) > 1:
+            records = records[:-1]  # last record may be truncated
+        # شماره هر رکورد در میان همه رکوردها (سطرهای خالی هم در skiprows شمرده می‌شوند)
+        rows = [(i, len(row)) for i, row in enumerate(records) if any(f.strip() for f in row)][:CSV_SNIFF_ROWS]
+        if not rows:
+            continue
+        counts = [n for _, n in rows]
+        modal = max(set(counts), key=counts.count)
+        if modal < 2 or counts.count(modal) <= best_share:
+            continue
+        # سطر سرستون: اولین سطر با تعداد فیلد رایج (عنوان‌های بالای خروجی‌ها رد می‌شوند)
+        sep, header_row, best_share = cand, rows[counts.index(modal)][0], counts.count(modal)
+    return {'encoding': encoding, 'sep': sep, 'header_row': header_row}
+
+# نرمال‌سازی متن فارسی: یک جدول ترجمه برای سرستون‌ها، نام واحدها و نام خوشه‌ها
+PERSIAN_TRANSLATION = str.maketrans({
+    **{ch: 'ی' for ch in 'يى'},                      # ی عربی
+    'ك': 'ک',                                        # ک عربی
+    **{ch: None for ch in '\u200c\u200d\u200e\u200f\u0640\ufeff'},  # نیم‌فاصله، اتصال، جهت‌نما، کشیده
+    **{ch: ' ' for ch in '\u00a0\u202f\u2009\t'},    # فاصله‌های نشکن و باریک
+    **{ch: '-' for ch in '\u2010\u2011\u2012\u2013\u2014\u2015\u2212'},  # انواع خط تیره
+    **{d: str(i) for i, d in enumerate('۰۱۲۳۴۵۶۷۸۹')},   # ارقام فارسی
+    **{d: str(i) for i, d in enumerate('٠١٢٣٤٥٦٧٨٩')},   # ارقام عربی
+})
+
+@lru_cache(maxsize=65536)
+def _normalize_text(value, key=False):
+    """Translate one value through PERSIAN_TRANSLATION and collapse whitespace; ``key`` also lower-cases."""
+    text = ' '.join(str(value).translate(PERSIAN_TRANSLATION).split())
+    return text.lower() if key else text
+
+def _normalize_text_series(values, key=False):
+    """Vectorized ``_normalize_text``: each distinct value is translated once; missing values stay missing."""
+    values = pd.Series(values)
+    codes, uniques = pd.factorize(values)
+    normalized = np.array([_normalize_text(v, key) for v in uniques] + [np.nan], dtype=object)
+    return pd.Series(normalized[codes], index=values.index, name=values.name)
+
+def _normalize_categorical(values):
+    """Normalize a categorical Series through its categories; variants of one value are merged."""
+    normalized = _normalize_text_series(values.cat.categories)
+    codes, uniques = pd.factorize(normalized)
+    old = values.cat.codes.to_numpy()
+    new = np.where(old >= 0, codes[np.maximum(old, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(new, categories=uniques), index=values.index, name=values.name)
+
+@lru_cache(maxsize=4096)
+def _normalize_header(name):
+    """Canonical header: normalized text with spaces and dashes as single underscores."""
+    return '_'.join(_normalize_text(name).replace('-', ' ').replace('_', ' ').split())
+
+@lru_cache(maxsize=4096)
+def _squash_header(name):
+    """Header reduced to lower-case letters and digits, for fuzzy token matching."""
+    return ''.join(ch for ch in _normalize_text(name, key=True) if ch.isalnum())
+
+def _normalize_cols(df):
+    """Normalize uploaded header names in place (see ``_normalize_header``)."""
+    df.columns = [_normalize_header(c) for c in df.columns]
+    return df
+
+def _read_table_with_fallback(uploaded_file, report=None):
+    """Read CSV or Excel-like uploads with multiple encoding/engine fallbacks.
+    Returns a DataFrame or None. When ``report`` is a dict it is filled with the
+    reader choices (format, encoding, delimiter, header row).
+    """
+    if uploaded_file is None:
+        return None
+    if report is None:
+        report = {}
+
+    name = getattr(uploaded_file, 'name', '') or ''
+    lower = name.lower()
+
+    # helper: sniff once, parse once; fall back to the encoding loop only if that fails
+    def try_csv(fileobj):
+        sniffed = _sniff_csv(fileobj)
+        if sniffed is not None:
             try:
                 fileobj.seek(0)
-                return pd.read_csv(fileobj, engine='python', encoding='utf-8', sep=',')
+                df = pd.read_csv(fileobj, encoding=sniffed['encoding'], sep=sniffed['sep'],
+                                 skiprows=sniffed['header_row'])
+                report.update(format='csv', **sniffed)
+                return df
             except Exception:
-                return None
-
-        def _normalize_cols(df):
-            cols = []
-            for c in df.columns:
-                s = str(c).strip()
-                s = s.replace('\u00A0', ' ')
-                s = s.replace('\u200C', '')
-                s = s.replace('-', '_')
-                s = s.replace(' ', '_')
-                s = s.replace('ی', 'ی')
-                s = s.replace('__', '_')
-                cols.append(s)
-            df.columns = cols
-            return df
-
-        # If filename indicates Excel, try read_excel first
-        if lower.endswith(('.xls', '.xlsx')):
+                pass
+        for enc in CSV_ENCODINGS:
             try:
-                uploaded_file.seek(0)
-                df = pd.read_excel(uploaded_file)
-                return _normalize_cols(df)
+                fileobj.seek(0)
+                df = pd.read_csv(fileobj, encoding=enc)
+                report.update(format='csv', encoding=enc, sep=',', header_row=0)
+                return df
             except Exception:
-                # fall back to csv attempts
-                try:
-                    uploaded_file.seek(0)
-                    csv_df = try_csv(uploaded_file)
-                    if csv_df is not None:
-                        return _normalize_cols(csv_df)
-                except Exception:
-                    return None
-
-        # otherwise try CSV first, then try Excel
-        csv_df = try_csv(uploaded_file)
-        if csv_df is not None:
-            return _normalize_cols(csv_df)
+                continue
+        try:
+            fileobj.seek(0)
+            df = pd.read_csv(fileobj, engine='python', encoding='utf-8', sep=',')
+            report.update(format='csv', encoding='utf-8', sep=',', header_row=0)
+            return df
+        except Exception:
+            return None
 
-        # last resort: try read_excel
+    # If filename indicates Excel, try read_excel first
+    if lower.endswith(('.xls', '.xlsx')):
         try:
             uploaded_file.seek(0)
             df = pd.read_excel(uploaded_file)
+            report.update(format='excel')
             return _normalize_cols(df)
         except Exception:
-            return None
+            # fall back to csv attempts
+            try:
+                uploaded_file.seek(0)
+                csv_df = try_csv(uploaded_file)
+                if csv_df is not None:
+                    return _normalize_cols(csv_df)
+            except Exception:
+                return None
 
-    def _map_columns(df, expected_cols):
-        # expected_cols is ordered list; try exact match, substring match, then positional map
-        if df is None:
-            return None
-        cols = list(df.columns)
-        # exact match
-        if set(expected_cols).issubset(set(cols)):
-            return df[expected_cols].copy()
-
-        # normalized substring matching
-        import re
-
-        def normalize(s):
-            if s is None:
-                return ''
-            s = str(s).lower()
-            # keep Persian/Arabic letters and ASCII word chars
-            s = re.sub(r"[^\w\u0600-\u06FF]", '', s)
-            return s
-
-        col_norm = {c: normalize(c) for c in cols}
-        exp_norm = {e: normalize(e) for e in expected_cols}
-
-        rename_map = {}
-        for c, cn in col_norm.items():
-            for e, en in exp_norm.items():
-                if en and (en in cn or cn in en):
-                    rename_map[c] = e
-                    break
+    # otherwise try CSV first, then try Excel
+    csv_df = try_csv(uploaded_file)
+    if csv_df is not None:
+        return _normalize_cols(csv_df)
+
+    # last resort: try read_excel
+    try:
+        uploaded_file.seek(0)
+        df = pd.read_excel(uploaded_file)
+        report.update(format='excel')
+        return _normalize_cols(df)
+    except Exception:
+        return None
+
+def _describe_read_report(report):
+    """متن کوتاه فارسی از نحوه خوانده‌شدن یک فایل آپلودی."""
+    if report.get('format') == 'excel':
+        text = 'Excel'
+    else:
+        text = "CSV — رمزگذاری: {} | جداکننده: {} | سطر سرستون: {}".format(
+            report.get('encoding', '?'), repr(report.get('sep', ',')), report.get('header_row', 0) + 1
+        )
+    if report.get('profile'):
+        text += ' | نگاشت از پروفایل'
+    if report.get('memory'):
+        before, after = report['memory']
+        text += f" | حافظه: {before / 2**20:.1f} → {after / 2**20:.1f} MB"
+    return text
+
+# رجیستری شِما: نگاشت هر امضای سرستون به ستون‌های استاندارد یک بار محاسبه و روی دیسک ذخیره می‌شود
+SCHEMA_REGISTRY_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), '.schema_registry.json')
+# با تغییر منطق تطبیق ستون‌ها افزایش یابد تا نگاشت‌های قدیمی دیسک نادیده گرفته شوند
+SCHEMA_MAPPING_VERSION = 1
+
+@st.cache_resource(show_spinner=False)
+def _schema_registry():
+    """Process-wide registry of header mappings and saved profiles, loaded once from disk."""
+    registry = {'signatures': {}, 'profiles': {}, 'lock': threading.Lock(), 'persist': True}
+    try:
+        with open(SCHEMA_REGISTRY_PATH, encoding='utf-8') as f:
+            data = json.load(f)
+        registry['signatures'].update(data.get('signatures', {}))
+        registry['profiles'].update(data.get('profiles', {}))
+    except (OSError, ValueError, AttributeError):
+        pass
+    return registry
+
+def _persist_schema_registry(registry):
+    """Write the registry atomically; a read-only workspace only loses persistence.
+
+    The first failure is logged and turns persistence off for the process, so the
+    registry keeps working in memory without retrying the write for every new header.
+    """
+    if not registry['persist']:
+        return
+    tmp_path = SCHEMA_REGISTRY_PATH + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'signatures': registry['signatures'], 'profiles': registry['profiles']},
+                      f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, SCHEMA_REGISTRY_PATH)
+    except (OSError, TypeError, ValueError):
+        registry['persist'] = False
+        logger.warning('schema registry cannot be saved to %s; keeping it in memory only',
+                       SCHEMA_REGISTRY_PATH, exc_info=True)
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+def _header_signature(cols, expected_cols):
+    payload = json.dumps([SCHEMA_MAPPING_VERSION, [str(c) for c in cols], list(expected_cols)], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def _compute_column_mapping(cols, expected_cols):
+    """Resolve how an upload header maps onto expected_cols (exact, substring/keyword, positional).
+    Returns {'mode': 'exact'|'rename'|'positional'|'partial', 'rename': {source: canonical}}.
+    """
+    # exact match
+    if set(expected_cols).issubset(set(cols)):
+        return {'mode': 'exact', 'rename': {e: e for e in expected_cols}}
+
+    # normalized substring matching (letters and digits only, Persian variants folded)
+    def normalize(s):
+        return '' if s is None else _squash_header(s)
+
+    col_norm = {c: normalize(c) for c in cols}
+    exp_norm = {e: normalize(e) for e in expected_cols}
+
+    rename_map = {}
+    for c, cn in col_norm.items():
+        for e, en in exp_norm.items():
+            if en and (en in cn or cn in en):
+                rename_map[c] = e
+                break
+        if c in rename_map:
+            continue
+
+    # lightweight keyword fallback for common tokens
+    keywords = {
+        'name': ['name', 'نام', 'display'],
+        'email': ['email', 'رایانامه', '@'],
+        'cluster': ['cluster', 'خوشه'],
+        'total': ['کل', 'total', 'requests', 'درخواست'],
+        'new': ['new', 'جدید'],
+        'in_progress': ['in_progress', 'در حال', 'در_حال'],
+        'closed': ['closed', 'بسته', 'تکمیل'],
+        'rejected': ['rejected', 'رد']
+    }
+    for c in cols:
+        if c in rename_map:
+            continue
+        low = c.lower()
+        for token, keys in keywords.items():
+            for k in keys:
+                if k in low:
+                    # map to an expected column that contains a matching token
+                    for e in expected_cols:
+                        if token in normalize(e) or token in e.lower():
+                            rename_map[c] = e
+                            break
+                    if c in rename_map:
+                        break
             if c in rename_map:
+                break
+
+    renamed = [rename_map.get(c, c) for c in cols]
+    if set(expected_cols).issubset(set(renamed)):
+        return {'mode': 'rename', 'rename': rename_map}
+
+    # positional fallback
+    if len(cols) >= len(expected_cols):
+        return {'mode': 'positional', 'rename': dict(zip(cols, expected_cols))}
+
+    # last resort: mapped copy (may be missing some expected cols)
+    return {'mode': 'partial', 'rename': rename_map}
+
+def _resolve_column_mapping(cols, expected_cols):
+    """Look up the mapping for this header signature, computing and persisting it only once."""
+    registry = _schema_registry()
+    sig = _header_signature(cols, expected_cols)
+    mapping = registry['signatures'].get(sig)
+    if mapping is None:
+        mapping = _compute_column_mapping(list(cols), list(expected_cols))
+        with registry['lock']:
+            registry['signatures'][sig] = mapping
+            _persist_schema_registry(registry)
+    return mapping
+
+def _profile_mapping(cols, expected_cols, profile):
+    """Mapping from a saved profile, if every source column of the profile is in this header."""
+    if not profile or not set(profile).issubset(set(cols)):
+        return None
+    mode = 'rename' if set(expected_cols).issubset(set(profile.values())) else 'partial'
+    return {'mode': mode, 'rename': dict(profile)}
+
+def _map_columns(df, expected_cols, profile=None, report=None):
+    # expected_cols is ordered list; mapping comes from a saved profile or the schema registry
+    if df is None:
+        return None
+    cols = list(df.columns)
+    mapping = _profile_mapping(cols, expected_cols, profile)
+    if mapping is None:
+        mapping = _resolve_column_mapping(tuple(cols), tuple(expected_cols))
+    elif report is not None:
+        report['profile'] = True
+    if report is not None:
+        report['columns'] = {src: dst for src, dst in mapping['rename'].items() if dst in expected_cols}
+
+    if mapping['mode'] == 'exact':
+        return df[expected_cols].copy()
+    if mapping['mode'] == 'positional':
+        out = df.iloc[:, :len(expected_cols)].copy()
+        out.columns = expected_cols
+        return out
+    mapped = df.rename(columns=mapping['rename'])
+    if mapping['mode'] == 'rename':
+        return mapped[expected_cols].copy()
+    return mapped.copy()
+
+# جست‌وجوی ستون‌ها در صفحات: نتیجه برای هر مجموعه سرستون یک بار محاسبه و کش می‌شود
+@st.cache_data(max_entries=512, show_spinner=False)
+def _lookup_token_column(cols, tokens_any=(), tokens_all=()):
+    """First column whose squashed lower-case name contains all of tokens_all or any of tokens_any."""
+    for c in cols:
+        low = _squash_header(c)
+        if tokens_all and all(t in low for t in tokens_all):
+            return c
+        if tokens_any and any(t in low for t in tokens_any):
+            return c
+    return None
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _lookup_candidate_column(cols, candidates):
+    """Exact candidate name first, then the first column containing every token of a candidate."""
+    # دقیق
+    for cand in candidates:
+        if cand in cols:
+            return cand
+    # تطبیق توکنی ساده
+    for col in cols:
+        low = _squash_header(col)
+        for cand in candidates:
+            if all(_squash_header(tok) in low for tok in cand.split()):
+                return col
+    return None
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def _lookup_unit_aliases(cols):
+    """Rename map of unit code/name columns to 'کد_واحد' / 'نام_واحد'."""
+    rename = {}
+    for c in cols:
+        c_str = _normalize_text(c)
+        low = _squash_header(c)
+        # detect code+unit
+        if 'کد' in c_str or ('کد' in low and 'واحد' in low) or ('code' in low and 'unit' in low):
+            rename[c] = 'کد_واحد'
+            continue
+        if 'نام' in c_str and 'واحد' in c_str:
+            rename[c] = 'نام_واحد'
+            continue
+        # more robust token scanning
+        if 'نام' in low and 'واحد' in low:
+            rename[c] = 'نام_واحد'
+            continue
+        if 'کد' in low and 'واحد' in low:
+            rename[c] = 'کد_واحد'
+            continue
+    return rename
+
+def _schema_profiles():
+    """Saved column-mapping profiles: {name: {table: {source: canonical}}}."""
+    return _schema_registry()['profiles']
+
+def _save_schema_profile(name, profile):
+    registry = _schema_registry()
+    with registry['lock']:
+        registry['profiles'][name] = profile
+        _persist_schema_registry(registry)
+
+def _ensure_columns(df, expected_cols):
+    """Ensure expected columns exist in df; if missing, create with safe defaults (zeros or empty strings).
+    Returns a DataFrame with all expected_cols present in the same order.
+    """
+    if df is None:
+        return None
+    df = df.copy()
+    for col in expected_cols:
+        if col not in df.columns:
+            # choose default type: numeric -> 0, otherwise empty string
+            df[col] = 0 if any(tok in col for tok in ['تعداد', 'کل', 'درخواست', 'new', 'total', 'rejected']) else ''
+    # reorder
+    try:
+        return df[expected_cols].copy()
+    except Exception:
+        return df.copy()
+
+
+# ستون‌های استاندارد هر جدول و ستون‌هایی که باید عددی شوند
+EXPECTED_SUPPORTERS = ['نام_نمایشی', 'رایانامه', 'خوشه_ها', 'کل_درخواست_ها', 'درخواست_جدید', 'درخواست_در_حال_انجام', 'درخواست_بسته_شده', 'درخواست_رد_شده']
+SUPPORTERS_NUMERIC = ['خوشه_ها','کل_درخواست_ها','درخواست_جدید','درخواست_در_حال_انجام','درخواست_بسته_شده','درخواست_رد_شده']
+EXPECTED_UNITS = ['نام_واحد','کد_واحد','استان','تعداد_دانشجویان','کل_درخواست_ها','درخواست_جدید','درخواست_در_حال_انجام','درخواست_بسته_شده','درخواست_رد_شده']
+UNITS_NUMERIC = ['تعداد_دانشجویان','کل_درخواست_ها','درخواست_جدید','درخواست_در_حال_انجام','درخواست_بسته_شده','درخواست_رد_شده']
+EXPECTED_CLUSTERS = ['نام_خوشه','تعداد_دانشجویان','کل_درخواست_ها','مقطع','رشته','واحد']
+CLUSTERS_NUMERIC = ['تعداد_دانشجویان','کل_درخواست_ها']
+
+# سقف کش فایل‌های آپلودی: تعداد ورودی‌ها (LRU) و حداکثر مجموع حجم؛ برای فایل‌های یک بارگذاری بر حسب
+# حجم خام و برای کل کش فرایند بر حسب حافظه جدول‌های پارس‌شده
+UPLOAD_CACHE_MAX_ENTRIES = 8
+UPLOAD_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# ستون‌های متنی که نسبت مقادیر یکتای آن‌ها از این حد کمتر است به صورت category ذخیره می‌شوند
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+def _compact_dtypes(df):
+    """Downcast integer columns to the smallest type that holds them and store
+    low-cardinality text columns as categoricals.
+    Returns ``(df, (bytes_before, bytes_after))``.
+    """
+    if df is None or df.empty:
+        return df, (0, 0)
+    before = int(df.memory_usage(deep=True).sum())
+    df = df.copy()
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_integer_dtype(values.dtype):
+            df[col] = pd.to_numeric(values, downcast='integer')
+        elif values.dtype == object and values.nunique(dropna=False) <= max(1, len(values) * CATEGORY_MAX_UNIQUE_RATIO):
+            df[col] = values.astype('category')
+    after = int(df.memory_usage(deep=True).sum())
+    return df, (before, after)
+
+# اجزای نام خوشه به ترتیب: مقطع_رشته_واحد_کد
+CLUSTER_NAME_PARTS = ['مقطع', 'رشته', 'واحد', 'کد_خوشه']
+
+def _split_cluster_names(names):
+    """Split cluster names into degree, field, unit and code columns in one vectorized pass.
+    Uses Arrow string kernels (pyarrow is a listed requirement); degree/field/unit come back
+    as categoricals, missing parts become empty strings. Results are aligned to ``names``
+    by position, so any index (e.g. later CSV chunks) keeps its rows.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    try:
+        arr = pa.array(names.to_numpy(dtype=object), type=pa.large_string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        names_str = names.astype(str).where(names.notna(), None)
+        arr = pa.array(names_str.to_numpy(dtype=object), type=pa.large_string(), from_pandas=True)
+    parts = pc.split_pattern(arr, '_', max_splits=len(CLUSTER_NAME_PARTS) - 1)
+    lengths = pc.fill_null(pc.list_value_length(parts), 0).to_numpy()
+    starts = parts.offsets.to_numpy()[:-1]
+    values = parts.values
+
+    out = {}
+    for i, col in enumerate(CLUSTER_NAME_PARTS):
+        present = lengths > i
+        if len(values) == 0 or not present.any():
+            column = pa.array([''] * len(names), type=pa.large_string())
+        else:
+            taken = pc.take(values, pa.array(np.where(present, starts + i, 0)))
+            column = pc.if_else(pa.array(present), taken, pa.scalar('', type=pa.large_string()))
+        if col == 'کد_خوشه':
+            # کد خوشه تقریباً یکتاست؛ دسته‌ای کردن آن سودی ندارد
+            out[col] = column.to_pandas().set_axis(names.index)
+        else:
+            # نرمال‌سازی روی دسته‌ها انجام می‌شود، نه روی سطرها
+            out[col] = _normalize_categorical(column.dictionary_encode().to_pandas().set_axis(names.index))
+    return pd.DataFrame(out, index=names.index)
+
+def _derive_cluster_parts(df):
+    """Fill مقطع/رشته/واحد (and add کد_خوشه) from نام_خوشه where they are missing or blank."""
+    missing = [
+        col for col in CLUSTER_NAME_PARTS
+        if col not in df.columns or df[col].isna().all() or (df[col].astype(str) == '').all()
+    ]
+    if not missing:
+        return df
+    parts = _split_cluster_names(df['نام_خوشه'])
+    df = df.copy()
+    for col in missing:
+        df[col] = parts[col]
+    return df
+
+def _prepare_uploaded_table(df, expected_cols, numeric_cols, profile=None, report=None):
+    """Map, complete and coerce a parsed upload into the canonical schema.
+    Returns None when the upload could not be read or is empty.
+    """
+    if df is None or df.empty:
+        return None
+    df = _map_columns(df, expected_cols, profile, report)
+    df = _ensure_columns(df, expected_cols)
+    # ensure numeric columns
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype(int)
+    if 'نام_خوشه' in df.columns:
+        df = _derive_cluster_parts(df)
+    df, memory = _compact_dtypes(df)
+    if report is not None:
+        report['memory'] = memory
+    return df
+
+def _parse_upload(raw, name, expected_cols, numeric_cols, profile):
+    """Parse one upload into its canonical DataFrame and the reader report."""
+    fileobj = BytesIO(raw)
+    fileobj.name = name
+    report = {}
+    df = _read_table_with_fallback(fileobj, report)
+    return _prepare_uploaded_table(df, list(expected_cols), list(numeric_cols), profile, report), report
+
+@st.cache_resource
+def _upload_cache():
+    """Process-wide LRU of parsed uploads, bounded by the in-memory size of the parsed frames."""
+    return {'entries': OrderedDict(), 'bytes': 0, 'lock': threading.Lock()}
+
+def _parse_upload_cached(digest, name, expected_cols, numeric_cols, profile, raw):
+    """``_parse_upload`` cached on (content digest, file name, expected schema, profile).
+
+    Entries are evicted least recently used beyond ``UPLOAD_CACHE_MAX_ENTRIES`` or
+    ``UPLOAD_CACHE_MAX_BYTES`` of parsed frames; a frame larger than the whole budget is
+    returned without being cached. Callers get copies, so the cached frame is never modified.
+    """
+    cache = _upload_cache()
+    key = (digest, name, tuple(expected_cols), tuple(numeric_cols), json.dumps(profile, sort_keys=True, ensure_ascii=False))
+    with cache['lock']:
+        entry = cache['entries'].get(key)
+        if entry is not None:
+            cache['entries'].move_to_end(key)
+    if entry is None:
+        df, report = _parse_upload(raw, name, expected_cols, numeric_cols, profile)
+        size = int(df.memory_usage(deep=True).sum()) if df is not None else 0
+        if size > UPLOAD_CACHE_MAX_BYTES:
+            return df, report
+        entry = (df, report, size)
+        with cache['lock']:
+            previous = cache['entries'].pop(key, None)
+            if previous is not None:
+                cache['bytes'] -= previous[2]
+            cache['entries'][key] = entry
+            cache['bytes'] += size
+            while len(cache['entries']) > UPLOAD_CACHE_MAX_ENTRIES or cache['bytes'] > UPLOAD_CACHE_MAX_BYTES:
+                _, (_, _, evicted) = cache['entries'].popitem(last=False)
+                cache['bytes'] -= evicted
+    df, report, _ = entry
+    return (df.copy() if df is not None else None), dict(report)
+
+def _upload_cache_flags(files):
+    """Per-file flags: parsed tables are cached only while the upload's cached total fits ``UPLOAD_CACHE_MAX_BYTES``."""
+    flags, total = [], 0
+    for uploaded_file in files:
+        size = getattr(uploaded_file, 'size', 0) or 0
+        fits = uploaded_file is not None and total + size <= UPLOAD_CACHE_MAX_BYTES
+        if fits:
+            total += size
+        flags.append(fits)
+    return flags
+
+def _load_uploaded_table(uploaded_file, expected_cols, numeric_cols, profile=None, cache=True):
+    """Return ``(DataFrame, report)`` for an uploaded file, parsing it only when its content is new."""
+    if uploaded_file is None:
+        return None, {}
+    raw = uploaded_file.getvalue()
+    name = getattr(uploaded_file, 'name', '') or ''
+    digest = hashlib.sha256(raw).hexdigest()
+    if not cache or len(raw) > UPLOAD_CACHE_MAX_BYTES:
+        # فایل‌هایی که از سقف مجموع حجم بیرون می‌زنند کش نمی‌شوند تا حافظه سرور پر نشود
+        df, report = _parse_upload(raw, name, expected_cols, numeric_cols, profile)
+    else:
+        df, report = _parse_upload_cached(digest, name, expected_cols, numeric_cols, profile, raw)
+    report['digest'] = digest
+    return df, report
+
+# حالت جریانی خوشه‌ها: فایل‌های بزرگ‌تر از این حجم به‌طور پیش‌فرض تکه‌تکه خوانده می‌شوند
+CLUSTERS_STREAM_THRESHOLD_BYTES = 50 * 1024 * 1024
+CLUSTERS_STREAM_CHUNK_ROWS = 200_000
+CLUSTERS_TOP_K = 15
+CLUSTERS_SAMPLE_SIZE = 200
+# هیستوگرام دوبعدی (دانشجو، درخواست) برای نمای چگالی نمودار پراکندگی خوشه‌ها
+CLUSTER_PAIR_COLUMNS = ['تعداد_دانشجویان', 'کل_درخواست_ها']
+
+# کاهش نقاط نمودارهای پراکندگی: نمونه لایه‌ای قطعی با حفظ نقاط کرانی، یا چگالی دوبعدی برای N بزرگ
+SCATTER_MAX_POINTS = 2000
+SCATTER_DENSITY_MIN_ROWS = 50_000
+SCATTER_DENSITY_BINS = 60
+SCATTER_OUTLIER_IQR = 3.0
+SCATTER_MODES = {'خودکار': 'auto', 'نمونه لایه‌ای': 'sample', 'چگالی': 'density'}
+SCATTER_DEFAULT_MODE = 'خودکار'
+# از این تعداد نقطه به بالا، نمودار پراکندگی با WebGL (scattergl) رسم می‌شود و نه SVG
+SCATTER_WEBGL_MIN_POINTS = 1000
+
+def _scatter_mode(n_rows):
+    """'sample' or 'density' for a scatter of ``n_rows`` points, following the sidebar choice."""
+    mode = SCATTER_MODES.get(_page_setting('scatter_mode', SCATTER_DEFAULT_MODE), 'auto')
+    if mode == 'auto':
+        mode = 'density' if n_rows > SCATTER_DENSITY_MIN_ROWS else 'sample'
+    return mode
+
+def _scatter_sample(df, x, y, max_points=SCATTER_MAX_POINTS, stratum=None):
+    """Deterministic subset of at most ``max_points`` rows for a scatter of ``x`` against ``y``.
+
+    The minimum/maximum of each axis and points beyond the IQR fences are always kept;
+    the rest is filled per ``stratum`` (proportionally, a missing stratum counting as its own)
+    in the order of a hash of the rows, so the same data always gives the same points.
+    """
+    if len(df) <= max_points:
+        return df
+    values = df[[x, y]].to_numpy(dtype=float)
+    n = len(values)
+    valid = ~np.isnan(values).any(axis=1)
+
+    # نقاط کرانی و پرت (فاصله بیرون از حصارهای IQR، نرمال‌شده با IQR)
+    q1, q3 = np.nanpercentile(values, [25, 75], axis=0)
+    iqr = np.where(q3 > q1, q3 - q1, 1.0)
+    excess = np.maximum(q1 - SCATTER_OUTLIER_IQR * iqr - values, values - q3 - SCATTER_OUTLIER_IQR * iqr) / iqr
+    excess = np.nan_to_num(excess.max(axis=1), nan=-np.inf)
+    outliers = np.flatnonzero(excess > 0)
+    outliers = outliers[np.argsort(-excess[outliers], kind='stable')][:max_points // 4]
+    extremes = [np.nanargmin(values[:, i]) for i in range(2)] + [np.nanargmax(values[:, i]) for i in range(2)] if valid.any() else []
+    keep = np.unique(np.concatenate([np.asarray(extremes, dtype=np.intp), outliers]))
+
+    # بقیه بودجه: سهم متناسب هر لایه، به ترتیب هش سطر
+    rank = pd.util.hash_pandas_object(df[[x, y]], index=True).to_numpy()
+    # مقدار خالی لایه یک لایه جدا است (کد -1 فقط برای سطرهای بدون x/y)
+    if stratum is not None and stratum in df.columns:
+        strata = pd.factorize(df[stratum], use_na_sentinel=False)[0]
+    else:
+        strata = np.zeros(n, dtype=np.intp)
+    strata = np.where(valid, strata, -1)
+    budget = max_points - len(keep)
+    sizes = np.bincount(strata[strata >= 0])
+    quota = np.maximum(1, np.floor(budget * sizes / max(sizes.sum(), 1))).astype(np.intp)
+    order = np.lexsort((rank, strata))
+    ordered = strata[order]
+    starts = np.searchsorted(ordered, np.arange(len(sizes)))
+    pos_in_stratum = np.arange(n) - starts[np.maximum(ordered, 0)]
+    chosen = order[(ordered >= 0) & (pos_in_stratum < quota[np.maximum(ordered, 0)])]
+    chosen = chosen[~np.isin(chosen, keep)]
+    chosen = chosen[np.argsort(rank[chosen], kind='stable')][:max(budget, 0)]
+    return df.iloc[np.sort(np.concatenate([keep, chosen]))]
+
+def _density_figure(xs, ys, weights=None, title=None, labels=None, bins=SCATTER_DENSITY_BINS):
+    """Server-side 2-D histogram drawn as a heatmap; the payload is bins×bins cells whatever the row count."""
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    weights = None if weights is None else np.asarray(weights, dtype=float)
+    valid = ~(np.isnan(xs) | np.isnan(ys))
+    xs, ys = xs[valid], ys[valid]
+    if weights is not None:
+        weights = weights[valid]
+    labels = labels or {}
+    fig = go.Figure()
+    if len(xs):
+        counts, x_edges, y_edges = np.histogram2d(xs, ys, bins=bins, weights=weights)
+        fig.add_trace(go.Heatmap(
+            z=np.where(counts.T > 0, counts.T, np.nan),
+            x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+            colorscale='Viridis', colorbar={'title': 'تعداد'},
+            hovertemplate='%{x:.0f}, %{y:.0f}: %{z:,.0f}<extra></extra>',
+        ))
+    fig.update_layout(title=title, xaxis_title=labels.get('x'), yaxis_title=labels.get('y'))
+    return fig
+
+def _scatter_render_mode(n_points):
+    """``render_mode`` for ``px.scatter``: WebGL from ``SCATTER_WEBGL_MIN_POINTS`` points up."""
+    return 'webgl' if n_points >= SCATTER_WEBGL_MIN_POINTS else 'svg'
+
+def _compact_plot_columns(df, cols, coordinates=()):
+    """``df`` with the numeric plot columns ``cols`` in compact dtypes.
+    Plotly ships numeric numpy arrays as base64 typed arrays (integers already narrowed);
+    object columns would go out as JSON lists. Float64 ``coordinates`` become float32
+    (4 bytes a point) only when that is exact: hover labels read ``%{x}``/``%{y}`` from
+    the same arrays, so a lossy cast would show rounded values.
+    """
+    out = {}
+    for col in dict.fromkeys(c for c in [*cols, *coordinates] if isinstance(c, str) and c in df.columns):
+        values = compact = df[col]
+        if compact.dtype == object:
+            compact = pd.to_numeric(values, errors='coerce')
+            if compact.notna().sum() != values.notna().sum():
                 continue
+        if col in coordinates and compact.dtype == np.float64:
+            narrow = compact.astype(np.float32)
+            if np.array_equal(narrow.to_numpy(), compact.to_numpy(), equal_nan=True):
+                compact = narrow
+        if compact is not values:
+            out[col] = compact
+    return df.assign(**out) if out else df
+
+def _scatter_figure(points, x, y, **px_kwargs):
+    """``px.scatter`` of already-bounded ``points`` with typed-array columns and WebGL when large.
+    Only the x/y coordinates are narrowed; marker size and hover/customdata keep full precision.
+    """
+    points = _compact_plot_columns(points, [px_kwargs.get('size')], coordinates=(x, y))
+    return px.scatter(points, x=x, y=y, render_mode=_scatter_render_mode(len(points)), **px_kwargs)
+
+def _reduced_scatter(df, x, y, stratum=None, **px_kwargs):
+    """``px.scatter`` over a bounded, rerun-stable subset of ``df``, or a density heatmap for large N."""
+    if _scatter_mode(len(df)) == 'density':
+        labels = px_kwargs.get('labels') or {}
+        return _density_figure(df[x], df[y], title=px_kwargs.get('title'),
+                               labels={'x': labels.get(x, x), 'y': labels.get(y, y)})
+    return _scatter_figure(_scatter_sample(df, x, y, stratum=stratum), x, y, **px_kwargs)
+
+# موتور باندبندی: هر باند با نام دسته‌ها و آستانه‌های بین آن‌ها تعریف می‌شود.
+# closed='right': آستانه جزو باند پایینی است (شمارش‌ها)، closed='left': جزو باند بالایی (درصدها).
+BAND_SPECS = {
+    'supporter_workload': {
+        'title': 'حجم کار حامیان (تعداد درخواست)',
+        'names': ['غیرفعال', 'کم‌کار', 'متوسط', 'پرکار', 'بسیار پرکار'],
+        'thresholds': [0, 50, 200, 500], 'closed': 'right', 'unit': '',
+    },
+    'cluster_size': {
+        'title': 'اندازه خوشه (تعداد دانشجو)',
+        'names': ['خالی', 'کوچک', 'متوسط', 'بزرگ', 'بسیار بزرگ'],
+        'thresholds': [0, 10, 30, 50], 'closed': 'right', 'unit': '',
+    },
+    'completion': {
+        'title': 'نرخ تکمیل (%)',
+        'names': ['نیازمند بهبود', 'خوب', 'عالی'],
+        'thresholds': [90, 95], 'closed': 'left', 'unit': '%',
+        'colors': ['#E74C3C', '#F39C12', '#27AE60'],
+    },
+}
 
-        # lightweight keyword fallback for common tokens
-        keywords = {
-            'name': ['name', 'نام', 'display'],
-            'email': ['email', 'رایانامه', '@'],
-            'cluster': ['cluster', 'خوشه'],
-            'total': ['کل', 'total', 'requests', 'درخواست'],
-            'new': ['new', 'جدید'],
-            'in_progress': ['in_progress', 'در حال', 'در_حال'],
-            'closed': ['closed', 'بسته', 'تکمیل'],
-            'rejected': ['rejected', 'رد']
+def _band_labels(spec):
+    """Category labels such as 'کم‌کار (1-50)' or 'عالی (≥95%)' generated from the thresholds."""
+    t, u = spec['thresholds'], spec['unit']
+    if spec['closed'] == 'right':
+        ranges = [f"({t[0]:g}{u})" if t[0] == 0 else f"(≤{t[0]:g}{u})"]
+        ranges += [f"({lo + 1:g}-{hi:g}{u})" for lo, hi in zip(t, t[1:])]
+        ranges.append(f"({t[-1]:g}{u}+)")
+    else:
+        ranges = [f"(<{t[0]:g}{u})"]
+        ranges += [f"({lo:g}-{hi:g}{u})" for lo, hi in zip(t, t[1:])]
+        ranges.append(f"(≥{t[-1]:g}{u})")
+    return [f"{name} {rng}" for name, rng in zip(spec['names'], ranges)]
+
+def _band(values, spec):
+    """Vectorized banding of ``values`` into an ordered categorical (NaN stays missing)."""
+    arr = np.asarray(values, dtype=float)
+    codes = np.searchsorted(np.asarray(spec['thresholds'], dtype=float), arr,
+                            side='left' if spec['closed'] == 'right' else 'right')
+    codes[np.isnan(arr)] = -1
+    bands = pd.Categorical.from_codes(codes, categories=_band_labels(spec), ordered=True)
+    if isinstance(values, pd.Series):
+        return pd.Series(bands, index=values.index, name=values.name)
+    return bands
+
+def _band_counts(hist, spec):
+    """Band a value histogram (value → count) instead of the rows behind it."""
+    return pd.Series(hist.to_numpy(), index=_band(hist.index, spec)).groupby(level=0, observed=False).sum()
+
+def _parse_band_thresholds(text, spec):
+    """Thresholds typed in the sidebar, or ``None`` if they are not the right count or not increasing."""
+    try:
+        values = [float(part) for part in str(text).replace('،', ',').split(',') if part.strip()]
+    except ValueError:
+        return None
+    if len(values) != len(spec['names']) - 1 or any(a >= b for a, b in zip(values, values[1:])):
+        return None
+    return values
+
+def _band_thresholds_text(spec):
+    """Default text of the sidebar thresholds input for ``spec``."""
+    return ', '.join(f"{t:g}" for t in spec['thresholds'])
+
+def _band_spec(name):
+    """Active spec for ``name``: sidebar thresholds when valid, otherwise the defaults."""
+    spec = BAND_SPECS[name]
+    thresholds = _parse_band_thresholds(_page_setting(f'band_thresholds_{name}', _band_thresholds_text(spec)), spec)
+    return dict(spec, thresholds=thresholds) if thresholds else spec
+
+# مکعب تجمیعی خوشه‌ها: ابعاد و سنجه‌ها
+CLUSTER_CUBE_DIMS = ['واحد', 'مقطع', 'رشته', 'باند_اندازه']
+CLUSTER_CUBE_MEASURES = {
+    'count': 'sum', 'students_sum': 'sum', 'requests_sum': 'sum',
+    'students_max': 'max', 'requests_max': 'max', 'active': 'sum', 'zero_requests': 'sum',
+}
+# سرستون‌های خروجی مکعب خوشه‌ها (دانلود در حالت جریانی)
+CLUSTER_CUBE_EXPORT_COLUMNS = {
+    'count': 'تعداد_خوشه', 'students_sum': 'مجموع_دانشجویان', 'requests_sum': 'مجموع_درخواست_ها',
+    'students_max': 'بیشینه_دانشجویان', 'requests_max': 'بیشینه_درخواست_ها',
+    'active': 'خوشه_فعال', 'zero_requests': 'خوشه_بدون_درخواست',
+}
+# خلاصه‌های جریانی هر سلول مکعب: شمارش مقادیر (برای میانه و صدک‌ها) و HyperLogLog نام خوشه‌ها
+CLUSTER_SKETCH_COLUMNS = {'students_sketch': 'تعداد_دانشجویان', 'requests_sketch': 'کل_درخواست_ها'}
+SKETCH_QUANTILES = (0.5, 0.9, 0.99)
+HLL_PRECISION = 8  # ۲۵۶ ثبات در هر سلول؛ خطای نسبی حدود ۶٪
+
+def _cluster_size_band(students):
+    # مکعب با مرزهای پیش‌فرض ساخته می‌شود؛ مرزهای سفارشی سایدبار روی هیستوگرام اعمال می‌شوند
+    return _band(students, BAND_SPECS['cluster_size']).rename('باند_اندازه')
+
+def _cluster_cube_part(chunk):
+    """Cube cells (unit × degree × field × size band) for one canonical clusters chunk."""
+    students = chunk['تعداد_دانشجویان']
+    requests = chunk['کل_درخواست_ها']
+    part = pd.DataFrame({
+        'count': 1, 'students_sum': students, 'requests_sum': requests,
+        'students_max': students, 'requests_max': requests,
+        'active': requests > 0, 'zero_requests': requests == 0,
+    }).groupby(_cluster_cube_keys(chunk), observed=True, dropna=False).agg(CLUSTER_CUBE_MEASURES)
+    # کلیدها به رشته تبدیل می‌شوند تا تکه‌ها با دسته‌های متفاوت قابل ادغام باشند
+    part = part.reset_index()
+    part[CLUSTER_CUBE_DIMS] = part[CLUSTER_CUBE_DIMS].astype(str)
+    return part.set_index(CLUSTER_CUBE_DIMS).astype('int64')
+
+def _cluster_cube_keys(chunk):
+    return [
+        chunk[dim] if dim in chunk.columns else pd.Series('', index=chunk.index, name=dim)
+        for dim in CLUSTER_CUBE_DIMS[:-1]
+    ] + [_cluster_size_band(chunk['تعداد_دانشجویان'])]
+
+def _cube_cell_codes(chunk):
+    """Cube cell number of every row and the cells (string keys, as in the cube) they point to."""
+    grouper = pd.Series(0, index=chunk.index).groupby(_cluster_cube_keys(chunk), observed=True, dropna=False)
+    cells = grouper.size().index
+    cells = pd.MultiIndex.from_arrays(
+        [cells.get_level_values(level).astype(str) for level in range(cells.nlevels)], names=CLUSTER_CUBE_DIMS,
+    )
+    return grouper.ngroup().to_numpy(), cells
+
+def _cell_index(cells, codes, level, values):
+    arrays = [cells.get_level_values(i).take(codes) for i in range(cells.nlevels)]
+    return pd.MultiIndex.from_arrays(arrays + [values], names=CLUSTER_CUBE_DIMS + [level])
+
+def _cube_rollup(cube, dims=()):
+    """Roll the clusters cube up to ``dims`` with counts, sums, means and maxima.
+    With no dims the result is a single grand-total row.
+    """
+    if dims:
+        out = cube.groupby(level=list(dims)).agg(CLUSTER_CUBE_MEASURES)
+    else:
+        out = cube.agg(CLUSTER_CUBE_MEASURES).to_frame().T
+    out = out.fillna(0).astype('int64')
+    count = out['count'].where(out['count'] > 0)
+    out['students_mean'] = (out['students_sum'] / count).fillna(0)
+    out['requests_mean'] = (out['requests_sum'] / count).fillna(0)
+    return out
+
+def _update_cluster_totals(agg):
+    """Refresh the scalar totals of ``agg`` from its cube."""
+    total = _cube_rollup(agg['cube']).iloc[0]
+    agg.update(
+        rows=int(total['count']), active=int(total['active']), zero_requests=int(total['zero_requests']),
+        students_sum=int(total['students_sum']), requests_sum=int(total['requests_sum']),
+        requests_max=int(total['requests_max']),
+    )
+
+def _cluster_cube_export(agg):
+    """One row per cube cell (unit × degree × field × size band) covering every streamed cluster."""
+    out = agg['cube'].rename(columns=CLUSTER_CUBE_EXPORT_COLUMNS)
+    out['نام_یکتا_تخمینی'] = _hll_estimate(agg['names_hll'], CLUSTER_CUBE_DIMS).reindex(out.index).fillna(0).astype('int64')
+    return out.reset_index()
+
+def _pair_counts(chunk):
+    """Count of clusters per (students, requests) pair; mergeable across chunks like the 1-D histograms."""
+    if chunk is None:
+        return pd.Series(dtype='int64', index=pd.MultiIndex.from_arrays([[], []], names=CLUSTER_PAIR_COLUMNS))
+    return chunk[CLUSTER_PAIR_COLUMNS].value_counts(sort=False)
+
+def _cluster_name_hash(chunk):
+    return pd.util.hash_pandas_object(chunk['نام_خوشه'].astype(str), index=False, categorize=False).values
+
+def _empty_sketch(level):
+    index = pd.MultiIndex.from_arrays([[]] * (len(CLUSTER_CUBE_DIMS) + 1), names=CLUSTER_CUBE_DIMS + [level])
+    return pd.Series(dtype='int64', index=index)
+
+def _value_sketch_part(chunk, col, cell_codes=None):
+    """Clusters per (cube cell, value of ``col``): an exact value-count sketch.
+    Counts add across chunks and subtract for removed rows, so per-group quantiles
+    never need the rows again.
+    """
+    if chunk is None or not len(chunk):
+        return _empty_sketch('مقدار')
+    codes, cells = cell_codes or _cube_cell_codes(chunk)
+    values = chunk[col].to_numpy()
+    keep = pd.notna(values)
+    counts = pd.DataFrame({'cell': codes[keep], 'مقدار': values[keep]}).value_counts(sort=False)
+    index = _cell_index(cells, counts.index.get_level_values('cell'), 'مقدار', counts.index.get_level_values('مقدار'))
+    return pd.Series(counts.to_numpy(), index=index, dtype='int64')
+
+def _sketch_update(sketch, added=None, removed=None):
+    """Merge value-count sketches; ``removed`` counts are subtracted and empty values dropped."""
+    out = sketch
+    if added is not None and len(added):
+        out = out.add(added, fill_value=0)
+    if removed is not None and len(removed):
+        out = out.sub(removed, fill_value=0)
+    return out[out > 0].astype('int64')
+
+def _sketch_quantiles(sketch, dims=(), qs=SKETCH_QUANTILES):
+    """Quantiles of a value sketch rolled up to ``dims`` (one row per group, one column per q).
+    Matches ``np.quantile(..., method='inverted_cdf')`` on the original values.
+    """
+    dims = list(dims)
+    counts = sketch.groupby(level=dims + ['مقدار']).sum()
+    if dims:
+        cum = counts.groupby(level=dims).cumsum()
+        total = counts.groupby(level=dims).transform('sum')
+    else:
+        cum = counts.cumsum()
+        total = counts.sum()
+    values = pd.Series(counts.index.get_level_values('مقدار'), index=counts.index)
+    out = {}
+    for q in qs:
+        hit = values[(cum >= q * total).values]
+        if dims:
+            out[q] = hit.groupby(level=dims).first()
+        else:
+            out[q] = hit.iloc[0] if len(hit) else np.nan
+    return pd.DataFrame(out) if dims else pd.Series(out, dtype='float64')
+
+def _hll_keys(codes, hashes):
+    """(cube cell, register) of every row as one integer: ``code * m + register``."""
+    m = 1 << HLL_PRECISION
+    return codes.astype('int64') * m + (hashes & np.uint64(m - 1)).astype('int64')
+
+def _hll_ranks(hashes):
+    """Rank of every hash: position of the first 1 bit after the register bits."""
+    # frexp طول بیتی را می‌دهد؛ صفر ← بیشینه
+    _, bit_length = np.frexp((hashes >> np.uint64(HLL_PRECISION)).astype('float64'))
+    return 64 - HLL_PRECISION - bit_length + 1
+
+def _hll_registers(codes, cells, hashes):
+    """HyperLogLog registers for rows given by their cube cell codes and name hashes."""
+    if not len(codes):
+        return _empty_sketch('ثبات')
+    m = 1 << HLL_PRECISION
+    rank = pd.Series(_hll_ranks(hashes), dtype='int64').groupby(_hll_keys(codes, hashes)).max()
+    index = _cell_index(cells, rank.index // m, 'ثبات', rank.index % m)
+    return pd.Series(rank.to_numpy(), index=index, dtype='int64')
+
+def _hll_part(chunk, cell_codes=None, hashes=None):
+    """HyperLogLog registers of cluster names per cube cell (highest rank seen per register)."""
+    if chunk is None or not len(chunk):
+        return _empty_sketch('ثبات')
+    codes, cells = cell_codes or _cube_cell_codes(chunk)
+    return _hll_registers(codes, cells, _cluster_name_hash(chunk) if hashes is None else hashes)
+
+def _hll_delta(registers, cells, codes, hashes, added_pos, removed_codes, removed_hashes):
+    """Registers after adding the rows at ``added_pos`` and removing the given ones.
+
+    Registers are not subtractable, so only the (cell, register) pairs a removed row hit
+    are rebuilt from the current rows (``codes``/``hashes``) that fall in those pairs.
+    Works on integer keys and rebuilds the labelled index once at the end.
+    """
+    m = 1 << HLL_PRECISION
+    old_keys = (cells.get_indexer(registers.index.droplevel('ثبات')).astype('int64') * m
+                + registers.index.get_level_values('ثبات').to_numpy().astype('int64'))
+    keys = [old_keys, _hll_keys(codes[added_pos], hashes[added_pos])]
+    ranks = [registers.to_numpy(), _hll_ranks(hashes[added_pos])]
+    if len(removed_codes):
+        # فهرست سلول‌ها فقط به انتها افزوده می‌شود، پس کدهای سطرهای حذف‌شده در آن معتبرند
+        touched = np.unique(_hll_keys(removed_codes, removed_hashes))
+        keep = ~np.isin(old_keys, touched)
+        keys[0], ranks[0] = old_keys[keep], ranks[0][keep]
+        rows = np.flatnonzero(np.isin(_hll_keys(codes, hashes), touched))
+        keys.append(_hll_keys(codes[rows], hashes[rows]))
+        ranks.append(_hll_ranks(hashes[rows]))
+    rank = pd.Series(np.concatenate(ranks), dtype='int64').groupby(np.concatenate(keys)).max()
+    index = _cell_index(cells, rank.index // m, 'ثبات', rank.index % m)
+    return pd.Series(rank.to_numpy(), index=index, dtype='int64')
+
+def _hll_merge(*parts):
+    parts = [part for part in parts if part is not None and len(part)]
+    if not parts:
+        return _empty_sketch('ثبات')
+    return pd.concat(parts).groupby(level=CLUSTER_CUBE_DIMS + ['ثبات']).max()
+
+def _hll_estimate(registers, dims=()):
+    """Estimated distinct cluster names per ``dims`` group (a scalar with no dims)."""
+    m = 1 << HLL_PRECISION
+    dims = list(dims)
+    regs = registers.groupby(level=dims + ['ثبات']).max()
+    inverse = np.exp2(-regs.astype('float64'))
+    if dims:
+        grouped = inverse.groupby(level=dims)
+        filled, harmonic = grouped.size(), grouped.sum()
+    else:
+        filled, harmonic = len(regs), inverse.sum()
+    zeros = m - filled
+    raw = 0.7213 / (1 + 1.079 / m) * m * m / (harmonic + zeros)
+    # تصحیح بازه کوچک: شمارش خطی روی ثبات‌های خالی
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    estimate = np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+    if dims:
+        return pd.Series(estimate, index=harmonic.index).round().astype('int64')
+    return int(round(float(estimate))) if filled else 0
+
+def _row_state_append(state, codes, cells, hashes):
+    """Append one chunk's cell codes and name hashes to a per-row state, remapping codes onto a shared cell list."""
+    if state is None:
+        return {'cells': cells, 'codes': [codes.astype('int32')], 'hashes': [hashes]}
+    merged = state['cells'].append(cells[~cells.isin(state['cells'])])
+    return dict(state, cells=merged, codes=state['codes'] + [merged.get_indexer(cells)[codes].astype('int32')],
+                hashes=state['hashes'] + [hashes])
+
+def _cluster_aggregates(chunks, top_k=CLUSTERS_TOP_K, sample_size=CLUSTERS_SAMPLE_SIZE, keep_rows=False):
+    """Fold canonical clusters chunks into running aggregates.
+    Only the aggregate cube, the top-K active clusters, value histograms and a
+    deterministic bounded sample are kept, so memory does not grow with the rows.
+    With ``keep_rows`` (in-memory tables) the cube cell code and name hash of every
+    row are kept as well, so a later delta merge never has to recompute them.
+    """
+    agg = {
+        'cube': None,
+        'students_hist': pd.Series(dtype='int64'),
+        'requests_hist': pd.Series(dtype='int64'),
+        'requests_dist': _cluster_requests_hist(),
+        'pair_hist': _pair_counts(None),
+        'students_sketch': _empty_sketch('مقدار'),
+        'requests_sketch': _empty_sketch('مقدار'),
+        'names_hll': _empty_sketch('ثبات'),
+        'top_active': None,
+        'sample': None,
+    }
+    row_state = None
+
+    for chunk in chunks:
+        if chunk is None or chunk.empty:
+            continue
+        students = chunk['تعداد_دانشجویان']
+        requests = chunk['کل_درخواست_ها']
+
+        part = _cluster_cube_part(chunk)
+        if agg['cube'] is not None:
+            part = pd.concat([agg['cube'], part]).groupby(level=CLUSTER_CUBE_DIMS).agg(CLUSTER_CUBE_MEASURES)
+        agg['cube'] = part
+
+        agg['students_hist'] = agg['students_hist'].add(students.value_counts(), fill_value=0).astype('int64')
+        agg['requests_hist'] = agg['requests_hist'].add(requests.value_counts(), fill_value=0).astype('int64')
+        agg['requests_dist'] = _hist_merge(agg['requests_dist'], _cluster_requests_hist(requests.to_numpy(dtype=float)))
+        agg['pair_hist'] = agg['pair_hist'].add(_pair_counts(chunk), fill_value=0).astype('int64')
+        cell_codes = _cube_cell_codes(chunk)
+        hashes = _cluster_name_hash(chunk)
+        for sketch_key, col in CLUSTER_SKETCH_COLUMNS.items():
+            agg[sketch_key] = _sketch_update(agg[sketch_key], _value_sketch_part(chunk, col, cell_codes))
+        agg['names_hll'] = _hll_merge(agg['names_hll'], _hll_part(chunk, cell_codes, hashes))
+        if keep_rows:
+            row_state = _row_state_append(row_state, *cell_codes, hashes)
+
+        top = chunk[requests > 0].nlargest(top_k, 'کل_درخواست_ها')
+        if agg['top_active'] is not None:
+            top = pd.concat([agg['top_active'], top]).nlargest(top_k, 'کل_درخواست_ها')
+        agg['top_active'] = top
+
+        # نمونه قطعی: سطرهایی با کوچک‌ترین هش نام خوشه (در همه rerunها یکسان است)
+        keyed = chunk.assign(_h=hashes)
+        if agg['sample'] is not None:
+            keyed = pd.concat([agg['sample'], keyed])
+        agg['sample'] = keyed.nsmallest(sample_size, '_h')
+
+    if agg['cube'] is None:
+        agg['cube'] = pd.DataFrame(
+            columns=list(CLUSTER_CUBE_MEASURES), dtype='int64',
+            index=pd.MultiIndex.from_arrays([[]] * len(CLUSTER_CUBE_DIMS), names=CLUSTER_CUBE_DIMS),
+        )
+    _update_cluster_totals(agg)
+    if agg['top_active'] is None:
+        agg['top_active'] = pd.DataFrame(columns=EXPECTED_CLUSTERS)
+    agg['sample'] = (agg['sample'].drop(columns='_h').reset_index(drop=True)
+                     if agg['sample'] is not None else pd.DataFrame(columns=EXPECTED_CLUSTERS))
+    if keep_rows:
+        if row_state is None:
+            row_state = {'cells': _empty_sketch('ثبات').index.droplevel('ثبات'), 'codes': [], 'hashes': []}
+        agg['row_state'] = {
+            'cells': row_state['cells'],
+            'codes': np.concatenate(row_state['codes']) if row_state['codes'] else np.empty(0, dtype='int32'),
+            'hashes': np.concatenate(row_state['hashes']) if row_state['hashes'] else np.empty(0, dtype='uint64'),
         }
-        for c in cols:
-            if c in rename_map:
-                continue
-            low = c.lower()
-            for token, keys in keywords.items():
-                for k in keys:
-                    if k in low:
-                        # map to an expected column that contains a matching token
-                        for e in expected_cols:
-                            if token in normalize(e) or token in e.lower():
-                                rename_map[c] = e
-                                break
-                        if c in rename_map:
-                            break
-                if c in rename_map:
-                    break
+    return agg
+
+def _iter_clusters_csv_chunks(raw, name, report, profile=None):
+    """Yield canonical clusters chunks from a CSV upload without materialising all rows."""
+    fileobj = BytesIO(raw)
+    fileobj.name = name
+    sniffed = _sniff_csv(fileobj) or {'encoding': 'utf-8', 'sep': ',', 'header_row': 0}
+    report.update(format='csv', **sniffed)
+    reader = pd.read_csv(fileobj, encoding=sniffed['encoding'], sep=sniffed['sep'],
+                         skiprows=sniffed['header_row'], chunksize=CLUSTERS_STREAM_CHUNK_ROWS)
+    for chunk in reader:
+        yield _prepare_uploaded_table(_normalize_cols(chunk), EXPECTED_CLUSTERS, CLUSTERS_NUMERIC, profile, report)
+
+@st.cache_data(max_entries=UPLOAD_CACHE_MAX_ENTRIES, show_spinner=False)
+def _stream_cluster_aggregates_cached(digest, name, profile, _raw):
+    """Aggregates of a clusters CSV read in chunks; cached on the content digest."""
+    report = {}
+    agg = _cluster_aggregates(_iter_clusters_csv_chunks(_raw, name, report, profile))
+    report.pop('memory', None)  # حافظه تک‌تک تکه‌ها معنادار نیست
+    return agg, report
+
+def _load_cluster_aggregates(uploaded_file, profile=None):
+    """Return ``(aggregates, report)`` for a clusters CSV in streaming mode."""
+    raw = uploaded_file.getvalue()
+    name = getattr(uploaded_file, 'name', '') or ''
+    digest = hashlib.sha256(raw).hexdigest()
+    agg, report = _stream_cluster_aggregates_cached(digest, name, profile, raw)
+    report['digest'] = digest
+    return agg, report
+
+EXCEL_LOADER_MAX_WORKERS = max(1, min(8, os.cpu_count() or 1))
+
+def _new_excel_pool():
+    """Process pool for openpyxl parsing (CPU-bound, so threads do not help); ``None`` on a single core."""
+    if EXCEL_LOADER_MAX_WORKERS <= 1:
+        return None
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # spawn: امن در کنار نخ‌های سرور Streamlit؛ فقط توابع pandas به کارگرها فرستاده می‌شوند
+    return ProcessPoolExecutor(max_workers=EXCEL_LOADER_MAX_WORKERS,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+def _excel_sheet_names(path):
+    try:
+        with pd.ExcelFile(path) as xls:
+            return list(xls.sheet_names)
+    except Exception:
+        return []
 
-        mapped = df.rename(columns=rename_map)
-        if set(expected_cols).issubset(set(mapped.columns)):
-            return mapped[expected_cols].copy()
+def _read_excel_sheet(path, sheet):
+    """Read one sheet; if the first row is not a usable header, read raw and promote it."""
+    try:
+        return pd.read_excel(path, sheet_name=sheet)
+    except Exception:
+        df = pd.read_excel(path, sheet_name=sheet, header=None)
+        if df.shape[0] > 1:
+            df.columns = df.iloc[0].astype(str)
+            df = df.iloc[1:].reset_index(drop=True).infer_objects()
+        return df
 
-        # positional fallback
-        if df.shape[1] >= len(expected_cols):
-            out = df.iloc[:, :len(expected_cols)].copy()
-            out.columns = expected_cols
-            return out
+def _load_excel_workbooks(paths, pool=None):
+    """Parse every sheet of every existing workbook in ``paths`` concurrently on ``pool``.
 
-        # last resort: return mapped copy (may be missing some expected cols)
-        return mapped.copy()
+    Returns ``({path: {sheet_name: DataFrame}}, pool_broken)`` with normalized column names,
+    sheets in workbook order. Missing or unreadable workbooks are left out. Without a pool
+    (or once it breaks) the sheets are read in-process one by one.
+    """
+    from concurrent.futures.process import BrokenProcessPool
 
-    def _ensure_columns(df, expected_cols):
-        """Ensure expected columns exist in df; if missing, create with safe defaults (zeros or empty strings).
-        Returns a DataFrame with all expected_cols present in the same order.
-        """
+    tasks = [(path, sheet) for path in dict.fromkeys(paths) if os.path.exists(path)
+             for sheet in _excel_sheet_names(path)]
+    frames = {}
+    broken = False
+    if len(tasks) > 1 and pool is not None:
+        try:
+            futures = {task: pool.submit(pd.read_excel, task[0], sheet_name=task[1]) for task in tasks}
+            for task, future in futures.items():
+                try:
+                    frames[task] = future.result()
+                except BrokenProcessPool:
+                    broken = True  # استخر خراب را مالک آن (انبار کارپوشه‌ها) عوض می‌کند
+                    break
+                except Exception:
+                    pass  # در ادامه با تلاش دوباره (هدر خام) در همین پردازه خوانده می‌شود
+        except BrokenProcessPool:
+            broken, frames = True, {}
+        except Exception:
+            logger.exception('excel worker pool failed; reading sheets in-process')
+            frames = {}
+    out = {}
+    for path, sheet in tasks:
+        df = frames.get((path, sheet))
         if df is None:
-            return None
-        df = df.copy()
-        for col in expected_cols:
-            if col not in df.columns:
-                # choose default type: numeric -> 0, otherwise empty string
-                df[col] = 0 if any(tok in col for tok in ['تعداد', 'کل', 'درخواست', 'new', 'total', 'rejected']) else ''
-        # reorder
+            try:
+                df = _read_excel_sheet(path, sheet)
+            except Exception:
+                continue
+        out.setdefault(path, {})[sheet] = _normalize_cols(df)
+    return out, broken
+
+def _first_sheet(workbooks, path):
+    """First sheet of ``path`` from ``_load_excel_workbooks`` output, or ``None``."""
+    sheets = workbooks.get(path) or {}
+    return next(iter(sheets.values()), None)
+
+WORKSPACE_DIR = os.path.abspath(os.path.dirname(__file__))
+# کارپوشه‌هایی که گزارش‌های اراک از کنار برنامه می‌خوانند
+WORKSPACE_WORKBOOKS = (
+    '12.xlsx',
+    '13.xlsx',
+    '14.xlsx',
+    'گزارش خوشه های استان.xlsx',
+    'گزارش_خوشه_های_استان.xlsx',
+)
+WORKSPACE_WATCH_INTERVAL_SEC = 5.0
+
+def _file_stamp(path):
+    """``(mtime_ns, size)`` of ``path``, or ``None`` if it does not exist."""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+def _refresh_workspace_workbooks(store, paths, pool=None):
+    """Re-parse only the workbooks in ``paths`` whose mtime/size changed since the last parse.
+
+    The parse runs outside the store lock; the lock only guards the stamp check and the
+    swap of finished entries, so readers of unchanged workbooks never wait on Excel. A
+    workbook already being parsed by another thread (same stamp) is waited for, not re-read.
+    """
+    stale, pending = [], []
+    with store['lock']:
+        for path in paths:
+            stamp = _file_stamp(path)
+            entry = store['entries'].get(path)
+            if stamp is None:
+                store['entries'].pop(path, None)
+            elif entry is None or entry[0] != stamp:
+                inflight = store['inflight'].get(path)
+                if inflight is not None and inflight[0] == stamp:
+                    pending.append(inflight[1])
+                else:
+                    store['inflight'][path] = (stamp, threading.Event())
+                    stale.append((path, stamp))
+    parsed, broken = None, False
+    try:
+        if stale:
+            parsed, broken = _load_excel_workbooks([path for path, _ in stale], pool)
+    finally:
+        with store['lock']:
+            for path, stamp in stale:
+                # نسخه تازه‌تری که هم‌زمان خوانده شده با نتیجه قدیمی‌تر جایگزین نمی‌شود؛
+                # اگر فایل در حین خواندن عوض شده باشد، دور بعدی ناظر آن را دوباره می‌خواند
+                current = store['entries'].get(path)
+                if parsed is not None and (current is None or current[0] <= stamp):
+                    store['entries'][path] = (stamp, parsed.get(path, {}))
+                store['inflight'].pop(path)[1].set()
+            if broken and store['pool'] is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                store['pool'] = _new_excel_pool()
+    for done in pending:
+        done.wait()
+    with store['lock']:
+        return {path: store['entries'][path][1] for path in paths if path in store['entries']}
+
+def _watch_workspace_workbooks(store, paths):
+    """Watcher loop: refresh ``paths`` every interval until ``store['stop']`` is set."""
+    while not store['stop'].is_set():
         try:
-            return df[expected_cols].copy()
+            _refresh_workspace_workbooks(store, paths, store['pool'])
         except Exception:
-            return df.copy()
+            logger.exception('workspace workbook refresh failed')
+        store['wake'].wait(WORKSPACE_WATCH_INTERVAL_SEC)
+
+def _release_workspace_sources(store):
+    """Stop the watcher and the worker pool of a store evicted from the cache."""
+    store['stop'].set()
+    store['wake'].set()
+    if store['pool'] is not None:
+        store['pool'].shutdown(wait=False, cancel_futures=True)
+
+@st.cache_resource(on_release=_release_workspace_sources)
+def _workspace_sources():
+    """Process-wide parsed workbooks keyed by path, their worker pool, and the background watcher that keeps them fresh."""
+    store = {'entries': {}, 'unit_index': {}, 'inflight': {}, 'lock': threading.Lock(),
+             'wake': threading.Event(), 'stop': threading.Event(), 'pool': _new_excel_pool()}
+    paths = [os.path.join(WORKSPACE_DIR, name) for name in WORKSPACE_WORKBOOKS]
+    threading.Thread(target=_watch_workspace_workbooks, args=(store, paths),
+                     name='workspace-workbook-watcher', daemon=True).start()
+    return store
+
+def _workspace_workbooks(paths):
+    """``{path: {sheet: DataFrame}}`` for the existing workbooks in ``paths``.
+
+    Served from memory while the file's mtime and size are unchanged; a changed file is
+    re-parsed here (or by the watcher, whichever gets there first). Frames are shared
+    across sessions — copy before modifying in place.
+    """
+    store = _workspace_sources()
+    return _refresh_workspace_workbooks(store, list(dict.fromkeys(paths)), store['pool'])
+
+def _workspace_unit_index(path, df):
+    """Unit index over every column of a workspace sheet, built once per parsed frame."""
+    store = _workspace_sources()
+    with store['lock']:
+        cached = store['unit_index'].get(path)
+        if cached is None or cached[0] is not df:
+            index = {}
+            for i, col in enumerate(df.columns):
+                index.setdefault(col, _token_positions(df.iloc[:, i]))
+            cached = store['unit_index'][path] = (df, index)
+    return cached[1]
+
+SUPPORTER_RATE_COLUMNS = ['کل_درخواست_ها', 'درخواست_بسته_شده', 'درخواست_رد_شده']
+
+def _rate(numerator, total):
+    """Percentage rounded to one decimal; zero totals give 0 instead of inf/NaN."""
+    return (numerator / total.replace({0: np.nan}) * 100).round(1).fillna(0)
+
+def _coerce_numeric_column(df, canonical, tokens_any=(), tokens_all=()):
+    """Ensure ``df[canonical]`` is numeric, borrowing a token-matched column or defaulting to 0."""
+    if canonical in df.columns:
+        source = df[canonical]
+    else:
+        c = _lookup_token_column(tuple(df.columns), tuple(tokens_any), tuple(tokens_all))
+        source = df[c] if c is not None else None
+    if source is None:
+        df[canonical] = 0
+    elif pd.api.types.is_numeric_dtype(source):
+        df[canonical] = source.fillna(0)
+    else:
+        df[canonical] = pd.to_numeric(source.astype(str).str.replace(',', ''), errors='coerce').fillna(0)
+
+def _derive_supporters(df):
+    df = df.copy()
+    for col in SUPPORTER_RATE_COLUMNS:
+        if col not in df.columns:
+            df[col] = 0
+    df['نرخ_تکمیل'] = _rate(df['درخواست_بسته_شده'], df['کل_درخواست_ها'])
+    df['نرخ_رد'] = _rate(df['درخواست_رد_شده'], df['کل_درخواست_ها'])
+    return df
+
+def _derive_units(df):
+    df = df.copy()
+    if 'نام_واحد' not in df.columns:
+        # در صورت نبود نام واحد، از اولین ستون متنی یا ایندکس استفاده می‌کنیم
+        text_cols = [c for c in df.columns if df[c].dtype == 'object']
+        df['نام_واحد'] = df[text_cols[0]] if text_cols else df.index.astype(str)
+    df['نام_کوتاه'] = _normalize_text_series(df['نام_واحد'].astype(str)).str.split('-').str[0].str.strip()
+    df['نسبت_درخواست_دانشجو'] = (df['کل_درخواست_ها'] / df['تعداد_دانشجویان']).replace([np.inf, -np.inf], np.nan).fillna(0).round(2)
+    df['نرخ_تکمیل'] = _rate(df['درخواست_بسته_شده'], df['کل_درخواست_ها'])
+    df['نرخ_رد'] = _rate(df['درخواست_رد_شده'], df['کل_درخواست_ها'])
+    return df
+
+def _derive_clusters(df):
+    df = df.copy()
+    _coerce_numeric_column(df, 'کل_درخواست_ها', tokens_any=['درخواست','request','total','کل'], tokens_all=['کل','درخواست'])
+    _coerce_numeric_column(df, 'تعداد_دانشجویان', tokens_any=['دانشجو','student','تعداد'], tokens_all=['تعداد','دانشجو'])
+    return df
+
+@dataclass(frozen=True)
+class Dataset:
+    """Preprocessed tables shared by every page for one data version.
+
+    Built once per version and shared across reruns and sessions, so pages must treat
+    the frames as read-only: derive page-local frames with ``assign``/filters instead of
+    assigning columns in place.
+    """
+    version: tuple
+    supporters: pd.DataFrame
+    units: pd.DataFrame
+    clusters: pd.DataFrame
+    clusters_agg: dict
+    streaming: bool = False
+    # کلید سطرهای هر جدول برای ادغام افزایشی، در اولین استفاده ساخته می‌شود
+    row_keys: dict = field(default_factory=dict)
+    # خلاصه تغییرات نسبت به نسخه پایه: {جدول: {'inserted', 'changed', 'removed'}}
+    delta: dict = None
+    # نمایه عضویت واحد: {جدول: {ستون: {توکن نرمال‌شده: موقعیت سطرها}}}
+    unit_index: dict = field(default_factory=dict)
+    # رتبه‌بندی‌ها: ترتیب مرتب‌سازی و K برتر هر (جدول، سنجه)، در اولین استفاده ساخته می‌شود
+    rankings: dict = field(default_factory=dict)
+    # هیستوگرام‌های هر (جدول، ستون، تعداد بازه، مقیاس)، در اولین استفاده ساخته می‌شود
+    histograms: dict = field(default_factory=dict)
+
+# کلید سطرها برای تشخیص درج، تغییر و حذف بین دو خروجی از یک جدول
+DELTA_KEYS = {'supporters': 'رایانامه', 'units': 'کد_واحد', 'clusters': 'نام_خوشه'}
+# اگر بیش از این سهم از سطرها عوض شده باشد، ساخت کامل ارزان‌تر است
+DELTA_MAX_DIRTY_FRACTION = 0.5
+
+def _row_keys(df, key, verify=True):
+    """Index of ``df[key]``, or ``None`` if the key column is missing or (when ``verify``) not unique."""
+    if df is None or key not in df.columns:
+        return None
+    keys = pd.Index(df[key].to_numpy(), name=key)
+    return keys if not verify or keys.is_unique else None
+
+def _dataset_row_keys(dataset, table):
+    """Row keys of one table of ``dataset``, computed on first use."""
+    if table not in dataset.row_keys:
+        dataset.row_keys[table] = _row_keys(getattr(dataset, table), DELTA_KEYS[table])
+    return dataset.row_keys[table]
+
+# موتور هیستوگرام: مرزهای ثابت (خطی یا لگاریتمی)، قابل ادغام بین تکه‌ها و کش‌شده برای هر نسخه داده
+HIST_BINS = 20
+
+def _hist_edges(lo, hi, bins=HIST_BINS, scale='linear'):
+    """Fixed bin edges over [lo, hi]; 'log' spaces them evenly in log1p (non-negative data)."""
+    lo, hi = float(lo), float(hi)
+    if not hi > lo:
+        hi = lo + 1.0
+    if scale == 'log':
+        return np.expm1(np.linspace(np.log1p(max(lo, 0.0)), np.log1p(max(hi, 0.0)), bins + 1))
+    return np.linspace(lo, hi, bins + 1)
+
+def _hist_new(edges, scale='linear'):
+    """Empty histogram over ``edges``; values outside them are counted in 'below'/'above'."""
+    return {'edges': np.asarray(edges, dtype=float), 'scale': scale,
+            'counts': np.zeros(len(edges) - 1, dtype=np.int64), 'below': 0, 'above': 0, 'missing': 0}
+
+def _hist_update(hist, values):
+    """Fold one chunk of values into ``hist`` (returns a new histogram)."""
+    values = np.asarray(values, dtype=float)
+    finite = np.isfinite(values)
+    inside = values[finite]
+    edges = hist['edges']
+    counts, _ = np.histogram(inside, bins=edges)
+    return dict(hist, counts=hist['counts'] + counts,
+                below=hist['below'] + int((inside < edges[0]).sum()),
+                above=hist['above'] + int((inside > edges[-1]).sum()),
+                missing=hist['missing'] + int((~finite).sum()))
+
+def _hist_merge(a, b, sign=1):
+    """Sum of two histograms built over the same edges (``sign=-1`` takes ``b``'s values back out of ``a``)."""
+    if not np.array_equal(a['edges'], b['edges']):
+        raise ValueError('histograms with different bin edges cannot be merged')
+    return dict(a, counts=a['counts'] + sign * b['counts'], below=a['below'] + sign * b['below'],
+                above=a['above'] + sign * b['above'], missing=a['missing'] + sign * b['missing'])
+
+def _histogram(chunks, edges, scale='linear'):
+    """Histogram of an iterable of value chunks in one pass over fixed ``edges``."""
+    hist = _hist_new(edges, scale)
+    for chunk in chunks:
+        hist = _hist_update(hist, chunk)
+    return hist
+
+# مرزهای ثابت و مستقل از داده برای توزیع درخواست خوشه‌ها، تا هیستوگرام تکه‌ها در حالت جریانی قابل ادغام باشد
+CLUSTER_REQUESTS_HIST_MAX = 10000
+
+def _cluster_requests_hist(values=()):
+    """Log-scale histogram of requests per cluster over fixed edges, for one chunk of values."""
+    edges = _hist_edges(0, CLUSTER_REQUESTS_HIST_MAX, HIST_BINS, 'log')
+    return _hist_update(_hist_new(edges, 'log'), values)
+
+def _values_histogram(values, bins=HIST_BINS, scale='linear'):
+    """Histogram of an in-memory column with edges spanning its finite range."""
+    values = np.asarray(values, dtype=float)
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return None
+    return _histogram([values], _hist_edges(finite.min(), finite.max(), bins, scale), scale)
 
-    # load uploaded or fallback to sample data
-    if sup_file or units_file or clusters_file:
-        sup_df = _read_table_with_fallback(sup_file)
-        tmp_units = _read_table_with_fallback(units_file)
-        units_df = tmp_units if (tmp_units is not None) else pd.DataFrame()
-        tmp_clusters = _read_table_with_fallback(clusters_file)
-        clusters_df = tmp_clusters if (tmp_clusters is not None) else pd.DataFrame()
-
-        # map supporters columns
-        expected_supporters = ['نام_نمایشی', 'رایانامه', 'خوشه_ها', 'کل_درخواست_ها', 'درخواست_جدید', 'درخواست_در_حال_انجام', 'درخواست_بسته_شده', 'درخواست_رد_شده']
-        if sup_df is not None:
-            sup_df = _map_columns(sup_df, expected_supporters)
-            sup_df = _ensure_columns(sup_df, expected_supporters)
-            # ensure numeric columns
-            for col in ['خوشه_ها','کل_درخواست_ها','درخواست_جدید','درخواست_در_حال_انجام','درخواست_بسته_شده','درخواست_رد_شده']:
-                if col in sup_df.columns:
-                    sup_df[col] = pd.to_numeric(sup_df[col], errors='coerce').fillna(0).astype(int)
+def _dataset_histogram(dataset, table, col, bins=HIST_BINS, scale='linear'):
+    """Histogram of one column of ``dataset`` (None if it has no finite values), binned once per version."""
+    key = (table, col, bins, scale)
+    if key not in dataset.histograms:
+        dataset.histograms[key] = _values_histogram(getattr(dataset, table)[col].to_numpy(dtype=float), bins, scale)
+    return dataset.histograms[key]
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_values_histogram(values, bins=HIST_BINS, scale='linear'):
+    """``_values_histogram`` for page-local frames, cached by the values' content."""
+    return _values_histogram(values, bins, scale)
+
+def _histogram_bar(hist, name=None):
+    """Bar trace with one bar per bin, centred on the bin and as wide as it.
+
+    Log-scale histograms get one evenly spaced bar per bin, labelled with its range.
+    """
+    if hist is None:
+        # اگر داده معتبری وجود ندارد، یک سطر صفر نمایش دهیم تا خطا رخ ندهد
+        return go.Bar(x=[0], y=[0], name=name)
+    edges = hist['edges']
+    if hist['scale'] == 'log':
+        labels = [f"{lo:,.0f}–{hi:,.0f}" for lo, hi in zip(edges[:-1], edges[1:])]
+        return go.Bar(x=labels, y=hist['counts'], name=name,
+                      hovertemplate='%{x}: %{y:,}<extra></extra>')
+    return go.Bar(
+        x=(edges[:-1] + edges[1:]) / 2, y=hist['counts'], width=np.diff(edges), name=name,
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate='%{customdata[0]:,.2f} – %{customdata[1]:,.2f}: %{y:,}<extra></extra>',
+    )
+
+# رتبه‌بندی: K برتر با argpartition (O(n) یک بار برای هر نسخه داده) و رندر نمودارهای رتبه‌ای در O(K)
+def _top_positions(values, k):
+    """Positions of the ``k`` largest values, largest first; ties keep the earlier row (as ``nlargest``), NaN is never ranked."""
+    values = np.asarray(values, dtype=float)
+    candidates = np.flatnonzero(~np.isnan(values))
+    k = min(k, len(candidates))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    v = values[candidates]
+    if k < len(candidates):
+        threshold = -np.partition(-v, k - 1)[k - 1]
+        above = np.flatnonzero(v > threshold)
+        ties = np.flatnonzero(v == threshold)[:k - len(above)]
+        keep = np.concatenate([above, ties])
+        candidates, v = candidates[keep], v[keep]
+    return candidates[np.lexsort((candidates, -v))]
+
+def _top_rows(df, col, n):
+    """Top ``n`` rows of ``df`` by ``col`` (the first ``n`` rows if the column is missing)."""
+    return df.take(_top_positions(df[col], n)) if col in df.columns else df.head(n)
+
+def _dataset_order(dataset, table, col, ascending=False):
+    """Rows of one table of ``dataset`` sorted by ``col``; the sort order is computed once per version."""
+    key = ('order', table, col, ascending)
+    df = getattr(dataset, table)
+    if key not in dataset.rankings:
+        values = df[col].to_numpy(dtype=float)
+        dataset.rankings[key] = np.argsort(values if ascending else -values, kind='stable')
+    return df.take(dataset.rankings[key])
+
+def _dataset_top(dataset, table, col, k, positive=False):
+    """Top ``k`` rows of one table by ``col`` (only values > 0 with ``positive``), memoized per version."""
+    key = ('top', table, col, k, positive)
+    df = getattr(dataset, table)
+    if key not in dataset.rankings:
+        top = _top_positions(df[col], k)
+        dataset.rankings[key] = top[df[col].to_numpy()[top] > 0] if positive else top
+    return df.take(dataset.rankings[key])
+
+# نمایه عضویت واحد: نام/کد نرمال‌شده واحد -> موقعیت سطرها در هر جدول، یک بار در زمان ساخت داده
+UNIT_TOKEN_SPLIT = r'[\s\-_/.,،@()]+'
+UNIT_COLUMN_CANDIDATES = ['واحد', 'نام_واحد', 'unit', 'unit_name', 'unitname']
+ARAK_UNIT_CODE = '121'
+
+def _token_positions(column):
+    """``{token: sorted row positions}`` for one column; distinct values are tokenized once, not per row."""
+    codes, uniques = pd.factorize(column)
+    if len(uniques) == 0:
+        return {}
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    text = _normalize_text_series(np.asarray(uniques, dtype=object).astype(str), key=True)
+    tokens = pd.concat([text, text.str.split(UNIT_TOKEN_SPLIT).explode()])
+    tokens = tokens[tokens != '']
+    out = {}
+    for token, members in tokens.groupby(tokens, sort=False).groups.items():
+        members = np.unique(np.asarray(members))
+        rows = [order[bounds[m]:bounds[m + 1]] for m in members]
+        out[token] = rows[0] if len(rows) == 1 else np.sort(np.concatenate(rows))
+    return out
+
+def _unit_column(df):
+    """Column holding the unit in a clusters-like table: a candidate name, else the first column."""
+    if df is None or len(df.columns) == 0:
+        return None
+    normalized = list(_normalize_cols(df.head(0).copy()).columns)
+    col = _lookup_candidate_column(tuple(normalized), tuple(UNIT_COLUMN_CANDIDATES))
+    return df.columns[normalized.index(col) if col is not None else 0]
+
+def _build_unit_index(supporters, units, clusters):
+    """Unit tokens of the unit columns of every table (all units columns; supporters by address)."""
+    index = {'supporters': {}, 'units': {}, 'clusters': {}}
+    if supporters is not None and 'رایانامه' in supporters.columns:
+        index['supporters']['رایانامه'] = _token_positions(supporters['رایانامه'])
+    if units is not None:
+        for i, col in enumerate(units.columns):
+            index['units'].setdefault(col, _token_positions(units.iloc[:, i]))
+    unit_col = _unit_column(clusters)
+    if unit_col is not None:
+        index['clusters'][unit_col] = _token_positions(clusters[unit_col])
+    return index
+
+def _unit_rows(table_index, keys, columns=None, partial=False):
+    """Sorted row positions whose indexed ``columns`` (default: all) carry any of ``keys``.
+
+    ``partial`` also matches tokens that merely contain a key (e.g. a unit code inside an
+    e-mail address); it scans the distinct tokens, not the rows.
+    """
+    keys = [_normalize_text(k, key=True) for k in keys]
+    hits = []
+    for col in (table_index if columns is None else columns):
+        tokens = table_index.get(col) or {}
+        if partial:
+            hits += [rows for token, rows in tokens.items() if any(k in token for k in keys)]
         else:
-            sup_df = None
-
-        # map units columns
-        expected_units = ['نام_واحد','کد_واحد','استان','تعداد_دانشجویان','کل_درخواست_ها','درخواست_جدید','درخواست_در_حال_انجام','درخواست_بسته_شده','درخواست_رد_شده']
-        if units_df is not None and not units_df.empty:
-            units_df = _map_columns(units_df, expected_units)
-            units_df = _ensure_columns(units_df, expected_units)
-            for col in ['تعداد_دانشجویان','کل_درخواست_ها','درخواست_جدید','درخواست_در_حال_انجام','درخواست_بسته_شده','درخواست_رد_شده']:
-                if col in units_df.columns:
-                    units_df[col] = pd.to_numeric(units_df[col], errors='coerce').fillna(0).astype(int)
+            hits += [tokens[k] for k in keys if k in tokens]
+    if not hits:
+        return np.empty(0, dtype=np.intp)
+    return hits[0] if len(hits) == 1 else np.unique(np.concatenate(hits))
+
+# کارپوشه‌ها و ضمیمه‌های workspace (12/13/14) خروجی‌های واحد اراک هستند
+WORKSPACE_UNIT_CODE = ARAK_UNIT_CODE
+# نام‌های جایگزین واحدها در داده‌های لاتین
+UNIT_NAME_ALIASES = {'اراک': ('arak',)}
+UNIT_STATUS_COLUMNS = {'بسته شده': 'درخواست_بسته_شده', 'رد شده': 'درخواست_رد_شده', 'در حال انجام': 'درخواست_در_حال_انجام'}
+UNIT_STATUS_COLORS = {'بسته شده': '#27AE60', 'رد شده': '#E74C3C', 'در حال انجام': '#F39C12'}
+
+def _unit_choices(units_df):
+    """``[{'name', 'code', 'keys', 'label'}]`` for every row of the units table, in table order."""
+    if units_df is None or units_df.empty:
+        return []
+    names = units_df['نام_کوتاه'] if 'نام_کوتاه' in units_df.columns else units_df['نام_واحد'].astype(str).str.split('-').str[0]
+    codes = units_df['کد_واحد'].astype(str) if 'کد_واحد' in units_df.columns else pd.Series('', index=units_df.index)
+    choices = []
+    for name, code in zip(_normalize_text_series(names.astype(str)), _normalize_text_series(codes)):
+        keys = (name,) + UNIT_NAME_ALIASES.get(name, ())
+        choices.append({'name': name, 'code': code, 'keys': keys, 'label': f"{name} ({code})" if code else name})
+    return choices
+
+def _unit_profile(dataset, unit):
+    """Row slices, top supporters/clusters and status counts of one unit, from the unit index."""
+    index = dataset.unit_index
+    unit_rows = _unit_rows(index.get('units', {}), [unit['code']], ['کد_واحد']) if unit['code'] else []
+    if len(unit_rows) == 0:
+        unit_rows = _unit_rows(index.get('units', {}), unit['keys'], ['نام_واحد'])
+    unit_row = dataset.units.iloc[unit_rows[0]] if len(unit_rows) else None
+    unit_rows = unit_rows[:1]
+
+    # حامیان: کد واحد در ایمیل؛ اگر کمتر از سه حامی پیدا شود، کل حامیان نشان داده می‌شوند
+    supporters = dataset.supporters
+    if unit['code']:
+        rows = _unit_rows(index.get('supporters', {}), [unit['code']], ['رایانامه'], partial=True)
+        if len(rows) >= 3:
+            supporters = supporters.iloc[rows]
+    active_supporters = supporters[supporters['کل_درخواست_ها'] > 0] if 'کل_درخواست_ها' in supporters.columns else supporters
+
+    cluster_rows = _unit_rows(index.get('clusters', {}), unit['keys'])
+    clusters = dataset.clusters.iloc[cluster_rows]
+    active_clusters = clusters[clusters['کل_درخواست_ها'] > 0] if 'کل_درخواست_ها' in clusters.columns else clusters
+
+    return {
+        'unit': unit_row,
+        'unit_rows': unit_rows,
+        'supporters': supporters,
+        'cluster_rows': cluster_rows,
+        'clusters': clusters,
+        'top_supporters': _top_rows(active_supporters, 'کل_درخواست_ها', 10),
+        'top_clusters': _top_rows(active_clusters, 'کل_درخواست_ها', 15),
+        'status': {status: int(unit_row.get(col, 0)) if unit_row is not None else 0
+                   for status, col in UNIT_STATUS_COLUMNS.items()},
+    }
+
+def _stored_unit_profile(store, dataset, unit):
+    key = (unit['code'], unit['name'])
+    with store['lock']:
+        profile = store['profiles'].get(key)
+        if profile is None:
+            profile = store['profiles'][key] = _unit_profile(dataset, unit)
+    return profile
+
+def _precompute_unit_profiles(store, dataset):
+    for unit in store['units']:
+        try:
+            _stored_unit_profile(store, dataset, unit)
+        except Exception:
+            pass
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _unit_profiles(version, _dataset):
+    """Per-unit report profiles for one data version, filled by a background worker as soon as data loads."""
+    store = {'units': _unit_choices(_dataset.units), 'profiles': {}, 'lock': threading.Lock()}
+    threading.Thread(target=_precompute_unit_profiles, args=(store, _dataset),
+                     name='unit-profile-precompute', daemon=True).start()
+    return store
+
+def _unit_report_profile(dataset, unit):
+    """Profile of ``unit``: ready if the worker got there first, otherwise computed now and kept."""
+    return _stored_unit_profile(_unit_profiles(dataset.version, dataset), dataset, unit)
+
+def _values_differ(old_col, new_col, old_pos, new_pos):
+    """Elementwise ``old_col[old_pos] != new_col[new_pos]``; NaN equals NaN and categoricals
+    are compared by value even when the two exports have different categories.
+    """
+    if isinstance(old_col.dtype, pd.CategoricalDtype) and isinstance(new_col.dtype, pd.CategoricalDtype):
+        to_new = np.append(new_col.cat.categories.get_indexer(old_col.cat.categories), -1)
+        return to_new[old_col.cat.codes.to_numpy()[old_pos]] != new_col.cat.codes.to_numpy()[new_pos]
+    a = np.asarray(old_col, dtype=object if isinstance(old_col.dtype, pd.CategoricalDtype) else None)[old_pos]
+    b = np.asarray(new_col, dtype=object if isinstance(new_col.dtype, pd.CategoricalDtype) else None)[new_pos]
+    differ = np.asarray(a != b, dtype=bool)
+    if a.dtype.kind not in 'iub' or b.dtype.kind not in 'iub':
+        # فقط خانه‌های متفاوت برای NaN (که با خودش برابر نیست) بررسی می‌شوند
+        idx = np.flatnonzero(differ)
+        differ[idx] = ~(pd.isna(a[idx]) & pd.isna(b[idx]))
+    return differ
+
+def _table_delta(old_df, old_keys, new_df, new_keys):
+    """Positional diff between two exports of a table, or ``None`` when they are not comparable
+    or too much changed for a delta to pay off. Returns boolean masks over the new rows
+    (``inserted``, ``changed``) and the old rows (``stale``: changed or removed), plus
+    ``source``: the old row position of every new row (-1 for inserted rows).
+    """
+    if old_keys is None or new_keys is None or not set(new_df.columns) <= set(old_df.columns):
+        return None
+    source = old_keys.get_indexer(new_keys)
+    inserted = source < 0
+    matched = np.flatnonzero(~inserted)
+    # کلیدهای تازه یکتا هستند اگر هیچ سطر قبلی دو بار جفت نشده باشد و درج‌شده‌ها با هم تکراری نباشند
+    # (بدون ساختن جدول درهم‌سازی دوم روی همه کلیدها)
+    if (np.bincount(source[matched], minlength=len(old_df)) > 1).any() or not new_keys[inserted].is_unique:
+        return None
+    changed_matched = np.zeros(len(matched), dtype=bool)
+    for col in new_df.columns.drop(old_keys.name if old_keys.name in new_df.columns else []):
+        changed_matched |= _values_differ(old_df[col], new_df[col], source[matched], matched)
+    changed = np.zeros(len(new_df), dtype=bool)
+    changed[matched] = changed_matched
+    kept = np.zeros(len(old_df), dtype=bool)
+    kept[source[matched[~changed_matched]]] = True
+    delta = {'inserted': inserted, 'changed': changed, 'stale': ~kept, 'source': source}
+    dirty = int(inserted.sum() + (~kept).sum())
+    if dirty > DELTA_MAX_DIRTY_FRACTION * max(len(new_df), 1):
+        return None
+    return delta
+
+def _delta_summary(delta):
+    changed = int(delta['changed'].sum())
+    return {'inserted': int(delta['inserted'].sum()), 'changed': changed,
+            'removed': int(delta['stale'].sum()) - changed}
+
+def _merge_column(old_col, fresh_col, source, dirty_pos):
+    """``old_col`` gathered at ``source`` with the re-derived values written at ``dirty_pos``.
+    Categoricals keep their categories (new values are appended) and numpy columns their
+    dtype, widened only if a fresh value needs it.
+    """
+    if isinstance(old_col.dtype, pd.CategoricalDtype):
+        fresh = pd.Index(np.asarray(fresh_col, dtype=object))
+        categories = old_col.cat.categories
+        extra = fresh[~fresh.isin(categories) & fresh.notna()].unique()
+        categories = categories.append(extra) if len(extra) else categories
+        codes = old_col.cat.codes.to_numpy().astype('int32')[source]
+        codes[dirty_pos] = categories.get_indexer(fresh)
+        return pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(categories, ordered=old_col.cat.ordered))
+    if isinstance(old_col.dtype, np.dtype) and isinstance(fresh_col.dtype, np.dtype):
+        values = old_col.to_numpy()[source].astype(np.result_type(old_col.dtype, fresh_col.dtype), copy=False)
+        values[dirty_pos] = fresh_col.to_numpy()
+        return values
+    # نوع‌های افزونه دیگر: مسیر عمومی (کندتر) با الحاق و انتخاب
+    positions = source.copy()
+    positions[dirty_pos] = len(old_col) + np.arange(len(dirty_pos))
+    return pd.concat([old_col, fresh_col], ignore_index=True).take(positions).to_numpy()
+
+def _merge_derived(old_derived, new_raw, delta, derive):
+    """Re-derive only inserted/changed rows and reuse the rest from ``old_derived``, in ``new_raw`` order.
+
+    Every column is built with a single positional gather from the old frame, so the
+    merge costs one copy of the table plus the derivation of the dirty rows; the
+    compact dtypes set at ingest (downcast integers, categoricals) are preserved.
+    """
+    dirty_pos = np.flatnonzero(delta['inserted'] | delta['changed'])
+    fresh = derive(new_raw.iloc[dirty_pos])
+    # سطرهای تازه یک موقعیت ساختگی (۰) می‌گیرند که بلافاصله با مقدار بازمحاسبه‌شده بازنویسی می‌شود
+    source = np.where(delta['source'] < 0, 0, delta['source'])
+    if not len(old_derived):
+        return fresh.set_axis(new_raw.index)
+    merged = pd.DataFrame({
+        col: _merge_column(old_derived[col], fresh[col], source, dirty_pos) for col in old_derived.columns
+    }, index=new_raw.index)
+    # ستونی که در خروجی تازه دسته‌ای شده (مثلاً با کاهش تنوع) در نتیجه هم دسته‌ای می‌ماند
+    for col in merged.columns.intersection(new_raw.columns):
+        if isinstance(new_raw[col].dtype, pd.CategoricalDtype) and not isinstance(merged[col].dtype, pd.CategoricalDtype):
+            merged[col] = merged[col].astype('category')
+    return merged
+
+def _cube_delta(cube, removed_rows, added_rows, current_rows, codes, cells):
+    """Apply removed/added clusters rows to ``cube`` without rebuilding it.
+    Sums and counts are adjusted directly; cells that may have lost their maximum are
+    recomputed from the current rows of just those cells, found by their cell ``codes``.
+    """
+    sums = [m for m, how in CLUSTER_CUBE_MEASURES.items() if how == 'sum']
+    maxes = [m for m, how in CLUSTER_CUBE_MEASURES.items() if how == 'max']
+    parts = [cube] + ([_cluster_cube_part(added_rows)] if len(added_rows) else [])
+    merged = pd.concat(parts).groupby(level=CLUSTER_CUBE_DIMS).agg(CLUSTER_CUBE_MEASURES)
+    if not len(removed_rows):
+        return merged
+    minus = _cluster_cube_part(removed_rows).reindex(merged.index, fill_value=0)
+    merged[sums] = merged[sums] - minus[sums]
+    lost_max = (minus['count'] > 0) & (minus[maxes].values >= merged[maxes].values).any(axis=1)
+    merged = merged[merged['count'] > 0]
+    stale = merged.index[lost_max.reindex(merged.index, fill_value=False).values]
+    if len(stale):
+        mask = np.isin(codes, cells.get_indexer(stale))
+        recomputed = pd.DataFrame({
+            'students_max': current_rows['تعداد_دانشجویان'].to_numpy()[mask],
+            'requests_max': current_rows['کل_درخواست_ها'].to_numpy()[mask],
+        }).groupby(codes[mask]).max()
+        recomputed.index = cells[recomputed.index]
+        merged.loc[stale, maxes] = recomputed.reindex(stale)[maxes].fillna(0).astype('int64').values
+    return merged
+
+def _cluster_aggregates_delta(agg, old_clusters, new_clusters, delta,
+                              top_k=CLUSTERS_TOP_K, sample_size=CLUSTERS_SAMPLE_SIZE):
+    """Update cluster aggregates for the inserted/changed/removed rows of ``delta`` only.
+
+    Uses the per-row cell codes and name hashes kept in ``agg['row_state']``: unchanged
+    rows reuse theirs by position, so only the dirty rows are hashed and grouped.
+    """
+    key = DELTA_KEYS['clusters']
+    state = agg['row_state']
+    dirty = delta['inserted'] | delta['changed']
+    dirty_pos, stale_pos = np.flatnonzero(dirty), np.flatnonzero(delta['stale'])
+    removed_rows = old_clusters.iloc[stale_pos]
+    added_rows = new_clusters.iloc[dirty_pos]
+    stale_keys = set(removed_rows[key])
+
+    # کد سلول و هش نام: سطرهای بدون تغییر از وضعیت قبلی برداشته می‌شوند، فقط سطرهای تازه محاسبه می‌شوند
+    added_codes, added_cells = _cube_cell_codes(added_rows)
+    added_hashes = _cluster_name_hash(added_rows)
+    row_state = _row_state_append({'cells': state['cells'], 'codes': [], 'hashes': []},
+                                  added_codes, added_cells, added_hashes)
+    cells = row_state['cells']
+    source = np.where(dirty, 0, delta['source'])
+    codes, hashes = state['codes'][source], state['hashes'][source]
+    codes[dirty_pos], hashes[dirty_pos] = row_state['codes'][0], added_hashes
+    removed_codes, removed_hashes = state['codes'][stale_pos], state['hashes'][stale_pos]
+
+    out = dict(agg)
+    out['row_state'] = {'cells': cells, 'codes': codes, 'hashes': hashes}
+    out['cube'] = _cube_delta(agg['cube'], removed_rows, added_rows, new_clusters, codes, cells)
+    for hist_key, col in (('students_hist', 'تعداد_دانشجویان'), ('requests_hist', 'کل_درخواست_ها')):
+        hist = (agg[hist_key].add(added_rows[col].value_counts(), fill_value=0)
+                .sub(removed_rows[col].value_counts(), fill_value=0))
+        out[hist_key] = hist[hist > 0].astype('int64')
+    out['requests_dist'] = _hist_merge(
+        _hist_merge(agg['requests_dist'], _cluster_requests_hist(added_rows['کل_درخواست_ها'].to_numpy(dtype=float))),
+        _cluster_requests_hist(removed_rows['کل_درخواست_ها'].to_numpy(dtype=float)), sign=-1)
+    pairs = agg['pair_hist'].add(_pair_counts(added_rows), fill_value=0).sub(_pair_counts(removed_rows), fill_value=0)
+    out['pair_hist'] = pairs[pairs > 0].astype('int64')
+    for sketch_key, col in CLUSTER_SKETCH_COLUMNS.items():
+        out[sketch_key] = _sketch_update(agg[sketch_key], _value_sketch_part(added_rows, col, (added_codes, added_cells)),
+                                         _value_sketch_part(removed_rows, col, (removed_codes, cells)))
+    out['names_hll'] = _hll_delta(agg['names_hll'], cells, codes, hashes, dirty_pos, removed_codes, removed_hashes)
+
+    # خوشه‌های برتر و نمونه فقط وقتی از نو ساخته می‌شوند که عضوی از آن‌ها حذف یا تغییر کرده باشد
+    top = agg['top_active']
+    if top[key].isin(stale_keys).any():
+        top = new_clusters[new_clusters['کل_درخواست_ها'] > 0].nlargest(top_k, 'کل_درخواست_ها')
+    else:
+        top = pd.concat([top, added_rows[added_rows['کل_درخواست_ها'] > 0]]).nlargest(top_k, 'کل_درخواست_ها')
+    out['top_active'] = top
+
+    # نمونه: سطرهایی با کوچک‌ترین هش نام، مستقیم از هش‌های نگه‌داشته‌شده (بدون هش دوباره سطرها)
+    k = min(sample_size, len(hashes))
+    smallest = np.argpartition(hashes, k - 1)[:k] if k else np.empty(0, dtype=np.intp)
+    smallest = smallest[np.argsort(hashes[smallest], kind='stable')]
+    out['sample'] = new_clusters.iloc[smallest].reset_index(drop=True)
+
+    _update_cluster_totals(out)
+    return out
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _build_dataset(version, _supporters, _units, _clusters, _clusters_agg=None, _base=None, base_version=None):
+    """Compute all derived metrics once for ``version``; the frames themselves are not hashed.
+
+    With a ``_base`` dataset (a previous export of this session, whose version is passed
+    as ``base_version`` so it is part of the cache key), tables keyed by ``DELTA_KEYS``
+    are diffed row by row and only inserted/changed rows are re-derived and folded into
+    the aggregates.
+    """
+    raw = {'supporters': _supporters, 'units': _units, 'clusters': _clusters}
+    derive = {'supporters': _derive_supporters, 'units': _derive_units, 'clusters': _derive_clusters}
+    streaming = _clusters_agg is not None
+    use_base = _base is not None and not _base.streaming
+
+    frames, deltas, row_keys = {}, {}, {}
+    for table, df in raw.items():
+        delta = None
+        if use_base:
+            # یکتایی کلیدهای تازه را خود _table_delta از روی هم‌ترازی بررسی می‌کند
+            keys = _row_keys(df, DELTA_KEYS[table], verify=False)
+            delta = _table_delta(getattr(_base, table), _dataset_row_keys(_base, table), df, keys)
+            if delta is not None:
+                row_keys[table] = keys
+        if delta is None:
+            frames[table] = derive[table](df)
         else:
-            units_df = None
-
-        # map clusters columns
-        expected_clusters = ['نام_خوشه','تعداد_دانشجویان','کل_درخواست_ها','مقطع','رشته','واحد']
-        if clusters_df is not None and not clusters_df.empty:
-            clusters_df = _map_columns(clusters_df, expected_clusters)
-            clusters_df = _ensure_columns(clusters_df, expected_clusters)
-            for col in ['تعداد_دانشجویان','کل_درخواست_ها']:
-                if col in clusters_df.columns:
-                    clusters_df[col] = pd.to_numeric(clusters_df[col], errors='coerce').fillna(0).astype(int)
+            frames[table] = _merge_derived(getattr(_base, table), df, delta, derive[table])
+            deltas[table] = delta
+
+    if streaming:
+        clusters_agg = _clusters_agg
+    elif 'clusters' in deltas:
+        clusters_agg = _cluster_aggregates_delta(_base.clusters_agg, _base.clusters, frames['clusters'], deltas['clusters'])
+    else:
+        clusters_agg = _cluster_aggregates([frames['clusters']], keep_rows=True)
+
+    return Dataset(
+        version=version,
+        supporters=frames['supporters'],
+        units=frames['units'],
+        clusters=frames['clusters'],
+        clusters_agg=clusters_agg,
+        streaming=streaming,
+        row_keys=row_keys,
+        delta={table: _delta_summary(delta) for table, delta in deltas.items()},
+        unit_index=_build_unit_index(frames['supporters'], frames['units'], frames['clusters']),
+    )
+
+def _session_dataset(state, version, supporters, units, clusters, clusters_agg=None, delta_merge=False):
+    """Dataset for ``version``, reusing this session's last one (and its delta summary) while the version is unchanged.
+
+    ``state`` is the session state; its ``'delta_base'`` is replaced only when the version
+    changes, and with ``delta_merge`` it is the base the new export is diffed against.
+    """
+    base = state.get('delta_base')
+    if base is not None and base.version == version:
+        return base
+    if not delta_merge:
+        base = None
+    dataset = _build_dataset(version, supporters, units, clusters, clusters_agg,
+                             _base=base, base_version=base.version if base is not None else None)
+    state['delta_base'] = dataset
+    return dataset
+
+@st.fragment
+def _summary_details_section():
+    """روند کلی و اهداف خلاصه اجرایی؛ تیک جزئیات فقط همین بخش را دوباره اجرا می‌کند"""
+    show_details = st.checkbox("نمایش جزئیات اضافی", value=True, key='show_details')
+    if show_details:
+        st.markdown("---")
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("### 📈 روند کلی عملکرد")
+            # نمودار روند (شبیه‌سازی شده)
+            dates = pd.date_range(start='2024-01-01', end='2024-12-01', freq='M')
+            trend_data = pd.DataFrame({
+                'تاریخ': dates,
+                'نرخ تکمیل': np.random.normal(94, 2, len(dates)),
+                'تعداد درخواست‌ها': np.random.normal(2800, 200, len(dates))
+            })
+            
+            fig_trend = px.line(trend_data, x='تاریخ', y='نرخ تکمیل', 
+                              title="روند نرخ تکمیل در سال")
+            st.plotly_chart(fig_trend, use_container_width=True)
+        
+        with col2:
+            st.markdown("### 🎯 اهداف و دستاورد")
+            
+            goals_data = {
+                'شاخص': ['نرخ تکمیل', 'زمان پاسخگویی', 'رضایت کاربران'],
+                'هدف': ['95%', '24 ساعت', '85%'],
+                'وضعیت فعلی': ['94.2%', '36 ساعت', '78%'],
+                'وضعیت': ['نزدیک به هدف', 'نیاز به بهبود', 'نیاز به بهبود']
+            }
+            
+            goals_df = pd.DataFrame(goals_data)
+            st.dataframe(goals_df, use_container_width=True, hide_index=True)
+
+@st.fragment
+def _page_view(dataset, page, report_unit):
+    """Main-area body of the selected page; interactions inside it rerun only this fragment."""
+    # تنظیماتی که این صفحه می‌خواند از نو ثبت می‌شوند
+    st.session_state['page_settings'] = {}
+    if page == "🏠 خلاصه اجرایی":
+        display_key_metrics(dataset)
+        
+        _summary_details_section()
+    
+    elif page == "👥 تحلیل حامیان":
+        create_supporters_analysis(dataset)
+    
+    elif page == "🏛️ تحلیل واحدها":
+        create_units_analysis(dataset)
+    
+    elif page == "🎯 تحلیل خوشه‌ها":
+        create_clusters_analysis(dataset)
+    
+    elif page == "🔍 بینش‌ها و پیشنهادات":
+        create_comprehensive_insights(dataset)
+    elif page in ("📋 گزارش واحد", "📌 تحلیل ویژه واحد (کامل)"):
+        if report_unit is None:
+            st.warning('جدول واحدها خالی است؛ واحدی برای گزارش وجود ندارد.')
+        elif page == "📋 گزارش واحد":
+            create_unit_report(dataset, report_unit)
         else:
-            clusters_df = None
+            create_unit_detailed_report(dataset, report_unit)
+    
+    elif page == "📥 دانلود گزارش‌ها":
+        create_download_section(dataset)
+
+@st.fragment
+def _settings_panel():
+    """Sidebar display settings; a change reruns the app only if the current page read that setting."""
+    st.markdown("## 🔧 تنظیمات")
+    # نمودارهای تعاملی همیشه نمایش داده می‌شوند؛ صفحه‌ای به این تیک وابسته نیست
+    st.checkbox("نمایش نمودارهای تعاملی", value=True, key='show_charts')
+
+    st.selectbox(
+        "🔬 نمایش نمودارهای پراکندگی", list(SCATTER_MODES), key='scatter_mode',
+        help=f"خودکار: تا {SCATTER_DENSITY_MIN_ROWS:,} سطر نمونه لایه‌ای قطعی (حداکثر {SCATTER_MAX_POINTS:,} نقطه با حفظ نقاط کرانی)، بیشتر از آن نقشه چگالی."
+    )
+
+    with st.expander("🎚️ مرزهای باندها"):
+        for _name, _spec in BAND_SPECS.items():
+            _text = st.text_input(
+                _spec['title'],
+                value=_band_thresholds_text(_spec),
+                key=f'band_thresholds_{_name}',
+                help=f"{len(_spec['names']) - 1} آستانه صعودی، جداشده با کاما: " + '، '.join(_spec['names']),
+            )
+            if _parse_band_thresholds(_text, _spec) is None:
+                st.caption("⚠️ مرزها نامعتبرند؛ مقادیر پیش‌فرض به کار می‌رود.")
+
+    # اگر صفحه فعلی تنظیمی را خوانده که اکنون تغییر کرده، کل اپ دوباره اجرا می‌شود؛ وگرنه فقط همین پنل
+    used = st.session_state.get('page_settings', {})
+    if any(st.session_state.get(key, value) != value for key, value in used.items()):
+        st.rerun()
+
+def main():
+    """تابع اصلی اپلیکیشن"""
+    # بارگیری داده‌ها — اجازه می‌دهیم کاربر فایل‌ها را بارگذاری کند (اگر آپلود نشد، داده‌های نمونه می‌آیند)
+    st.sidebar.markdown("## 📁 بارگذاری داده‌ها (اختیاری)")
+    sup_file = st.sidebar.file_uploader("فایل حامیان (CSV/XLSX)", type=['csv', 'xls', 'xlsx'], key='sup')
+    units_file = st.sidebar.file_uploader("فایل واحدها (CSV/XLSX)", type=['csv', 'xls', 'xlsx'], key='units')
+    clusters_file = st.sidebar.file_uploader("فایل خوشه‌ها (CSV/XLSX)", type=['csv', 'xls', 'xlsx'], key='clusters')
+    stream_clusters = False
+    if clusters_file is not None and (clusters_file.name or '').lower().endswith('.csv'):
+        stream_clusters = st.sidebar.checkbox(
+            "🌊 خواندن جریانی فایل خوشه‌ها",
+            value=clusters_file.size > CLUSTERS_STREAM_THRESHOLD_BYTES,
+            help="فایل تکه‌تکه خوانده می‌شود و فقط تجمیع‌ها (شمارش‌ها، مجموع‌ها، خوشه‌های برتر و هیستوگرام‌ها) در حافظه می‌مانند."
+        )
+    clusters_agg = None
+    data_version = ('sample',)
+    delta_merge = st.sidebar.checkbox(
+        "🔁 ادغام افزایشی با نسخه قبلی",
+        value=False,
+        help="خروجی تازه با نسخه قبلی بر اساس کلید هر جدول (رایانامه، کد واحد، نام خوشه) مقایسه می‌شود و فقط سطرهای درج‌شده، تغییرکرده و حذف‌شده دوباره پردازش می‌شوند."
+    )
+
+    # load uploaded or fallback to sample data
+    if sup_file or units_file or clusters_file:
+        # پروفایل نگاشت ستون‌ها برای قالب‌های خروجی تکراری (در غیر این صورت رجیستری شِما تصمیم می‌گیرد)
+        profiles = _schema_profiles()
+        profile_name = st.sidebar.selectbox("🗂️ پروفایل نگاشت ستون‌ها", ['خودکار'] + sorted(profiles))
+        active_profile = profiles.get(profile_name, {})
+
+        # نتیجه پردازش هر فایل بر اساس هش محتوای آن کش می‌شود؛ rerunها فقط یک lookup هستند.
+        # سقف حجم کش روی مجموع فایل‌ها اعمال می‌شود (خوشه‌های جریانی فقط تجمیع‌ها را کش می‌کنند و حساب نمی‌شوند)
+        cache_sup, cache_units, cache_clusters = _upload_cache_flags(
+            [sup_file, units_file, None if stream_clusters else clusters_file])
+        sup_df, sup_report = _load_uploaded_table(sup_file, EXPECTED_SUPPORTERS, SUPPORTERS_NUMERIC, active_profile.get('supporters'), cache_sup)
+        units_df, units_report = _load_uploaded_table(units_file, EXPECTED_UNITS, UNITS_NUMERIC, active_profile.get('units'), cache_units)
+        if stream_clusters:
+            clusters_agg, clusters_report = _load_cluster_aggregates(clusters_file, active_profile.get('clusters'))
+            # صفحات سطرمحور فقط نمونه محدود خوشه‌ها را می‌بینند
+            clusters_df = clusters_agg['sample']
+            if clusters_agg['rows'] == 0:
+                clusters_agg = None
+        else:
+            clusters_df, clusters_report = _load_uploaded_table(clusters_file, EXPECTED_CLUSTERS, CLUSTERS_NUMERIC, active_profile.get('clusters'), cache_clusters)
+        # گزارش انتخاب‌های خواننده (رمزگذاری، جداکننده، سطر سرستون) برای هر فایل
+        for _label, _report in (('حامیان', sup_report), ('واحدها', units_report), ('خوشه‌ها', clusters_report)):
+            if _report:
+                st.sidebar.caption(f"📄 {_label}: {_describe_read_report(_report)}")
+
+        with st.sidebar.expander("💾 ذخیره نگاشت فعلی به‌عنوان پروفایل"):
+            new_profile = st.text_input("نام پروفایل", key='schema_profile_name')
+            if st.button("ذخیره پروفایل", key='schema_profile_save') and new_profile.strip():
+                _save_schema_profile(new_profile.strip(), {
+                    table: report['columns']
+                    for table, report in (('supporters', sup_report), ('units', units_report), ('clusters', clusters_report))
+                    if report.get('columns')
+                })
+                st.success(f"پروفایل «{new_profile.strip()}» ذخیره شد.")
 
         # if any required df is None, fallback to sample for missing ones
         sample_sup, sample_units, sample_clusters = load_sample_data()
         supporters_df = sup_df if (sup_df is not None and not sup_df.empty) else sample_sup
         units_df = units_df if (units_df is not None and not units_df.empty) else sample_units
         clusters_df = clusters_df if (clusters_df is not None and not clusters_df.empty) else sample_clusters
-        # ذخیره داده‌های آپلودشده برای استفاده در گزارش اراک
+        # نسخه داده: محتوای هر فایل، حالت جریانی و پروفایل نگاشت
+        data_version = (
+            sup_report.get('digest'), units_report.get('digest'), clusters_report.get('digest'),
+            stream_clusters, json.dumps(active_profile, sort_keys=True, ensure_ascii=False),
+        )
+        # ذخیره داده‌های آپلودشده برای استفاده در گزارش واحد
         try:
             st.session_state['uploaded_sup_df'] = sup_df
             st.session_state['uploaded_units_df'] = units_df
@@ -1981,6 +3873,15 @@ def main():
         # no uploads — use sample data
         supporters_df, units_df, clusters_df = load_sample_data()
 
+    # شاخص‌های مشتق یک بار برای هر نسخه داده ساخته و بین همه صفحات به اشتراک گذاشته می‌شوند
+    # پایه ادغام افزایشی آخرین داده همین نشست است (نه داده نشست‌های دیگر)
+    dataset = _session_dataset(st.session_state, data_version, supporters_df, units_df, clusters_df,
+                               clusters_agg, delta_merge)
+    for _table, _label in (('supporters', 'حامیان'), ('units', 'واحدها'), ('clusters', 'خوشه‌ها')):
+        _d = (dataset.delta or {}).get(_table)
+        if _d:
+            st.sidebar.caption(f"🔁 {_label}: {_d['inserted']:,} درج، {_d['changed']:,} تغییر، {_d['removed']:,} حذف")
+
     # هدر اصلی
     create_main_header()
     
@@ -1995,71 +3896,28 @@ def main():
             "🏛️ تحلیل واحدها",
             "🎯 تحلیل خوشه‌ها",
             "🔍 بینش‌ها و پیشنهادات",
-            "📋 گزارش واحد اراک",
-            "📌 تحلیل ویژه اراک (کامل)",
+            "📋 گزارش واحد",
+            "📌 تحلیل ویژه واحد (کامل)",
             "📥 دانلود گزارش‌ها"
         ]
     )
     
-    # فیلترهای جانبی
-    st.sidebar.markdown("## 🔧 تنظیمات")
-    
-    show_details = st.sidebar.checkbox("نمایش جزئیات اضافی", value=True)
-    show_charts = st.sidebar.checkbox("نمایش نمودارهای تعاملی", value=True) 
-    
-    # نمایش محتوا بر اساس انتخاب کاربر
-    if page == "🏠 خلاصه اجرایی":
-        display_key_metrics(supporters_df, units_df, clusters_df)
-        
-        if show_details:
-            st.markdown("---")
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("### 📈 روند کلی عملکرد")
-                # نمودار روند (شبیه‌سازی شده)
-                dates = pd.date_range(start='2024-01-01', end='2024-12-01', freq='M')
-                trend_data = pd.DataFrame({
-                    'تاریخ': dates,
-                    'نرخ تکمیل': np.random.normal(94, 2, len(dates)),
-                    'تعداد درخواست‌ها': np.random.normal(2800, 200, len(dates))
-                })
-                
-                fig_trend = px.line(trend_data, x='تاریخ', y='نرخ تکمیل', 
-                                  title="روند نرخ تکمیل در سال")
-                st.plotly_chart(fig_trend, use_container_width=True)
-            
-            with col2:
-                st.markdown("### 🎯 اهداف و دستاورد")
-                
-                goals_data = {
-                    'شاخص': ['نرخ تکمیل', 'زمان پاسخگویی', 'رضایت کاربران'],
-                    'هدف': ['95%', '24 ساعت', '85%'],
-                    'وضعیت فعلی': ['94.2%', '36 ساعت', '78%'],
-                    'وضعیت': ['نزدیک به هدف', 'نیاز به بهبود', 'نیاز به بهبود']
-                }
-                
-                goals_df = pd.DataFrame(goals_data)
-                st.dataframe(goals_df, use_container_width=True, hide_index=True)
-    
-    elif page == "👥 تحلیل حامیان":
-        create_supporters_analysis(supporters_df)
-    
-    elif page == "🏛️ تحلیل واحدها":
-        create_units_analysis(units_df)
-    
-    elif page == "🎯 تحلیل خوشه‌ها":
-        create_clusters_analysis(clusters_df)
-    
-    elif page == "🔍 بینش‌ها و پیشنهادات":
-        create_comprehensive_insights(supporters_df, units_df, clusters_df)
-    elif page == "📋 گزارش واحد اراک":
-        create_arak_report(supporters_df, units_df, clusters_df)
-    elif page == "📌 تحلیل ویژه اراک (کامل)":
-        create_arak_detailed_report(supporters_df, units_df, clusters_df)
-    
-    elif page == "📥 دانلود گزارش‌ها":
-        create_download_section(supporters_df, units_df, clusters_df)
+    # واحد گزارش‌های واحد؛ برش‌های همه واحدها پس از بارگذاری در پس‌زمینه آماده می‌شوند
+    unit_choices = _unit_profiles(dataset.version, dataset)['units']
+    report_unit = None
+    if page in ("📋 گزارش واحد", "📌 تحلیل ویژه واحد (کامل)") and unit_choices:
+        default_unit = next((i for i, u in enumerate(unit_choices) if u['code'] == WORKSPACE_UNIT_CODE), 0)
+        report_unit = st.sidebar.selectbox(
+            "🏢 واحد گزارش:", unit_choices, index=default_unit,
+            format_func=lambda u: u['label'], key='report_unit'
+        )
+
+    # محتوای صفحه در یک فرگمنت: ویجت‌های درون صفحه (بخش‌های تنبل، رادیوها، دکمه‌های دانلود) فقط همین بخش را دوباره اجرا می‌کنند
+    _page_view(dataset, page, report_unit)
+
+    # تنظیمات نمایش در فرگمنت ساید بار؛ بعد از صفحه اجرا می‌شود تا وابستگی‌های همین اجرا ثبت شده باشند
+    with st.sidebar:
+        _settings_panel()
     
     # فوتر
     st.markdown("---")
@@ -2078,12 +3936,58 @@ def main():
     **آمار داده‌ها:**
     - حامیان: {len(supporters_df):,}
     - واحدها: {len(units_df):,}  
-    - خوشه‌ها: {len(clusters_df):,}
+    - خوشه‌ها: {dataset.clusters_agg['rows']:,}
     - آخرین بروزرسانی: {datetime.now().strftime('%H:%M')}
     """)
     
     st.sidebar.success("✅ تمام داده‌ها بارگیری شد")
 
-if __name__ == "__main__":
+# بنچمارک راه‌اندازی: ماژول‌های اولیه پیش از نخستین رندر و ماژول‌های تنبل
+STARTUP_EAGER_MODULES = ('streamlit', 'pandas', 'numpy')
+STARTUP_LAZY_MODULES = ('plotly.express', 'plotly.graph_objects', 'plotly.subplots', 'openpyxl')
+
+def _import_time_ms(module, preload=()):
+    """Cumulative cold import time of ``module`` in a fresh interpreter after ``preload`` (``-X importtime``)."""
+    code = ''.join(f'import {name}\n' for name in (*preload, module))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module and parts[1].isdigit():
+            return int(parts[1]) / 1000
+    return float('nan')
+
+def _startup_benchmark():
+    """Print per-module import times and the cold start of this script up to ``main()``."""
+    print('module                      cold import (ms)')
+    for module in STARTUP_EAGER_MODULES:
+        print(f'{module:<28}{_import_time_ms(module):>10.1f}')
+    print('-- lazy (after the eager modules) --')
+    for module in STARTUP_LAZY_MODULES:
+        print(f'{module:<28}{_import_time_ms(module, STARTUP_EAGER_MODULES):>10.1f}')
+
+    # اجرای بدنه اسکریپت (بدون main) در مفسر تازه: زمان تا آمادگی رندر و ماژول‌های تنبلی که خود اسکریپت
+    # بارگذاری کرده (ماژول‌هایی که خود streamlit از پیش وارد می‌کند حساب نمی‌شوند)
+    probe = (
+        'import runpy, sys, time\n'
+        't = time.perf_counter()\n'
+        + ''.join(f'import {name}\n' for name in STARTUP_EAGER_MODULES)
+        + 'before = set(sys.modules)\n'
+        + f'runpy.run_path({os.path.abspath(__file__)!r}, run_name="__startup__")\n'
+        'print(round((time.perf_counter() - t) * 1000, 1))\n'
+        f'print(",".join(m for m in {STARTUP_LAZY_MODULES!r} if m in sys.modules and m not in before))\n'
+    )
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True)
+    total = (time.perf_counter() - started) * 1000
+    lines = result.stdout.strip().splitlines()
+    if result.returncode != 0 or not lines:
+        print('script cold start failed:', result.stderr.strip().splitlines()[-1:] or result.returncode)
+        return
+    print(f'script body (imports + setup) {float(lines[0]):>8.1f} ms, process total {total:.1f} ms')
+    print('lazy modules loaded at start:', (lines[1] if len(lines) > 1 else '') or 'none')
 
-    main()
+if __name__ == "__main__":
+    if '--startup-benchmark' in sys.argv[1:]:
+        _startup_benchmark()
+    else:
+        main()
@@ -0,0 +1,76 @@
+"""The banding engine must reproduce the hard-coded classifiers it replaced, labels included."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+# برچسب‌ها و دسته‌بندهای پیشین، همان‌طور که پیش از موتور باندبندی در کد بودند
+OLD_CLUSTER_SIZE_BINS = [-np.inf, 0, 10, 30, 50, np.inf]
+OLD_CLUSTER_SIZE_LABELS = ['خالی (0)', 'کوچک (1-10)', 'متوسط (11-30)', 'بزرگ (31-50)', 'بسیار بزرگ (50+)']
+
+
+def _old_supporter_category(count):
+    if count == 0: return 'غیرفعال (0)'
+    elif count <= 50: return 'کم‌کار (1-50)'
+    elif count <= 200: return 'متوسط (51-200)'
+    elif count <= 500: return 'پرکار (201-500)'
+    else: return 'بسیار پرکار (500+)'
+
+
+def _old_completion_color(x):
+    return 'عالی (≥95%)' if x >= 95 else 'خوب (90-95%)' if x >= 90 else 'نیازمند بهبود (<90%)'
+
+
+def test_default_labels_match_the_old_hard_coded_ones():
+    assert chart2._band_labels(chart2.BAND_SPECS['cluster_size']) == OLD_CLUSTER_SIZE_LABELS
+    assert chart2._band_labels(chart2.BAND_SPECS['supporter_workload']) == [
+        'غیرفعال (0)', 'کم‌کار (1-50)', 'متوسط (51-200)', 'پرکار (201-500)', 'بسیار پرکار (500+)']
+    assert chart2._band_labels(chart2.BAND_SPECS['completion']) == [
+        'نیازمند بهبود (<90%)', 'خوب (90-95%)', 'عالی (≥95%)']
+
+
+def test_supporter_workload_matches_old_classifier():
+    counts = pd.Series([0, 1, 49, 50, 51, 199, 200, 201, 499, 500, 501, 10_000])
+    bands = chart2._band(counts, chart2.BAND_SPECS['supporter_workload'])
+    assert bands.astype(str).tolist() == counts.map(_old_supporter_category).tolist()
+
+
+def test_cluster_size_matches_old_cut():
+    students = pd.Series([0, 1, 10, 11, 30, 31, 50, 51, 400])
+    bands = chart2._band(students, chart2.BAND_SPECS['cluster_size'])
+    old = pd.cut(students, bins=OLD_CLUSTER_SIZE_BINS, labels=OLD_CLUSTER_SIZE_LABELS)
+    assert bands.astype(str).tolist() == old.astype(str).tolist()
+    assert bands.cat.ordered
+
+
+def test_completion_matches_old_colors_and_keeps_nan_missing():
+    rates = pd.Series([0.0, 89.99, 90.0, 94.99, 95.0, 100.0, np.nan])
+    bands = chart2._band(rates, chart2.BAND_SPECS['completion'])
+    assert bands.iloc[:-1].astype(str).tolist() == rates.iloc[:-1].map(_old_completion_color).tolist()
+    assert pd.isna(bands.iloc[-1])
+
+
+def test_band_counts_of_histogram_equal_banding_the_rows():
+    rng = np.random.default_rng(5)
+    values = pd.Series(rng.integers(0, 80, 2000))
+    spec = chart2.BAND_SPECS['cluster_size']
+    from_hist = chart2._band_counts(values.value_counts(), spec)
+    from_rows = chart2._band(values, spec).value_counts().reindex(from_hist.index)
+    assert from_hist.tolist() == from_rows.tolist()
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('5, 20, 40, 60', [5.0, 20.0, 40.0, 60.0]),
+    ('5، 20، 40، 60', [5.0, 20.0, 40.0, 60.0]),
+    ('5, 20, 40', None),
+    ('5, 20, 20, 60', None),
+    ('a, b, c, d', None),
+])
+def test_parse_thresholds(text, expected):
+    assert chart2._parse_band_thresholds(text, chart2.BAND_SPECS['cluster_size']) == expected
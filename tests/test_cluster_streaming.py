@@ -0,0 +1,107 @@
+"""Streaming (chunked CSV) cluster aggregates must match the single-pass in-memory ones."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+def _clusters_csv(rows=5000, seed=7):
+    rng = np.random.default_rng(seed)
+    degrees = ['کارشناسی', 'کارشناسی ارشد', 'دکتری تخصصی']
+    fields = ['برق', 'عمران', 'روانشناسی', 'زبان انگلیسی']
+    units = ['اراک', 'ساوه', 'خمین', 'نراق', 'محلات']
+    names = [
+        f"{rng.choice(degrees)}_{rng.choice(fields)}_{rng.choice(units)}_{i}"
+        for i in range(rows)
+    ]
+    df = pd.DataFrame({
+        'نام خوشه': names,
+        'تعداد دانشجویان': rng.integers(0, 120, rows),
+        'کل درخواست ها': rng.integers(0, 60, rows),
+    })
+    return df.to_csv(index=False).encode('utf-8')
+
+
+def _aggregates(raw, chunk_rows, monkeypatch):
+    monkeypatch.setattr(chart2, 'CLUSTERS_STREAM_CHUNK_ROWS', chunk_rows)
+    return chart2._cluster_aggregates(chart2._iter_clusters_csv_chunks(raw, 'clusters.csv', {}))
+
+
+def _as_plain(series_or_frame):
+    """Sort and drop categorical/dtype differences between chunked and single-pass indexes."""
+    out = series_or_frame.copy()
+    out.index = pd.MultiIndex.from_frame(out.index.to_frame(index=False).astype(str)) \
+        if isinstance(out.index, pd.MultiIndex) else out.index.astype(str)
+    return out.sort_index()
+
+
+def test_split_keeps_rows_of_non_zero_based_index():
+    names = pd.Series(['کارشناسی_برق_اراک_1', 'دکتری تخصصی_عمران_ساوه_2', None], index=[7000, 7001, 7002])
+    parts = chart2._split_cluster_names(names)
+    assert list(parts.index) == [7000, 7001, 7002]
+    assert parts['واحد'].astype(str).tolist() == ['اراک', 'ساوه', '']
+    assert parts['مقطع'].astype(str).tolist() == ['کارشناسی', 'دکتری تخصصی', '']
+    assert parts['کد_خوشه'].tolist() == ['1', '2', '']
+
+
+@pytest.fixture(scope='module')
+def raw():
+    return _clusters_csv()
+
+
+@pytest.fixture
+def streamed_and_whole(raw, monkeypatch):
+    whole = _aggregates(raw, 10 ** 9, monkeypatch)
+    streamed = _aggregates(raw, 777, monkeypatch)
+    return streamed, whole
+
+
+def test_cube_matches(streamed_and_whole):
+    streamed, whole = streamed_and_whole
+    assert not streamed['cube'].index.to_frame().astype(str).isin(['nan']).any().any()
+    pd.testing.assert_frame_equal(_as_plain(streamed['cube']), _as_plain(whole['cube']), check_dtype=False)
+
+
+def test_totals_match(streamed_and_whole):
+    streamed, whole = streamed_and_whole
+    for key in ('rows', 'active', 'zero_requests', 'students_sum', 'requests_sum', 'requests_max'):
+        assert streamed[key] == whole[key], key
+
+
+
+def test_requests_histogram_matches(streamed_and_whole):
+    streamed, whole = streamed_and_whole
+    np.testing.assert_array_equal(streamed['requests_dist']['counts'], whole['requests_dist']['counts'])
+    assert streamed['requests_dist']['counts'].sum() + streamed['requests_dist']['above'] == streamed['rows']
+
+@pytest.mark.parametrize('key', ['students_sketch', 'requests_sketch', 'names_hll'])
+def test_sketches_match(streamed_and_whole, key):
+    streamed, whole = streamed_and_whole
+    pd.testing.assert_series_equal(_as_plain(streamed[key]), _as_plain(whole[key]), check_dtype=False)
+
+
+def test_quantiles_and_distinct_counts_match(streamed_and_whole):
+    streamed, whole = streamed_and_whole
+    for dims in ([], ['واحد'], ['مقطع', 'رشته']):
+        s = chart2._sketch_quantiles(streamed['students_sketch'], dims)
+        w = chart2._sketch_quantiles(whole['students_sketch'], dims)
+        if dims:
+            pd.testing.assert_frame_equal(_as_plain(s), _as_plain(w), check_dtype=False)
+            pd.testing.assert_series_equal(_as_plain(chart2._hll_estimate(streamed['names_hll'], dims)),
+                                           _as_plain(chart2._hll_estimate(whole['names_hll'], dims)))
+        else:
+            pd.testing.assert_series_equal(s, w)
+
+
+def test_cube_export_covers_all_rows(streamed_and_whole):
+    streamed, whole = streamed_and_whole
+    exported = chart2._cluster_cube_export(streamed)
+    assert exported['تعداد_خوشه'].sum() == whole['rows'] == 5000
+    assert exported['مجموع_درخواست_ها'].sum() == whole['requests_sum']
+    assert (exported['نام_یکتا_تخمینی'] > 0).all()
@@ -0,0 +1,60 @@
+"""The sniffed header row must be the ``skiprows`` that makes ``read_csv`` land on the real header."""
+import codecs
+import os
+import sys
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+def _parse(raw):
+    sniffed = chart2._sniff_csv(BytesIO(raw))
+    df = pd.read_csv(BytesIO(raw), encoding=sniffed['encoding'], sep=sniffed['sep'],
+                     skiprows=sniffed['header_row'])
+    return sniffed, df
+
+
+@pytest.mark.parametrize('raw', [
+    b'a,b,c\n1,2,3\n4,5,6\n',
+    b'Report title\nGenerated 2024\na,b,c\n1,2,3\n4,5,6\n',
+    b'Report title\n\nGenerated 2024\na,b,c\n1,2,3\n4,5,6\n',
+    b'\n\nReport title\n\n\na,b,c\n\n1,2,3\n4,5,6\n',
+    b'Report title\r\n\r\na,b,c\r\n1,2,3\r\n4,5,6\r\n',
+    b'"Report\ntitle",x\n\na,b,c\n1,2,3\n4,5,6\n',
+])
+def test_header_row_skips_titles_and_blank_lines(raw):
+    sniffed, df = _parse(raw)
+    assert sniffed['sep'] == ','
+    assert list(df.columns) == ['a', 'b', 'c']
+    assert df.values.tolist() == [[1, 2, 3], [4, 5, 6]]
+
+
+def test_multiline_quoted_field_is_one_row():
+    sniffed, df = _parse(b'a,b,c\n1,"two\nlines",3\n4,5,6\n7,8,9\n')
+    assert sniffed['header_row'] == 0
+    assert df['b'].tolist() == ['two\nlines', '5', '8']
+
+
+def test_utf8_bom():
+    sniffed, df = _parse(codecs.BOM_UTF8 + 'نام,تعداد\nالف,1\nب,2\n'.encode('utf-8'))
+    assert sniffed['encoding'] == 'utf-8-sig'
+    assert list(df.columns) == ['نام', 'تعداد']
+
+
+def test_cp1256_with_semicolons_and_title():
+    raw = 'گزارش واحدها\n\nنام;تعداد;کد\nاراک;1;10\nساوه;2;20\n'.encode('cp1256')
+    sniffed, df = _parse(raw)
+    assert sniffed['encoding'] == 'cp1256'
+    assert sniffed['sep'] == ';'
+    assert list(df.columns) == ['نام', 'تعداد', 'کد']
+    assert df['نام'].tolist() == ['اراک', 'ساوه']
+
+
+def test_excel_and_empty_prefixes_are_not_sniffed():
+    assert chart2._sniff_csv(BytesIO(b'PK\x03\x04rest')) is None
+    assert chart2._sniff_csv(BytesIO(b'\n \n')) is None
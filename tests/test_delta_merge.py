@@ -0,0 +1,78 @@
+"""A keyed delta merge must produce the same dataset as a full rebuild of the new export."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+def _clusters(rows=3000, seed=3):
+    rng = np.random.default_rng(seed)
+    names = [
+        f"{rng.choice(['کارشناسی', 'دکتری تخصصی'])}_{rng.choice(['برق', 'عمران', 'ادبیات'])}_"
+        f"{rng.choice(['اراک', 'ساوه', 'خمین'])}_{i}"
+        for i in range(rows)
+    ]
+    raw = pd.DataFrame({
+        'نام_خوشه': names,
+        'تعداد_دانشجویان': rng.integers(0, 90, rows),
+        'کل_درخواست_ها': rng.integers(0, 40, rows),
+    })
+    return chart2._prepare_uploaded_table(raw, chart2.EXPECTED_CLUSTERS, chart2.CLUSTERS_NUMERIC, None, {})
+
+
+def _next_export(df, seed):
+    rng = np.random.default_rng(seed)
+    df = df.copy()
+    changed = rng.choice(len(df), 60, replace=False)
+    df.loc[df.index[changed], 'کل_درخواست_ها'] = df['کل_درخواست_ها'].iloc[changed].to_numpy() + 1
+    df = df.drop(index=df.index[changed[:10]])
+    new = df.iloc[:5].copy()
+    new['نام_خوشه'] = new['نام_خوشه'].astype(str) + f'_new{seed}'
+    return pd.concat([df, new], ignore_index=True)
+
+
+def _assert_same(delta, full):
+    assert delta.delta['clusters']['changed'] > 0
+    pd.testing.assert_frame_equal(delta.clusters, full.clusters)
+    pd.testing.assert_frame_equal(delta.clusters_agg['cube'].sort_index(), full.clusters_agg['cube'].sort_index())
+    for key in ('students_sketch', 'requests_sketch', 'names_hll', 'students_hist', 'requests_hist'):
+        pd.testing.assert_series_equal(delta.clusters_agg[key].sort_index(), full.clusters_agg[key].sort_index(),
+                                       check_dtype=False)
+    for key in ('counts', 'below', 'above', 'missing'):
+        np.testing.assert_array_equal(delta.clusters_agg['requests_dist'][key], full.clusters_agg['requests_dist'][key])
+    assert delta.clusters_agg['sample']['نام_خوشه'].tolist() == full.clusters_agg['sample']['نام_خوشه'].tolist()
+    assert delta.clusters_agg['top_active']['کل_درخواست_ها'].tolist() == \
+        full.clusters_agg['top_active']['کل_درخواست_ها'].tolist()
+
+
+def test_delta_matches_full_rebuild_across_a_chain():
+    supporters, units, _ = chart2.load_sample_data()
+    base = chart2._build_dataset(('delta-test', 0), supporters, units, _clusters())
+    for step in (1, 2):
+        export = _next_export(base.clusters[chart2.EXPECTED_CLUSTERS + ['کد_خوشه']], step)
+        delta = chart2._build_dataset(('delta-test', step), supporters, units, export,
+                                      _base=base, base_version=base.version)
+        full = chart2._build_dataset(('full-test', step), supporters, units, export)
+        _assert_same(delta, full)
+        base = delta
+
+
+def test_rerun_with_same_version_reuses_session_dataset():
+    supporters, units, _ = chart2.load_sample_data()
+    clusters = _clusters()
+    state = {}
+    first = chart2._session_dataset(state, ('session-test', 0), supporters, units, clusters, delta_merge=True)
+    export = _next_export(first.clusters[chart2.EXPECTED_CLUSTERS + ['کد_خوشه']], 1)
+    merged = chart2._session_dataset(state, ('session-test', 1), supporters, units, export, delta_merge=True)
+    summary = dict(merged.delta['clusters'])
+    assert summary['changed'] > 0
+
+    rerun = chart2._session_dataset(state, ('session-test', 1), supporters, units, export, delta_merge=True)
+    assert rerun is merged
+    assert rerun.delta['clusters'] == summary
+    assert state['delta_base'] is merged
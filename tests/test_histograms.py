@@ -0,0 +1,71 @@
+"""Fixed-edge histograms: chunked and merged results must equal a single pass over all values."""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def values():
+    rng = np.random.default_rng(17)
+    v = rng.lognormal(3, 1.5, 10_000)
+    v[rng.choice(len(v), 50, replace=False)] = np.nan
+    return v
+
+
+@pytest.mark.parametrize('scale', ['linear', 'log'])
+def test_seven_chunks_equal_one_pass(values, scale):
+    edges = chart2._hist_edges(0, 500, scale=scale)
+    whole = chart2._histogram([values], edges, scale)
+    chunked = chart2._histogram(np.array_split(values, 7), edges, scale)
+    merged = chart2._hist_new(edges, scale)
+    for part in np.array_split(values, 7):
+        merged = chart2._hist_merge(merged, chart2._hist_update(chart2._hist_new(edges, scale), part))
+    for hist in (chunked, merged):
+        np.testing.assert_array_equal(hist['counts'], whole['counts'])
+        assert (hist['below'], hist['above'], hist['missing']) == (whole['below'], whole['above'], whole['missing'])
+
+
+def test_counts_match_numpy_and_account_for_every_value(values):
+    edges = chart2._hist_edges(0, 500)
+    hist = chart2._histogram([values], edges)
+    finite = values[np.isfinite(values)]
+    np.testing.assert_array_equal(hist['counts'], np.histogram(finite, bins=edges)[0])
+    assert hist['missing'] == 50
+    assert hist['above'] == int((finite > 500).sum())
+    assert hist['counts'].sum() + hist['below'] + hist['above'] + hist['missing'] == len(values)
+
+
+def test_negative_merge_takes_values_back_out(values):
+    edges = chart2._hist_edges(0, 500, scale='log')
+    whole = chart2._histogram([values], edges, 'log')
+    removed = chart2._histogram([values[:1234]], edges, 'log')
+    rest = chart2._histogram([values[1234:]], edges, 'log')
+    back = chart2._hist_merge(whole, removed, sign=-1)
+    np.testing.assert_array_equal(back['counts'], rest['counts'])
+    assert (back['above'], back['missing']) == (rest['above'], rest['missing'])
+
+
+def test_merge_rejects_different_edges():
+    with pytest.raises(ValueError):
+        chart2._hist_merge(chart2._hist_new(chart2._hist_edges(0, 10)), chart2._hist_new(chart2._hist_edges(0, 20)))
+
+
+def test_edges():
+    np.testing.assert_allclose(chart2._hist_edges(0, 10, bins=5), [0, 2, 4, 6, 8, 10])
+    log = chart2._hist_edges(0, 999, bins=3, scale='log')
+    np.testing.assert_allclose(log, [0, 9, 99, 999])
+    assert chart2._hist_edges(5, 5, bins=2).tolist() == [5.0, 5.5, 6.0]
+
+
+def test_values_histogram_spans_the_data_and_ignores_nan(values):
+    hist = chart2._values_histogram(values)
+    finite = values[np.isfinite(values)]
+    assert hist['edges'][0] == finite.min() and hist['edges'][-1] == finite.max()
+    assert hist['counts'].sum() == len(finite) and hist['missing'] == 50
+    assert chart2._values_histogram([np.nan, np.nan]) is None
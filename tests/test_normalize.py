@@ -0,0 +1,53 @@
+"""Persian text normalization: letter folding, invisible characters, spaces, dashes and digits."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('علي', 'علی'),                                    # ي عربی
+    ('موسى', 'موسی'),                                  # ى عربی
+    ('كرج', 'کرج'),                                    # ك عربی
+    ('می‌شود', 'میشود'),                           # نیم‌فاصله
+    ('‏اراک‎', 'اراک'),                       # جهت‌نما
+    ('﻿نام', 'نام'),                               # BOM
+    ('تهــــران', 'تهران'),                              # کشیده
+    ('واحد   اراک\t', 'واحد اراک'),           # فاصله نشکن، باریک و تب
+    ('۱۴۰۲', '1402'),
+    ('٠١٢٣٤٥٦٧٨٩', '0123456789'),
+    ('کارشناسی–ارشد', 'کارشناسی-ارشد'),
+])
+def test_normalize_text(raw, expected):
+    assert chart2._normalize_text(raw) == expected
+
+
+def test_key_form_lower_cases():
+    assert chart2._normalize_text('Unit ۱ ي', key=True) == 'unit 1 ی'
+
+
+@pytest.mark.parametrize('header', ['كل درخواست ها', ' کل - درخواست_ها ', 'کل درخواست–ها', 'كل درخواست‏ ها'])
+def test_header_variants_fold_to_one_canonical_name(header):
+    assert chart2._normalize_header(header) == 'کل_درخواست_ها'
+    assert chart2._squash_header(header) == chart2._squash_header('کل_درخواست_ها')
+
+
+def test_series_keeps_missing_values():
+    out = chart2._normalize_text_series(pd.Series(['علي', None, 'علی', np.nan]))
+    assert out.iloc[0] == out.iloc[2] == 'علی'
+    assert out.iloc[[1, 3]].isna().all()
+
+
+def test_categorical_merges_spelling_variants():
+    values = pd.Series(['كرج', 'کرج', None, 'اراك'], dtype='category')
+    out = chart2._normalize_categorical(values)
+    assert out.dtype == 'category'
+    assert sorted(out.cat.categories) == sorted(['کرج', 'اراک'])
+    assert out.iloc[[0, 1, 3]].astype(object).tolist() == ['کرج', 'کرج', 'اراک']
+    assert pd.isna(out.iloc[2])
@@ -0,0 +1,59 @@
+"""Top-K selection must agree with ``nlargest`` (ties keep the earlier row) and sort orders with a stable sort."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+def _expected_top(values, k):
+    """Stable descending order without NaN: what ``nlargest(keep='first')`` gives for k below the row count."""
+    return pd.Series(values).dropna().sort_values(ascending=False, kind='stable').index.to_numpy()[:k]
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('k', [1, 5, 10, 50])
+def test_top_positions_match_nlargest_with_ties_and_nan(seed, k):
+    rng = np.random.default_rng(seed)
+    values = rng.integers(0, 8, 40).astype(float)   # بسیاری تساوی
+    values[rng.choice(40, 5, replace=False)] = np.nan
+    top = chart2._top_positions(values, k)
+    np.testing.assert_array_equal(top, _expected_top(values, k))
+    valid = pd.Series(values).dropna()
+    if k < len(valid):
+        np.testing.assert_array_equal(top, valid.nlargest(k, keep='first').index.to_numpy())
+    assert not np.isnan(values[top]).any()
+
+
+def test_top_positions_edge_cases():
+    assert len(chart2._top_positions([3.0, 1.0], 0)) == 0
+    assert len(chart2._top_positions([np.nan, np.nan], 3)) == 0
+    np.testing.assert_array_equal(chart2._top_positions([1.0, 3.0, 3.0], 10), [1, 2, 0])
+
+
+def test_top_rows_falls_back_to_head_without_the_column():
+    df = pd.DataFrame({'a': [1, 5, 3]})
+    assert chart2._top_rows(df, 'a', 2)['a'].tolist() == [5, 3]
+    assert chart2._top_rows(df, 'missing', 2).equals(df.head(2))
+
+
+@pytest.mark.parametrize('ascending', [False, True])
+def test_dataset_order_is_a_memoized_stable_sort(ascending):
+    values = [3.0, 1.0, np.nan, 3.0, 2.0, 1.0]
+    dataset = chart2.Dataset(version=('rank-test',), supporters=pd.DataFrame({'v': values}),
+                             units=pd.DataFrame(), clusters=pd.DataFrame(), clusters_agg={})
+    ordered = chart2._dataset_order(dataset, 'supporters', 'v', ascending)
+    expected = dataset.supporters.sort_values('v', ascending=ascending, kind='stable')
+    assert ordered.index.tolist() == expected.index.tolist()
+    assert ('order', 'supporters', 'v', ascending) in dataset.rankings
+
+
+def test_dataset_top_positive_only():
+    dataset = chart2.Dataset(version=('rank-test',), supporters=pd.DataFrame({'v': [0, 4, 0, 2]}),
+                             units=pd.DataFrame(), clusters=pd.DataFrame(), clusters_agg={})
+    assert chart2._dataset_top(dataset, 'supporters', 'v', 3, positive=True)['v'].tolist() == [4, 2]
@@ -0,0 +1,24 @@
+"""Scatter payload narrowing must never change the values shown in hover labels."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+def test_only_exact_coordinates_are_narrowed():
+    points = pd.DataFrame({
+        'small': [1.0, 2.0, np.nan],
+        'large': [123456789.0, 16777217.0, 3.0],
+        'size': [1.1, 2.0, 3.0],
+    })
+    trace = chart2._scatter_figure(points, 'small', 'large', size='size', hover_data=['size']).data[0]
+    assert trace.x.dtype == np.float32
+    assert trace.y.dtype == np.float64
+    np.testing.assert_array_equal(trace.y, points['large'])
+    np.testing.assert_array_equal(trace.marker.size, points['size'])
+    np.testing.assert_array_equal(np.asarray(trace.customdata, dtype=float).ravel(), points['size'])
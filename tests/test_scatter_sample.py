@@ -0,0 +1,51 @@
+"""Bounded scatter subsets: deterministic, within budget, extremes kept and every stratum represented."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def points():
+    rng = np.random.default_rng(11)
+    n = 20000
+    df = pd.DataFrame({
+        'x': rng.normal(50, 10, n),
+        'y': rng.normal(20, 5, n),
+        'مقطع': rng.choice(['کارشناسی', 'ارشد', None], n, p=[0.6, 0.3, 0.1]),
+    })
+    df.loc[123, 'x'] = 1e6
+    df.loc[456, 'y'] = -1e6
+    df.loc[789, ['x', 'y']] = np.nan
+    return df
+
+
+def test_deterministic_and_bounded(points):
+    first = chart2._scatter_sample(points, 'x', 'y', max_points=500, stratum='مقطع')
+    second = chart2._scatter_sample(points.copy(), 'x', 'y', max_points=500, stratum='مقطع')
+    assert len(first) <= 500
+    assert first.index.equals(second.index)
+
+
+def test_extremes_are_kept(points):
+    sample = chart2._scatter_sample(points, 'x', 'y', max_points=500, stratum='مقطع')
+    for col in ('x', 'y'):
+        assert points[col].idxmin() in sample.index
+        assert points[col].idxmax() in sample.index
+
+
+def test_missing_stratum_is_sampled_in_proportion(points):
+    sample = chart2._scatter_sample(points, 'x', 'y', max_points=1000, stratum='مقطع')
+    share = sample['مقطع'].isna().mean()
+    assert share == pytest.approx(points['مقطع'].isna().mean(), abs=0.03)
+
+
+def test_small_frames_are_returned_whole(points):
+    head = points.head(100)
+    assert chart2._scatter_sample(head, 'x', 'y', max_points=500) is head
@@ -0,0 +1,58 @@
+"""Header mapping for Arabic-letter exports and a schema registry that survives an unwritable disk."""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+def _arabic(header):
+    """The header as an Arabic-keyboard export writes it: ي/ك letters, spaces instead of underscores."""
+    return header.replace('ی', 'ي').replace('ک', 'ك').replace('_', ' ')
+
+
+@pytest.mark.parametrize('expected', [chart2.EXPECTED_UNITS, chart2.EXPECTED_CLUSTERS, chart2.EXPECTED_SUPPORTERS])
+def test_arabic_letter_headers_map_onto_the_canonical_columns(expected):
+    cols = [_arabic(h) for h in reversed(expected)]
+    mapping = chart2._compute_column_mapping(cols, list(expected))
+    assert mapping['mode'] == 'rename'
+    assert {_arabic(h): h for h in expected} == mapping['rename']
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    monkeypatch.setattr(chart2, 'SCHEMA_REGISTRY_PATH', str(tmp_path / '.schema_registry.json'))
+    chart2._schema_registry.clear()
+    yield tmp_path
+    chart2._schema_registry.clear()
+
+
+def test_mappings_and_profiles_are_persisted(registry):
+    chart2._resolve_column_mapping(['a', 'b'], chart2.EXPECTED_CLUSTERS)
+    chart2._save_schema_profile('export', {'clusters': {'a': 'نام_خوشه'}})
+    with open(chart2.SCHEMA_REGISTRY_PATH, encoding='utf-8') as f:
+        data = json.load(f)
+    assert len(data['signatures']) == 1
+    assert data['profiles'] == {'export': {'clusters': {'a': 'نام_خوشه'}}}
+
+
+def test_unwritable_location_only_skips_persistence(registry, monkeypatch):
+    blocker = registry / 'not-a-directory'
+    blocker.write_text('')
+    monkeypatch.setattr(chart2, 'SCHEMA_REGISTRY_PATH', str(blocker / '.schema_registry.json'))
+    chart2._schema_registry.clear()
+
+    cols = [_arabic(h) for h in chart2.EXPECTED_UNITS]
+    mapping = chart2._resolve_column_mapping(cols, chart2.EXPECTED_UNITS)
+    chart2._save_schema_profile('export', {'units': {}})
+
+    assert mapping['mode'] == 'rename'
+    state = chart2._schema_registry()
+    assert state['persist'] is False
+    assert chart2._header_signature(cols, chart2.EXPECTED_UNITS) in state['signatures']
+    assert chart2._schema_profiles() == {'export': {'units': {}}}
+    assert sorted(os.listdir(registry)) == ['not-a-directory']
@@ -0,0 +1,81 @@
+"""Cluster sketches: exact inverted-CDF quantiles and HyperLogLog distinct counts within tolerance."""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+# خطای نسبی استاندارد HLL با ۲۵۶ ثبات حدود ۶.۵٪ است؛ سه انحراف معیار
+HLL_TOLERANCE = 0.2
+
+
+def _clusters(rows, distinct, seed=23):
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, distinct, rows)
+    degrees = np.array(['کارشناسی', 'کارشناسی ارشد', 'دکتری تخصصی'])[ids % 3]
+    fields = np.array(['برق', 'عمران', 'ادبیات', 'حقوق'])[(ids // 3) % 4]
+    raw = pd.DataFrame({
+        'نام_خوشه': [f'{d}_{f}_اراک_{i}' for d, f, i in zip(degrees, fields, ids)],
+        'تعداد_دانشجویان': rng.integers(0, 120, rows),
+        'کل_درخواست_ها': rng.poisson(6, rows),
+    })
+    return chart2._prepare_uploaded_table(raw, chart2.EXPECTED_CLUSTERS, chart2.CLUSTERS_NUMERIC, None, {})
+
+
+@pytest.fixture(scope='module')
+def table():
+    return _clusters(30_000, 12_000)
+
+
+@pytest.fixture(scope='module')
+def agg(table):
+    return chart2._cluster_aggregates([table])
+
+
+@pytest.mark.parametrize('key, col', list(chart2.CLUSTER_SKETCH_COLUMNS.items()))
+def test_quantiles_equal_inverted_cdf(agg, table, key, col):
+    overall = chart2._sketch_quantiles(agg[key])
+    for q in chart2.SKETCH_QUANTILES:
+        assert overall[q] == np.quantile(table[col], q, method='inverted_cdf')
+
+    by_degree = chart2._sketch_quantiles(agg[key], ['مقطع'])
+    for degree, group in table.groupby('مقطع', observed=True)[col]:
+        for q in chart2.SKETCH_QUANTILES:
+            assert by_degree.loc[degree, q] == np.quantile(group, q, method='inverted_cdf'), (degree, q)
+
+
+def test_distinct_names_within_tolerance(agg, table):
+    exact = table['نام_خوشه'].nunique()
+    assert abs(chart2._hll_estimate(agg['names_hll']) - exact) <= HLL_TOLERANCE * exact
+
+    estimates = chart2._hll_estimate(agg['names_hll'], ['مقطع'])
+    for degree, exact in table.groupby('مقطع', observed=True)['نام_خوشه'].nunique().items():
+        assert abs(estimates[degree] - exact) <= HLL_TOLERANCE * exact, degree
+
+
+def test_small_cardinalities_are_near_exact():
+    small = _clusters(400, 60)
+    estimate = chart2._hll_estimate(chart2._cluster_aggregates([small])['names_hll'])
+    exact = small['نام_خوشه'].nunique()
+    assert abs(estimate - exact) <= 0.1 * exact
+
+
+def test_delta_update_of_registers_matches_full_build(table):
+    supporters, units, _ = chart2.load_sample_data()
+    # کلید ادغام افزایشی نام خوشه است و باید یکتا باشد
+    unique = table.drop_duplicates('نام_خوشه').reset_index(drop=True)
+    base = chart2._build_dataset(('sketch-test', 0), supporters, units, unique)
+    # حذف سطرها: ثبات‌ها کم‌شدنی نیستند و مسیر افزایشی باید آن‌ها را از سطرهای فعلی بازسازی کند
+    export = unique[chart2.EXPECTED_CLUSTERS + ['کد_خوشه']].drop(index=unique.index[::10]).reset_index(drop=True)
+    delta = chart2._build_dataset(('sketch-test', 1), supporters, units, export, _base=base, base_version=base.version)
+    full = chart2._build_dataset(('sketch-full', 1), supporters, units, export)
+    assert delta.delta['clusters']['removed'] > 0
+    pd.testing.assert_series_equal(delta.clusters_agg['names_hll'].sort_index(),
+                                   full.clusters_agg['names_hll'].sort_index(), check_dtype=False)
+    assert chart2._hll_estimate(delta.clusters_agg['names_hll'], ['مقطع']).equals(
+        chart2._hll_estimate(full.clusters_agg['names_hll'], ['مقطع']))
@@ -0,0 +1,64 @@
+"""The parsed-upload cache must stay within its byte budget for the whole process."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chart2  # noqa: E402
+
+
+class _Upload:
+    def __init__(self, name, raw):
+        self.name, self._raw, self.size = name, raw, len(raw)
+
+    def getvalue(self):
+        return self._raw
+
+
+def _units_csv(rows, seed=0):
+    lines = [','.join(chart2.EXPECTED_UNITS)]
+    for i in range(rows):
+        lines.append(','.join([f'واحد {seed}-{i}', str(1000 + i), 'مرکزی'] + [str(i + k) for k in range(6)]))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def _load(upload):
+    return chart2._load_uploaded_table(upload, chart2.EXPECTED_UNITS, chart2.UNITS_NUMERIC)
+
+
+@pytest.fixture
+def cache():
+    chart2._upload_cache.clear()
+    yield chart2._upload_cache()
+    chart2._upload_cache.clear()
+
+
+def test_oversized_upload_bypasses_cache(cache, monkeypatch):
+    monkeypatch.setattr(chart2, 'UPLOAD_CACHE_MAX_BYTES', 1024)
+    df, report = _load(_Upload('big.csv', _units_csv(200)))
+    assert len(df) == 200 and report['digest']
+    assert not cache['entries'] and cache['bytes'] == 0
+
+
+def test_parsed_bytes_stay_within_budget(cache, monkeypatch):
+    size = int(_load(_Upload('probe.csv', _units_csv(300, seed=99)))[0].memory_usage(deep=True).sum())
+    monkeypatch.setattr(chart2, 'UPLOAD_CACHE_MAX_BYTES', int(size * 2.5))
+    cache['entries'].clear()
+    cache['bytes'] = 0
+    for seed in range(5):
+        _load(_Upload(f'u{seed}.csv', _units_csv(300, seed)))
+        assert cache['bytes'] <= chart2.UPLOAD_CACHE_MAX_BYTES
+    assert len(cache['entries']) == 2
+    assert cache['bytes'] == sum(entry[2] for entry in cache['entries'].values())
+
+
+def test_cache_hit_returns_a_copy(cache):
+    upload = _Upload('units.csv', _units_csv(20))
+    first, _ = _load(upload)
+    first.loc[first.index[0], 'تعداد_دانشجویان'] = -1
+    second, report = _load(upload)
+    assert len(cache['entries']) == 1
+    assert second['تعداد_دانشجویان'].iloc[0] == 0
+    assert 'digest' in report